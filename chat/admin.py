@@ -1,5 +1,7 @@
 from django.contrib import admin
-from .models import ChatSession, Message, SystemPolicy, DeletionAudit
+from django.utils import timezone
+from .answer_cache import AnswerCache
+from .models import ChatSession, Message, SystemPolicy, DeletionAudit, AnswerCacheEntry
 
 
 @admin.register(ChatSession)
@@ -28,3 +30,35 @@ class DeletionAuditAdmin(admin.ModelAdmin):
     list_display = ('id', 'user', 'scope', 'session', 'deleted_at', 'note')
     list_filter = ('scope', 'deleted_at')
     search_fields = ('note', 'user__username')
+
+
+@admin.register(AnswerCacheEntry)
+class AnswerCacheEntryAdmin(admin.ModelAdmin):
+    list_display = ('id', 'short_question', 'article_key', 'model', 'policy_version', 'index_version', 'hit_count',
+                    'created_at', 'expires_at')
+    list_filter = ('model', 'policy_version', 'created_at')
+    search_fields = ('question', 'answer')
+    readonly_fields = ('embedding', 'dimensions', 'hit_count', 'created_at', 'last_hit_at')
+    actions = ('expire_selected', 'purge_expired')
+
+    @admin.display(description='Вопрос')
+    def short_question(self, obj):
+        return obj.question[:80]
+
+    @admin.action(description='Снять выбранные ответы с выдачи (истекают сейчас)')
+    def expire_selected(self, request, queryset):
+        updated = queryset.update(expires_at=timezone.now())
+        self.message_user(request, f'Снято с выдачи: {updated}')
+
+    @admin.action(description='Удалить все истекшие записи')
+    def purge_expired(self, request, queryset):
+        self.message_user(request, f'Удалено истекших записей: {AnswerCache.purge_expired()}')
+
+    def changelist_view(self, request, extra_context=None):
+        stats = AnswerCache.storage_stats()
+        extra_context = {
+            **(extra_context or {}),
+            'title': f"Кэш ответов: {stats['entries']} записей, {stats['total_hits']} попаданий "
+                     f"(доля {stats['hit_rate']:.0%})",
+        }
+        return super().changelist_view(request, extra_context=extra_context)
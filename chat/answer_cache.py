@@ -0,0 +1,248 @@
+"""
+Семантический кэш ответов на первые вопросы диалога.
+
+Значительная часть вопросов повторяется почти дословно (увольнение, алименты,
+земельные участки). Если ANSWER_CACHE_ENABLED включен, первый вопрос диалога
+сравнивается по эмбеддингу с уже отвеченными: при сходстве не ниже
+ANSWER_CACHE_SIMILARITY и тех же системной политике, поколении индекса базы
+знаний и модели сохраненный ответ отдается без вызова модели — потоком по
+частям, как обычный ответ. Вопросы о разных статьях («статья 45» и «статья
+46») почти совпадают по эмбеддингу, поэтому названные в вопросе статьи и
+кодексы — часть ключа и должны совпасть точно. Запись живет до expires_at (ANSWER_CACHE_TTL
+при создании); очистка — в админке или командой answer_cache.
+"""
+import hashlib
+import threading
+from dataclasses import dataclass, field
+from datetime import timedelta
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+from django.conf import settings
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from .models import AnswerCacheEntry, SystemPolicy
+
+# Размер части ответа при потоковой отдаче из кэша (по границам слов)
+STREAM_CHUNK_CHARS = 40
+
+
+def policy_version(system_instruction: str) -> str:
+    """Версия активной SystemPolicy и хэш фактической инструкции: правка текста тоже сбрасывает кэш"""
+    digest = hashlib.sha256((system_instruction or '').encode('utf-8')).hexdigest()[:16]
+    policy = SystemPolicy.objects.filter(is_active=True).order_by('-created_at').first()
+    if policy is not None and policy.instruction == system_instruction:
+        return f"{policy.name}:{policy.version}:{digest}"
+    return f"builtin:{digest}"
+
+
+def article_key(question: str) -> str:
+    """Статьи и типы кодексов из вопроса одной строкой ('' — статья не названа)"""
+    from knowledge.article_index import parse_article_reference
+    reference = parse_article_reference(question)
+    if reference is None:
+        return ''
+    return f"{','.join(sorted(reference.articles))}|{','.join(sorted(reference.document_types))}"[:255]
+
+
+def current_index_version() -> int:
+    from knowledge.vector_store import index_version
+    try:
+        return index_version()
+    except Exception:
+        return 0
+
+
+def stream_text(text: str, chunk_chars: int = STREAM_CHUNK_CHARS) -> Iterator[str]:
+    """Сохраненный ответ частями по словам (пробелы и переносы строк сохраняются)"""
+    start = 0
+    while start < len(text):
+        end = min(len(text), start + chunk_chars)
+        if end < len(text):
+            space = text.rfind(' ', start + 1, end)
+            if space > start:
+                end = space + 1
+        yield text[start:end]
+        start = end
+
+
+@dataclass
+class AnswerLookup:
+    """Результат поиска в кэше: entry — найденный ответ; для промаха store() сохраняет новый"""
+    question: str
+    model: str
+    policy_version: str
+    index_version: int
+    article_key: str = ''
+    embedding: Optional[np.ndarray] = None
+    entry: Optional[AnswerCacheEntry] = None
+    similarity: float = 0.0
+
+    @property
+    def hit(self) -> bool:
+        return self.entry is not None
+
+    def store(self, answer: str, sources: List[dict] = None) -> Optional[AnswerCacheEntry]:
+        if self.entry is not None or self.embedding is None or not answer.strip():
+            return None
+        return AnswerCache().store(self, answer, sources or [])
+
+
+@dataclass
+class _Candidates:
+    """Эмбеддинги действующих записей одного ключа, загруженные в процесс"""
+    pks: np.ndarray = field(default_factory=lambda: np.zeros(0, dtype='int64'))
+    matrix: np.ndarray = field(default_factory=lambda: np.zeros((0, 0), dtype='float32'))
+
+
+class AnswerCache:
+    """Кэш ответов в таблице AnswerCacheEntry; счетчики попаданий общие для процесса"""
+
+    _lock = threading.Lock()
+    _hits = 0
+    _misses = 0
+    _candidates: Dict[Tuple[str, int, str, str], _Candidates] = {}
+
+    def __init__(self):
+        self.enabled = getattr(settings, 'ANSWER_CACHE_ENABLED', False)
+        self.threshold = getattr(settings, 'ANSWER_CACHE_SIMILARITY', 0.95)
+        self.ttl = getattr(settings, 'ANSWER_CACHE_TTL', 7 * 24 * 3600)
+        self.max_entries = getattr(settings, 'ANSWER_CACHE_MAX_ENTRIES', 5000)
+
+    def lookup(self, question: str, system_instruction: str, model: str) -> Optional[AnswerLookup]:
+        """Поиск ответа на похожий вопрос; None, если кэш выключен"""
+        if not self.enabled:
+            return None
+        lookup = AnswerLookup(question, model, policy_version(system_instruction), current_index_version(),
+                              article_key(question))
+        try:
+            lookup.embedding = self.embed(question)
+            if lookup.embedding is not None:
+                self._match(lookup)
+        except Exception as e:
+            print(f"Ошибка кэша ответов: {e}")
+
+        with self._lock:
+            if lookup.hit:
+                AnswerCache._hits += 1
+            else:
+                AnswerCache._misses += 1
+        return lookup
+
+    @staticmethod
+    def embed(question: str) -> Optional[np.ndarray]:
+        """Нормированный эмбеддинг вопроса (тот же, что у поиска, — из кэша эмбеддингов)"""
+        from knowledge.retrieval import get_retrieval_service
+        embedding = get_retrieval_service().generate_embeddings([question])[0]
+        if embedding is None:
+            return None
+        vector = np.asarray(embedding, dtype='float32')
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else None
+
+    def _match(self, lookup: AnswerLookup) -> None:
+        key = (lookup.policy_version, lookup.index_version, lookup.model, lookup.article_key)
+        live = AnswerCacheEntry.objects.filter(
+            policy_version=lookup.policy_version, index_version=lookup.index_version,
+            model=lookup.model, article_key=lookup.article_key,
+            expires_at__gt=timezone.now(), dimensions=len(lookup.embedding),
+        )
+        candidates = self._refresh_candidates(key, live)
+        if not len(candidates.pks):
+            return
+
+        similarities = candidates.matrix @ lookup.embedding
+        best = int(np.argmax(similarities))
+        if similarities[best] < self.threshold:
+            return
+        entry = live.filter(pk=int(candidates.pks[best])).first()
+        if entry is None:
+            return
+        AnswerCacheEntry.objects.filter(pk=entry.pk).update(hit_count=F('hit_count') + 1, last_hit_at=timezone.now())
+        lookup.entry = entry
+        lookup.similarity = float(similarities[best])
+
+    def _refresh_candidates(self, key, live) -> _Candidates:
+        """Матрица эмбеддингов ключа: из базы читаются только векторы новых записей"""
+        pks = np.array(sorted(live.values_list('pk', flat=True)), dtype='int64')
+        cached = self._candidates.get(key, _Candidates())
+        if np.array_equal(pks, cached.pks):
+            return cached
+
+        candidates = _Candidates()
+        if len(pks):
+            keep = np.isin(cached.pks, pks)
+            known = cached.pks[keep]
+            missing = pks[~np.isin(pks, known)]
+            rows = dict(AnswerCacheEntry.objects.filter(pk__in=missing.tolist()).values_list('pk', 'embedding'))
+            vectors = [cached.matrix[keep]] if len(known) else []
+            if len(missing):
+                vectors.append(np.stack([np.frombuffer(bytes(rows[pk]), dtype='<f4') for pk in missing.tolist()]))
+            all_pks = np.concatenate([known, missing])
+            order = np.argsort(all_pks)
+            candidates = _Candidates(all_pks[order], np.concatenate(vectors)[order])
+
+        with self._lock:
+            # Ключи прежних поколений индекса больше не понадобятся
+            for stale in [other for other in AnswerCache._candidates if other[1] != key[1]]:
+                del AnswerCache._candidates[stale]
+            AnswerCache._candidates[key] = candidates
+        return candidates
+
+    def store(self, lookup: AnswerLookup, answer: str, sources: List[dict]) -> AnswerCacheEntry:
+        entry = AnswerCacheEntry.objects.create(
+            question=lookup.question,
+            embedding=lookup.embedding.astype('<f4').tobytes(),
+            dimensions=len(lookup.embedding),
+            answer=answer,
+            sources=sources,
+            model=lookup.model,
+            policy_version=lookup.policy_version,
+            index_version=lookup.index_version,
+            article_key=lookup.article_key,
+            expires_at=timezone.now() + timedelta(seconds=self.ttl),
+        )
+        self.evict()
+        return entry
+
+    def evict(self) -> int:
+        """Удаление истекших записей и самых старых сверх ANSWER_CACHE_MAX_ENTRIES"""
+        deleted = self.purge_expired()
+        excess = AnswerCacheEntry.objects.count() - self.max_entries
+        if excess > 0:
+            pks = list(AnswerCacheEntry.objects.order_by('created_at').values_list('pk', flat=True)[:excess])
+            deleted += AnswerCacheEntry.objects.filter(pk__in=pks).delete()[0]
+        return deleted
+
+    @staticmethod
+    def purge_expired() -> int:
+        return AnswerCacheEntry.objects.filter(expires_at__lte=timezone.now()).delete()[0]
+
+    @classmethod
+    def stats(cls) -> Dict[str, float]:
+        """Счетчики процесса: попадания и промахи первых вопросов"""
+        with cls._lock:
+            hits, misses = cls._hits, cls._misses
+        lookups = hits + misses
+        return {'hits': hits, 'misses': misses, 'hit_rate': hits / lookups if lookups else 0.0}
+
+    @staticmethod
+    def storage_stats() -> Dict[str, float]:
+        """
+        По таблице (все процессы): каждая запись — один промах с ответом модели,
+        поэтому доля попаданий по записям — hits / (hits + записей)
+        """
+        entries = AnswerCacheEntry.objects.count()
+        hits = AnswerCacheEntry.objects.aggregate(hits=Sum('hit_count'))['hits'] or 0
+        return {
+            'entries': entries,
+            'expired': AnswerCacheEntry.objects.filter(expires_at__lte=timezone.now()).count(),
+            'total_hits': hits,
+            'hit_rate': hits / (hits + entries) if hits + entries else 0.0,
+        }
+
+
+def is_first_turn(session) -> bool:
+    """Первый вопрос диалога: кроме только что сохраненного, сообщений пользователя нет"""
+    return session.messages.filter(role='user').count() == 1
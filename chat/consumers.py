@@ -1,10 +1,13 @@
+import asyncio
 import json
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
 from .models import ChatSession, Message
 from .utils import generate_chat_title
+from .answer_cache import AnswerCache, is_first_turn, stream_text
 from services.gemini_client import GeminiClient, get_system_instruction
-from knowledge.rag_service import RAGService
+from knowledge.retrieval import get_retrieval_service
+from django.conf import settings
 import os
 
 class ChatConsumer(AsyncWebsocketConsumer):
@@ -49,22 +52,35 @@ class ChatConsumer(AsyncWebsocketConsumer):
         history = await self.get_history()
         system_instruction = await self.get_system_instruction_from_db()
 
+        client = GeminiClient()
+
+        # Первый вопрос диалога, похожий на уже отвеченный: ответ из кэша частями, без модели
+        answer_lookup = await self.lookup_cached_answer(message_text, system_instruction, client.default_model)
+        if answer_lookup is not None and answer_lookup.hit:
+            entry = answer_lookup.entry
+            delay = getattr(settings, 'ANSWER_CACHE_STREAM_DELAY', 0.02)
+            for piece in stream_text(entry.answer):
+                await self.send(text_data=json.dumps({"message": piece, "type": "chunk"}))
+                await asyncio.sleep(delay)
+            await self.save_message(entry.answer, "assistant", model=entry.model)
+            if entry.sources:
+                await self.send(text_data=json.dumps({"sources": entry.sources, "type": "sources"}))
+            return
+
         # RAG: Ищем релевантный контекст в базе знаний
-        rag_service = RAGService()
-        search_results = await database_sync_to_async(rag_service.search)(message_text)
+        search_results = await self.search_knowledge(message_text)
         rag_context = ""
         sources = []
         if search_results:
-            rag_context = "\n\n".join([doc.page_content for doc in search_results])
+            rag_context = "\n\n".join([result['content'] for result in search_results])
             # Собираем уникальные источники
             seen_sources = set()
-            for doc in search_results:
-                source_title = doc.metadata.get('source', 'Неизвестный источник')
+            for result in search_results:
+                source_title = result.get('document_title') or 'Неизвестный источник'
                 if source_title not in seen_sources:
                     sources.append({'title': source_title})
                     seen_sources.add(source_title)
 
-        client = GeminiClient()
         try:
             # Адаптируем вызов для стриминга
             response_stream = await database_sync_to_async(client.generate_stream)(
@@ -81,6 +97,8 @@ class ChatConsumer(AsyncWebsocketConsumer):
             
             # Сохраняем полный ответ ассистента
             await self.save_message(assistant_message, "assistant", model=client.default_model)
+            if answer_lookup is not None:
+                await database_sync_to_async(answer_lookup.store)(assistant_message, sources)
 
             # Отправляем источники после полного ответа
             if sources:
@@ -91,6 +109,17 @@ class ChatConsumer(AsyncWebsocketConsumer):
             await self.send(text_data=json.dumps({"message": error_message, "type": "error"}))
             await self.save_message(error_message, "assistant")
 
+    @database_sync_to_async
+    def search_knowledge(self, message_text, limit=4):
+        return get_retrieval_service().search_context(message_text, limit=limit)
+
+    @database_sync_to_async
+    def lookup_cached_answer(self, message_text, system_instruction, model):
+        """Кэш ответов только для первого вопроса: дальше ответ зависит от истории диалога"""
+        if not is_first_turn(ChatSession.objects.get(pk=self.session_id)):
+            return None
+        return AnswerCache().lookup(message_text, system_instruction, model)
+
     @database_sync_to_async
     def user_can_access_session(self):
         return ChatSession.objects.filter(pk=self.session_id, user=self.user).exists()
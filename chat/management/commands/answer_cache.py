@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from chat.answer_cache import AnswerCache
+from chat.models import AnswerCacheEntry
+
+
+class Command(BaseCommand):
+    help = 'Статистика и очистка семантического кэша ответов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--purge',
+            action='store_true',
+            help='Удалить истекшие записи',
+        )
+        parser.add_argument(
+            '--clear',
+            action='store_true',
+            help='Полностью очистить кэш',
+        )
+
+    def handle(self, *args, **options):
+        if options['clear']:
+            deleted = AnswerCacheEntry.objects.all().delete()[0]
+            self.stdout.write(self.style.SUCCESS(f'Удалено записей: {deleted}'))
+            return
+
+        if options['purge']:
+            deleted = AnswerCache.purge_expired()
+            self.stdout.write(self.style.SUCCESS(f'Удалено истекших записей: {deleted}'))
+
+        cache = AnswerCache()
+        stats = cache.storage_stats()
+        self.stdout.write(f'Кэш {"включен" if cache.enabled else "выключен"} (ANSWER_CACHE_ENABLED), '
+                          f'порог сходства {cache.threshold}')
+        self.stdout.write(f'Записей: {stats["entries"]} (истекших: {stats["expired"]}) из {cache.max_entries}')
+        self.stdout.write(f'Попаданий (всего, по записям): {stats["total_hits"]}')
+        self.stdout.write(f'Доля попаданий: {stats["hit_rate"]:.1%}')
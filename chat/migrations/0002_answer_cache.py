@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnswerCacheEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('question', models.TextField(verbose_name='Вопрос')),
+                ('embedding', models.BinaryField(verbose_name='Эмбеддинг вопроса')),
+                ('dimensions', models.IntegerField(verbose_name='Размерность')),
+                ('answer', models.TextField(verbose_name='Ответ')),
+                ('sources', models.JSONField(blank=True, default=list, verbose_name='Источники')),
+                ('model', models.CharField(max_length=100, verbose_name='Модель')),
+                ('policy_version', models.CharField(max_length=255, verbose_name='Версия политики')),
+                ('index_version', models.BigIntegerField(verbose_name='Поколение индекса')),
+                ('hit_count', models.IntegerField(default=0, verbose_name='Попаданий')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+                ('last_hit_at', models.DateTimeField(blank=True, null=True, verbose_name='Последнее попадание')),
+                ('expires_at', models.DateTimeField(db_index=True, verbose_name='Действует до')),
+            ],
+            options={
+                'verbose_name': 'Кэшированный ответ',
+                'verbose_name_plural': 'Кэш ответов',
+                'indexes': [models.Index(fields=['policy_version', 'index_version', 'model'], name='chat_answer_cache_key_idx')],
+            },
+        ),
+    ]
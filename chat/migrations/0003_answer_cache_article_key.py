@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0002_answer_cache'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='answercacheentry',
+            name='article_key',
+            field=models.CharField(blank=True, default='', max_length=255, verbose_name='Статьи в вопросе'),
+        ),
+    ]
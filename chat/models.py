@@ -75,3 +75,37 @@ class DeletionAudit(models.Model):
 
     def __str__(self) -> str:
         return f"Удаление {self.scope} пользователем {self.user_id} в {self.deleted_at}"
+
+
+class AnswerCacheEntry(models.Model):
+    """
+    Кэш ответов на первые вопросы диалога: похожий по эмбеддингу вопрос при той же
+    системной политике, поколении индекса и модели получает сохраненный ответ
+    """
+    question = models.TextField(verbose_name="Вопрос")
+    # Нормированный эмбеддинг вопроса: float32, little-endian
+    embedding = models.BinaryField(verbose_name="Эмбеддинг вопроса")
+    dimensions = models.IntegerField(verbose_name="Размерность")
+    answer = models.TextField(verbose_name="Ответ")
+    sources = models.JSONField(default=list, blank=True, verbose_name="Источники")
+
+    model = models.CharField(max_length=100, verbose_name="Модель")
+    policy_version = models.CharField(max_length=255, verbose_name="Версия политики")
+    index_version = models.BigIntegerField(verbose_name="Поколение индекса")
+    # Статьи и кодексы, названные в вопросе: ответ отдается только при точном совпадении
+    article_key = models.CharField(max_length=255, blank=True, default='', verbose_name="Статьи в вопросе")
+
+    hit_count = models.IntegerField(default=0, verbose_name="Попаданий")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
+    last_hit_at = models.DateTimeField(null=True, blank=True, verbose_name="Последнее попадание")
+    expires_at = models.DateTimeField(db_index=True, verbose_name="Действует до")
+
+    class Meta:
+        verbose_name = "Кэшированный ответ"
+        verbose_name_plural = "Кэш ответов"
+        indexes = [
+            models.Index(fields=['policy_version', 'index_version', 'model'], name='chat_answer_cache_key_idx'),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.question[:50]} ({self.hit_count})"
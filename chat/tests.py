@@ -1,3 +1,48 @@
-from django.test import TestCase
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from django.test import TestCase, override_settings
+
+from .answer_cache import AnswerCache
+
+
+@override_settings(ANSWER_CACHE_ENABLED=True, ANSWER_CACHE_SIMILARITY=0.95)
+class AnswerCacheTests(TestCase):
+    QUESTION = 'Что говорит статья 45 Трудового кодекса?'
+
+    def setUp(self):
+        # Вопросы о разных статьях почти совпадают по эмбеддингу — здесь совпадают точно
+        vector = np.ones(8, dtype='float32') / np.sqrt(8)
+        patcher = mock.patch.object(AnswerCache, 'embed', return_value=vector)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def remember(self, question, answer):
+        lookup = AnswerCache().lookup(question, 'инструкция', 'gemini')
+        self.assertFalse(lookup.hit)
+        return lookup.store(answer)
+
+    def test_same_article_hits(self):
+        entry = self.remember(self.QUESTION, 'Ответ о статье 45')
+        self.assertEqual(entry.article_key, '45|labor_code')
+
+        lookup = AnswerCache().lookup('что говорит статья 45 трудового кодекса', 'инструкция', 'gemini')
+        self.assertTrue(lookup.hit)
+        self.assertEqual(lookup.entry.answer, 'Ответ о статье 45')
+
+    def test_other_article_misses(self):
+        self.remember(self.QUESTION, 'Ответ о статье 45')
+
+        lookup = AnswerCache().lookup('Что говорит статья 46 Трудового кодекса?', 'инструкция', 'gemini')
+        self.assertFalse(lookup.hit)
+        self.assertEqual(lookup.article_key, '46|labor_code')
+
+    def test_question_without_article_does_not_get_article_answer(self):
+        self.remember(self.QUESTION, 'Ответ о статье 45')
+
+        self.assertFalse(AnswerCache().lookup('Как уволиться по собственному желанию?', 'инструкция', 'gemini').hit)
+
+    def test_other_policy_misses(self):
+        self.remember(self.QUESTION, 'Ответ о статье 45')
+
+        self.assertFalse(AnswerCache().lookup(self.QUESTION, 'другая инструкция', 'gemini').hit)
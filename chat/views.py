@@ -6,12 +6,14 @@ from django.db import transaction
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth import login as auth_login
 from django.http import JsonResponse, StreamingHttpResponse
+from django.conf import settings
 import json
 import time
 from .models import ChatSession, Message, DeletionAudit, SystemPolicy
 from .utils import generate_chat_title
+from .answer_cache import AnswerCache, is_first_turn, stream_text
 from services.gemini_client import GeminiClient, get_system_instruction
-from knowledge.rag_service import RAGService
+from knowledge.retrieval import get_retrieval_service
 import os
 
 
@@ -54,12 +56,16 @@ def index(request):
                 if not os.getenv('GEMINI_API_KEY'):
                     raise RuntimeError('GEMINI_API_KEY не задан. Добавьте ключ в .env')
                 client = GeminiClient()
+                # Похожий первый вопрос уже отвечен — ответ из кэша, без модели
+                answer_lookup = AnswerCache().lookup(first_prompt, instruction, client.default_model)
+                if answer_lookup is not None and answer_lookup.hit:
+                    Message.objects.create(session=session, role='assistant', content=answer_lookup.entry.answer,
+                                           model=answer_lookup.entry.model)
+                    return redirect('chat:session_detail', pk=session.pk)
                 # RAG context - поиск в базе знаний
                 rag_context = ""
                 try:
-                    from knowledge.chroma_service import ChromaService
-                    chroma_service = ChromaService()
-                    search_results = chroma_service.search_documents(first_prompt, limit=3)
+                    search_results = get_retrieval_service().search_context(first_prompt, limit=3)
                     if search_results:
                         rag_context = "Контекст из правовых документов Таджикистана:\n\n"
                         for i, result in enumerate(search_results, 1):
@@ -77,6 +83,8 @@ def index(request):
                 )
                 assistant_text = (result.get('text') or '').strip() or 'Не удалось получить ответ от модели.'
                 Message.objects.create(session=session, role='assistant', content=assistant_text, model=result.get('model'))
+                if answer_lookup is not None and result.get('text'):
+                    answer_lookup.store(assistant_text)
             except Exception as e:
                 Message.objects.create(session=session, role='assistant', content=f"Ошибка при обращении к модели: {e}")
         return redirect('chat:session_detail', pk=session.pk)
@@ -126,6 +134,7 @@ def post_message(request, pk: int):
         if msg.role == 'system':
             system_instruction = msg.content
             break
+    first_turn = is_first_turn(session)
 
     def generate_stream():
         try:
@@ -134,44 +143,57 @@ def post_message(request, pk: int):
                 return
             
             client = GeminiClient()
+            model_name = client.default_model
             
-            # RAG context - поиск в базе знаний
-            rag_context = ""
-            try:
-                from knowledge.chroma_service import ChromaService
-                chroma_service = ChromaService()
-                search_results = chroma_service.search_documents(user_text, limit=3)
-                if search_results:
-                    rag_context = "Контекст из правовых документов Таджикистана:\n\n"
-                    for i, result in enumerate(search_results, 1):
-                        rag_context += f"{i}. Из документа '{result.get('document_title', 'Неизвестный документ')}':\n"
-                        rag_context += f"{result['content'][:400]}...\n\n"
-                    rag_context += "Используйте этот контекст для более точного и обоснованного ответа на вопрос пользователя.\n"
-            except Exception as e:
-                print(f"Ошибка RAG поиска: {e}")
+            # Первый вопрос диалога: похожий уже отвечен — ответ из кэша частями, как поток модели
+            answer_lookup = None
+            if first_turn:
+                answer_lookup = AnswerCache().lookup(user_text, system_instruction, client.default_model)
+            
+            if answer_lookup is not None and answer_lookup.hit:
+                model_name = answer_lookup.entry.model
+                pieces = stream_text(answer_lookup.entry.answer)
+                delay = getattr(settings, 'ANSWER_CACHE_STREAM_DELAY', 0.02)
+            else:
+                # RAG context - поиск в базе знаний
                 rag_context = ""
+                try:
+                    search_results = get_retrieval_service().search_context(user_text, limit=3)
+                    if search_results:
+                        rag_context = "Контекст из правовых документов Таджикистана:\n\n"
+                        for i, result in enumerate(search_results, 1):
+                            rag_context += f"{i}. Из документа '{result.get('document_title', 'Неизвестный документ')}':\n"
+                            rag_context += f"{result['content'][:400]}...\n\n"
+                        rag_context += "Используйте этот контекст для более точного и обоснованного ответа на вопрос пользователя.\n"
+                except Exception as e:
+                    print(f"Ошибка RAG поиска: {e}")
+                    rag_context = ""
 
-            stream = client.generate_stream(
-                history=history,
-                user_text=user_text,
-                system_instruction=system_instruction,
-                rag_context=rag_context
-            )
+                stream = client.generate_stream(
+                    history=history,
+                    user_text=user_text,
+                    system_instruction=system_instruction,
+                    rag_context=rag_context
+                )
+                pieces = (chunk.text for chunk in stream)
+                delay = 0.01  # Small delay to simulate typing
             
             full_response = ""
-            for chunk in stream:
-                if chunk.text:
-                    full_response += chunk.text
-                    yield f"data: {json.dumps({'chunk': chunk.text})}\n\n"
-                    time.sleep(0.01)  # Small delay to simulate typing
+            for piece in pieces:
+                if piece:
+                    full_response += piece
+                    yield f"data: {json.dumps({'chunk': piece})}\n\n"
+                    time.sleep(delay)
             
             # Сохраняем полный ответ в базу данных
             Message.objects.create(
                 session=session, 
                 role='assistant', 
                 content=full_response,
-                model=client.default_model
+                model=model_name
             )
+            if answer_lookup is not None:
+                answer_lookup.store(full_response)
             
             # Обновим updated_at сессии
             ChatSession.objects.filter(pk=session.pk).update()
@@ -1,21 +1,31 @@
 from django.contrib import admin
-from .models import KnowledgeDocument
+from .models import KnowledgeDocument, IngestionJob
 
 @admin.register(KnowledgeDocument)
 class KnowledgeDocumentAdmin(admin.ModelAdmin):
     list_display = ('title', 'status', 'created_at', 'updated_at')
     list_filter = ('status',)
     search_fields = ('title',)
-    readonly_fields = ('status', 'created_at', 'updated_at', 'error_message')
+    readonly_fields = ('status', 'created_at', 'updated_at', 'error_message',
+                       'pages_total', 'pages_processed', 'chunks_embedded', 'processing_started_at')
 
     fieldsets = (
         (None, {
             'fields': ('title', 'file')
         }),
         ('Статус обработки', {
-            'fields': ('status', 'error_message')
+            'fields': ('status', 'error_message', 'pages_total', 'pages_processed',
+                       'chunks_embedded', 'processing_started_at')
         }),
         ('Даты', {
             'fields': ('created_at', 'updated_at')
         }),
     )
+
+
+@admin.register(IngestionJob)
+class IngestionJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'document', 'status', 'attempts', 'locked_by', 'lease_expires_at', 'created_at')
+    list_filter = ('status',)
+    search_fields = ('document__title', 'locked_by')
+    readonly_fields = ('created_at', 'updated_at', 'finished_at', 'last_error')
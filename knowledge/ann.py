@@ -0,0 +1,158 @@
+"""
+Индексы поиска FAISS над базой векторного индекса: HNSW, IVF и сжатые векторы.
+
+Источником истины остается точная база (см. knowledge.index_files):
+индекс поиска строится по ней при уплотнении и лежит рядом файлом
+<база>.ann, поэтому его можно перестроить с другими параметрами, не трогая
+векторы. Параметры построения (HNSW: M и efConstruction, IVF: nlist, сжатие)
+записываются в манифест вместе с файлом; параметры поиска (efSearch, nprobe)
+задаются при открытии и меняются без перестройки.
+
+Сжатие хранит в индексе векторы в float16, int8 (скалярное квантование по
+диапазону каждого измерения) или после PCA до меньшей размерности. Оценки
+по сжатым векторам приближенные, поэтому лучшие кандидаты пересчитываются
+по полным векторам базы (rescore): они читаются из mmap точечно, а целиком
+по памяти проходит только сжатый индекс.
+
+Подбор параметров под корпус: python manage.py tune_index.
+Модуль не импортирует Django.
+"""
+import math
+import os
+from typing import Any, Dict, Tuple
+
+import faiss
+import numpy as np
+
+INDEX_TYPES = ('flat', 'hnsw', 'ivf')
+COMPRESSIONS = ('none', 'float16', 'int8', 'pca')
+ANN_SUFFIX = '.ann'
+
+# Кодирование векторов в строке фабрики FAISS
+SCALAR_QUANTIZERS = {'float16': 'SQfp16', 'int8': 'SQ8'}
+
+# Точек обучения k-means на кластер IVF (FAISS предупреждает, если их меньше 39)
+TRAIN_POINTS_PER_LIST = 64
+# Точек обучения PCA и диапазонов int8
+TRAIN_POINTS = 65536
+
+
+def default_nlist(count: int) -> int:
+    """Число кластеров IVF для N векторов: 4·√N, но не меньше 39 точек на кластер"""
+    return max(1, min(int(4 * math.sqrt(count)), count // 39))
+
+
+def build_params(index_type: str, hnsw_m: int = 32, ef_construction: int = 200, nlist: int = 0,
+                 compression: str = 'none', pca_dimensions: int = 256) -> Dict[str, Any]:
+    """
+    Параметры построения, которые нужны индексу данного типа (nlist=0 — по размеру базы).
+    Пустой словарь — точный поиск по базе, отдельный индекс не нужен
+    """
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Неизвестный тип индекса: {index_type} (ожидается {', '.join(INDEX_TYPES)})")
+    if compression not in COMPRESSIONS:
+        raise ValueError(f"Неизвестное сжатие векторов: {compression} (ожидается {', '.join(COMPRESSIONS)})")
+    params = {}
+    if index_type == 'hnsw':
+        params = {'M': hnsw_m, 'ef_construction': ef_construction}
+    elif index_type == 'ivf':
+        params = {'nlist': nlist}
+    if compression != 'none':
+        params['compression'] = compression
+    if compression == 'pca':
+        params['dimensions'] = pca_dimensions
+    return params
+
+
+def factory_string(index_type: str, params: Dict[str, Any], count: int) -> str:
+    """Описание индекса для faiss.index_factory, например 'PCA256,HNSW32' или 'IVF400,SQ8'"""
+    compression = params.get('compression', 'none')
+    encoding = SCALAR_QUANTIZERS.get(compression, 'Flat')
+    if index_type == 'hnsw':
+        body = f"HNSW{params['M']}" + (f'_{encoding}' if encoding != 'Flat' else '')
+    elif index_type == 'ivf':
+        body = f"IVF{min(params.get('nlist') or default_nlist(count), count)},{encoding}"
+    else:
+        body = encoding
+    if compression == 'pca':
+        body = f"PCA{params['dimensions']},{body}"
+    return body
+
+
+def build_index(vectors: np.ndarray, ids: np.ndarray, index_type: str, params: Dict[str, Any]):
+    """
+    Индекс по скалярному произведению над нормированными векторами (id — pk фрагментов).
+    vectors может быть отображением файла: строки добавляются блоками
+    """
+    if not params:
+        raise ValueError(f"Тип {index_type} без сжатия ищет по базе точно — индекс не строится")
+    dimensions = vectors.shape[1]
+    if params.get('compression') == 'pca' and params['dimensions'] >= dimensions:
+        raise ValueError(f"PCA до {params['dimensions']} измерений не сжимает векторы размерности {dimensions}")
+
+    index = faiss.index_factory(dimensions, factory_string(index_type, params, len(ids)), faiss.METRIC_INNER_PRODUCT)
+    if index_type == 'hnsw':
+        unwrap(index).hnsw.efConstruction = params['ef_construction']
+    if not index.is_trained:
+        nlist = getattr(unwrap(index), 'nlist', 0)
+        index.train(training_sample(vectors, max(TRAIN_POINTS, nlist * TRAIN_POINTS_PER_LIST)))
+
+    index = faiss.IndexIDMap(index)
+    for start in range(0, len(ids), 65536):
+        index.add_with_ids(
+            np.ascontiguousarray(vectors[start:start + 65536], dtype='float32'),
+            np.ascontiguousarray(ids[start:start + 65536], dtype='int64'),
+        )
+    return index
+
+
+def training_sample(vectors: np.ndarray, size: int, seed: int = 0) -> np.ndarray:
+    if len(vectors) <= size:
+        return np.ascontiguousarray(vectors, dtype='float32')
+    rows = np.sort(np.random.default_rng(seed).choice(len(vectors), size, replace=False))
+    return np.ascontiguousarray(vectors[rows], dtype='float32')
+
+
+def unwrap(index):
+    """Индекс поиска под IndexIDMap и преобразованием (PCA)"""
+    index = faiss.downcast_index(index)
+    while isinstance(index, (faiss.IndexIDMap, faiss.IndexPreTransform)):
+        index = faiss.downcast_index(index.index)
+    return index
+
+
+def set_search_params(index, ef_search: int = None, nprobe: int = None) -> None:
+    """efSearch для HNSW, nprobe для IVF; параметр другого типа игнорируется"""
+    inner = unwrap(index)
+    if isinstance(inner, faiss.IndexHNSW) and ef_search:
+        inner.hnsw.efSearch = ef_search
+    elif isinstance(inner, faiss.IndexIVF) and nprobe:
+        inner.nprobe = min(nprobe, inner.nlist)
+
+
+def rescore(vectors: np.ndarray, rows: np.ndarray, query: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Точные оценки кандидатов по полным векторам (строки rows матрицы, в том числе
+    отображенной в память): k лучших строк и их оценки по убыванию
+    """
+    rows = np.sort(rows)  # чтение отображенной матрицы по возрастанию смещений
+    scores = np.asarray(vectors[rows], dtype='float32') @ query
+    order = np.argsort(-scores, kind='stable')[:k]
+    return rows[order], scores[order]
+
+
+def write_index(directory: str, name: str, index) -> None:
+    path = os.path.join(directory, name)
+    faiss.write_index(index, path + '.tmp')
+    os.replace(path + '.tmp', path)
+
+
+def read_index(directory: str, name: str):
+    """Индекс, отображенный в память: процессы узла делят его страницы, как страницы базы"""
+    return faiss.read_index(os.path.join(directory, name), getattr(faiss, 'IO_FLAG_MMAP_IFC', faiss.IO_FLAG_MMAP))
+
+
+def describe(index_type: str, params: Dict[str, Any]) -> str:
+    if not params:
+        return index_type
+    return index_type + ' ' + ' '.join(f'{key}={value}' for key, value in params.items())
@@ -0,0 +1,105 @@
+"""
+Указатель статей: прямой поиск фрагментов по номеру статьи и кодексу.
+
+Вопросы вида «статья 81 Трудового кодекса» или «моддаи 12 Кодекси меҳнат»
+разрешаются одним запросом по индексу (номер статьи, документ) без эмбеддинга
+и векторного поиска: в ответ идет точный текст статьи. Указатель
+(ArticleIndexEntry) заполняется при записи фрагментов — номера статей
+фрагмента определяет ArticleChunker — и обновляется вместе с их метаданными.
+"""
+import re
+from dataclasses import dataclass
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import ArticleIndexEntry, DocumentChunk
+
+ARTICLE_NUMBER = r'\d+(?:[.\-]\d+)*'
+
+# «статья 12», «ст. 12», «статьи 12 и 13», «моддаи 12», «моддаҳои 12, 13»
+ARTICLE_REFERENCE_RE = re.compile(
+    r'(?:\bстат(?:ья|ьи|ье|ью|ей|ьям|ьях|ьями)|\bст\.|\bмодда(?:и|ҳои|ҳо)?)\s*'
+    rf'(?P<numbers>{ARTICLE_NUMBER}(?:\s*(?:,|\bи\b|\bва\b)\s*{ARTICLE_NUMBER})*)',
+    re.IGNORECASE,
+)
+
+# Упоминания кодексов по-русски и по-таджикски -> тип документа
+DOCUMENT_TYPE_PATTERNS = [
+    ('labor_code', r'трудов\w*\s+кодекс|\bтк\b|кодекси\s+меҳнат'),
+    ('civil_code', r'гражданск\w*\s+кодекс|\bгк\b|кодекси\s+граждан'),
+    ('criminal_code', r'уголовн\w*\s+кодекс|\bук\b|кодекси\s+ҷиноят'),
+    ('family_code', r'семейн\w*\s+кодекс|\bск\b|кодекси\s+оила'),
+    ('administrative_code', r'административн\w*\s+(?:кодекс|правонарушени)|\bкоап\b|кодекси\s+ҳуқуқвайронкунии\s+маъмурӣ'),
+    ('tax_code', r'налогов\w*\s+кодекс|\bнк\b|кодекси\s+андоз'),
+    ('constitution', r'конституци|конститутсия'),
+]
+DOCUMENT_TYPE_RES = [(document_type, re.compile(pattern, re.IGNORECASE)) for document_type, pattern in DOCUMENT_TYPE_PATTERNS]
+
+# Длина поля DocumentChunk.articles: список, обрезанный по ней, может кончаться неполным номером
+ARTICLES_FIELD_LENGTH = DocumentChunk._meta.get_field('articles').max_length
+
+
+@dataclass(frozen=True)
+class ArticleReference:
+    articles: Tuple[str, ...]
+    document_types: Tuple[str, ...] = ()
+
+
+def parse_article_reference(text: str) -> Optional[ArticleReference]:
+    """Номера статей и типы кодексов, названные в вопросе; None, если статья не названа"""
+    articles = []
+    for match in ARTICLE_REFERENCE_RE.finditer(text):
+        for number in re.findall(ARTICLE_NUMBER, match.group('numbers')):
+            if number not in articles:
+                articles.append(number)
+    if not articles:
+        return None
+    document_types = tuple(document_type for document_type, pattern in DOCUMENT_TYPE_RES if pattern.search(text))
+    return ArticleReference(tuple(articles), document_types)
+
+
+def chunk_articles(chunk: DocumentChunk) -> List[str]:
+    articles = chunk.article_list
+    if len(chunk.articles) >= ARTICLES_FIELD_LENGTH:
+        articles = articles[:-1]
+    return articles
+
+
+def index_chunks(chunks: Iterable[DocumentChunk], articles: Sequence[Sequence[str]] = None, replace: bool = False) -> int:
+    """
+    Записи указателя для сохраненных фрагментов (articles — номера статей по фрагментам,
+    по умолчанию из поля articles). replace=True сначала удаляет прежние записи фрагментов
+    """
+    chunks = list(chunks)
+    if articles is None:
+        articles = [chunk_articles(chunk) for chunk in chunks]
+    entries = [
+        ArticleIndexEntry(document_id=chunk.document_id, chunk_id=chunk.pk, article=article[:32])
+        for chunk, chunk_numbers in zip(chunks, articles)
+        for article in dict.fromkeys(chunk_numbers)
+    ]
+    with transaction.atomic():
+        if replace:
+            pks = [chunk.pk for chunk in chunks]
+            for start in range(0, len(pks), 500):
+                ArticleIndexEntry.objects.filter(chunk_id__in=pks[start:start + 500]).delete()
+        ArticleIndexEntry.objects.bulk_create(entries, batch_size=500)
+    return len(entries)
+
+
+def lookup(reference: ArticleReference) -> List[Tuple[int, float]]:
+    """
+    Фрагменты названных статей по порядку в документе, как результаты поиска (pk, 1.0).
+    Пусто, если кодекс не назван, а статья с таким номером есть в нескольких документах:
+    тогда выбор документа остается за обычным поиском
+    """
+    entries = ArticleIndexEntry.objects.filter(article__in=reference.articles)
+    if reference.document_types:
+        entries = entries.filter(document__document_type__in=reference.document_types)
+    if not reference.document_types and entries.values('document_id').distinct().count() > 1:
+        return []
+    limit = getattr(settings, 'ARTICLE_LOOKUP_MAX_CHUNKS', 8)
+    pks = entries.order_by('document_id', 'chunk__chunk_index').values_list('chunk_id', flat=True)
+    return [(pk, 1.0) for pk in dict.fromkeys(pks[:limit * 2])][:limit]
@@ -0,0 +1,86 @@
+import time
+import uuid
+from typing import List, Union
+
+from django.conf import settings
+from django.db import transaction
+
+from . import article_index
+from .models import KnowledgeDocument, DocumentChunk
+from .embedding_cache import text_hash
+from .chunker import Chunk
+
+
+class ChunkWriter:
+    """
+    Пакетная запись фрагментов документа через bulk_create.
+
+    Один экземпляр используется на весь документ: он продолжает нумерацию
+    chunk_index между вызовами write и считает пропускную способность записи.
+    """
+
+    def __init__(self, document: KnowledgeDocument, start_index: int = 0, batch_size: int = None):
+        self.document = document
+        self.next_index = start_index
+        self.batch_size = batch_size or getattr(settings, 'CHUNK_WRITE_BATCH_SIZE', 500)
+        self.rows_written = 0
+        self.write_seconds = 0.0
+
+    def make_chroma_id(self, chunk_index: int) -> str:
+        return f"{self.document.id}_{chunk_index}_{uuid.uuid4().hex[:8]}"
+
+    @staticmethod
+    def apply_structure(row: DocumentChunk, chunk: Chunk) -> None:
+        """Структурные метаданные фрагмента: страницы, статьи, глава"""
+        row.page_number = chunk.page_start
+        row.page_end = chunk.page_end
+        row.articles = ",".join(chunk.articles)[:255]
+        row.chapter = chunk.chapter[:255]
+
+    def write(self, chunks: List[Union[Chunk, str]], indexes: List[int] = None) -> List[DocumentChunk]:
+        """
+        Запись фрагментов одной транзакцией. Возвращает созданные строки (с pk).
+        indexes задает chunk_index явно (при переобработке новые фрагменты
+        перемежаются с сохраненными), иначе нумерация продолжается по порядку.
+        Строки без метаданных (str) сохраняются с пустыми полями структуры
+        """
+        if indexes is None:
+            indexes = range(self.next_index, self.next_index + len(chunks))
+
+        rows = []
+        articles = []
+        for chunk_index, chunk in zip(indexes, chunks):
+            if isinstance(chunk, str):
+                chunk = Chunk(chunk)
+            articles.append(chunk.articles)
+            row = DocumentChunk(
+                document=self.document,
+                content=chunk.text,
+                chunk_index=chunk_index,
+                content_hash=text_hash(chunk.text),
+                chroma_id=self.make_chroma_id(chunk_index),
+            )
+            self.apply_structure(row, chunk)
+            rows.append(row)
+            self.next_index = max(self.next_index, chunk_index + 1)
+
+        start_time = time.perf_counter()
+        with transaction.atomic():
+            created = DocumentChunk.objects.bulk_create(rows, batch_size=self.batch_size)
+            # Указатель статей пишется вместе с фрагментами (номера — полные, не обрезанные полем articles)
+            article_index.index_chunks(created, articles)
+        self.write_seconds += time.perf_counter() - start_time
+        self.rows_written += len(created)
+        return created
+
+    @property
+    def rows_per_second(self) -> float:
+        if not self.write_seconds:
+            return 0.0
+        return self.rows_written / self.write_seconds
+
+    def report(self) -> str:
+        return (
+            f"Документ {self.document.id}: записано {self.rows_written} фрагментов "
+            f"за {self.write_seconds:.2f} сек ({self.rows_per_second:.0f} строк/сек)"
+        )
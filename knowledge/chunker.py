@@ -0,0 +1,181 @@
+"""
+Однопроходное разбиение текста правовых документов на фрагменты.
+
+Текст сканируется один раз общим скомпилированным выражением, которое находит
+маркеры страниц, заголовки глав и статей. Фрагменты собираются по смещениям
+найденных границ (срезы исходной строки, без повторной конкатенации) и несут
+структурные метаданные: номера статей, главу и диапазон страниц.
+
+Модуль не импортирует Django и может использоваться в бенчмарках отдельно.
+"""
+import re
+from bisect import bisect_right
+from typing import List, NamedTuple, Optional, Tuple
+
+# Маркер страницы, который вставляет извлечение текста из PDF
+PAGE_MARKER_RE = re.compile(r'^--- Страница (\d+) ---$', re.MULTILINE)
+
+# Заголовок статьи в начале строки (русский и таджикский варианты)
+ARTICLE_HEADER_RE = re.compile(r'^[ \t]*(?:Статья|Моддаи)\s+\d+', re.MULTILINE | re.IGNORECASE)
+
+_STRUCTURE_RE = re.compile(
+    r'^[ \t]*(?:'
+    r'--- Страница (?P<page>\d+) ---$'
+    r'|(?P<chapter>(?:Глава|Боби)\s+(?:\d+|[IVXLC]+)\b[^\n]*)'
+    r'|(?:Статья|Моддаи)\s+(?P<article>\d+(?:[.\-]\d+)*)'
+    r')',
+    re.MULTILINE | re.IGNORECASE,
+)
+_SPECIAL_CHARS_RE = re.compile(r'[^\w\s.,;:!?\-()\[\]"\'№]+')
+
+
+def clean_text(text: str) -> str:
+    """Удаление спецсимволов (знаки препинания сохраняются) и схлопывание пробелов"""
+    return " ".join(_SPECIAL_CHARS_RE.sub('', text).split())
+
+
+class Chunk(NamedTuple):
+    """Фрагмент документа со структурными метаданными"""
+    text: str
+    articles: Tuple[str, ...] = ()
+    chapter: str = ''
+    page_start: Optional[int] = None
+    page_end: Optional[int] = None
+
+    @property
+    def article_number(self) -> str:
+        return self.articles[0] if self.articles else ''
+
+
+class ArticleChunker:
+    """
+    Разбиение по статьям: соседние короткие статьи объединяются, пока фрагмент
+    не превышает chunk_size; статья длиннее max_chunk_size делится по концам
+    предложений. Заголовок главы всегда начинает новый фрагмент.
+
+    Текущие страница и глава переносятся между вызовами split, поэтому
+    документ можно подавать последовательными окнами (см. chunk_pages).
+    """
+
+    def __init__(self, chunk_size: int = 500, max_chunk_size: int = None, min_length: int = 50):
+        self.chunk_size = chunk_size
+        self.max_chunk_size = max_chunk_size or chunk_size * 4
+        self.min_length = min_length
+        self.page = None
+        self.chapter = ''
+
+    def split(self, text: str) -> List[Chunk]:
+        markers, sections = self._scan(text)
+        marker_starts = [start for start, _, _ in markers]
+
+        chunks = []
+        pending_start = pending_end = None
+        pending_articles = []
+        pending_chapter = ''
+
+        def flush():
+            if pending_start is not None:
+                chunk = self._build(text, pending_start, pending_end, markers, marker_starts,
+                                    pending_articles, pending_chapter)
+                if chunk is not None:
+                    chunks.append(chunk)
+
+        for start, end, article, chapter, opens_chapter in sections:
+            for piece_start, piece_end in self._pieces(text, start, end, article is not None):
+                fits = (
+                    pending_start is not None
+                    and not opens_chapter
+                    and piece_end - pending_start <= self.chunk_size
+                )
+                if fits:
+                    pending_end = piece_end
+                else:
+                    flush()
+                    pending_start, pending_end = piece_start, piece_end
+                    pending_articles = []
+                    pending_chapter = chapter
+                if article is not None and article not in pending_articles:
+                    pending_articles.append(article)
+                opens_chapter = False
+        flush()
+
+        if markers:
+            self.page = markers[-1][2]
+        return chunks
+
+    def _scan(self, text: str):
+        """
+        Один проход по тексту: маркеры страниц (start, end, page) и разделы
+        (start, end, номер статьи, глава, начинает ли раздел главу)
+        """
+        markers = []
+        sections = []
+        section_start, article, opens_chapter = 0, None, False
+        section_chapter = self.chapter
+
+        for match in _STRUCTURE_RE.finditer(text):
+            if match.group('page'):
+                markers.append((match.start(), match.end(), int(match.group('page'))))
+                continue
+            if match.start() > section_start:
+                sections.append((section_start, match.start(), article, section_chapter, opens_chapter))
+            section_start = match.start()
+            if match.group('chapter'):
+                self.chapter = " ".join(match.group('chapter').split())[:255]
+                article, opens_chapter = None, True
+            else:
+                article, opens_chapter = match.group('article'), False
+            section_chapter = self.chapter
+
+        if len(text) > section_start:
+            sections.append((section_start, len(text), article, section_chapter, opens_chapter))
+        return markers, sections
+
+    def _pieces(self, text: str, start: int, end: int, is_article: bool):
+        """Деление слишком длинного раздела по концу предложения (или строки, или слова)"""
+        limit = self.max_chunk_size if is_article else self.chunk_size
+        while end - start > limit:
+            low, high = start + limit // 2, start + limit
+            cut = max(text.rfind('.', low, high), text.rfind('!', low, high), text.rfind('?', low, high))
+            if cut < 0:
+                cut = text.rfind('\n', low, high)
+            if cut < 0:
+                cut = text.rfind(' ', low, high)
+            cut = cut + 1 if cut >= 0 else high
+            yield start, cut
+            start = cut
+        yield start, end
+
+    def _build(self, text: str, start: int, end: int, markers, marker_starts,
+               articles: List[str], chapter: str) -> Optional[Chunk]:
+        """Текст фрагмента из срезов между маркерами страниц и его диапазон страниц"""
+        index = bisect_right(marker_starts, start) - 1
+        if index >= 0 and markers[index][1] > start:
+            # Фрагмент начинается внутри маркера
+            start = markers[index][1]
+        page = markers[index][2] if index >= 0 else self.page
+
+        parts = []
+        page_start = page_end = None
+        position = start
+        index += 1
+        while True:
+            if index < len(markers) and markers[index][0] < end:
+                marker_start, marker_end, next_page = markers[index]
+            else:
+                marker_start, marker_end, next_page = end, end, None
+            part = text[position:marker_start]
+            if part.strip():
+                parts.append(part)
+                if page_start is None:
+                    page_start = page
+                page_end = page
+            if next_page is None:
+                break
+            position, page = marker_end, next_page
+            index += 1
+
+        chunk_text = clean_text(" ".join(parts))
+        if len(chunk_text) <= self.min_length:
+            return None
+        return Chunk(chunk_text, tuple(articles), chapter, page_start, page_end)
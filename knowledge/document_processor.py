@@ -1,37 +1,28 @@
 import os
-import re
 from typing import List, Dict, Any
-from io import BytesIO
-from django.core.files.uploadedfile import InMemoryUploadedFile
+from django.conf import settings
 from django.utils import timezone
-from .models import KnowledgeDocument
+from django.db.models import F
+from .models import KnowledgeDocument, DocumentChunk
+from .chunk_writer import ChunkWriter
+from .progress import IngestionProgress
+from .embedding_cache import text_hash
+from .chunker import ArticleChunker, Chunk, clean_text
+from .index_service import IndexService
 
-# Try to import PyPDF2, fall back to alternative if not available
-try:
-    import PyPDF2
-    PDF_AVAILABLE = True
-    print("PyPDF2 успешно загружен")
-except ImportError:
-    PDF_AVAILABLE = False
-    print("ОШИБКА: PyPDF2 не установлен. Установите: pip install PyPDF2")
-
-# Try to import ChromaService, handle gracefully if dependencies missing
-try:
-    from .chroma_service import ChromaService
-    CHROMA_AVAILABLE = True
-except ImportError:
-    CHROMA_AVAILABLE = False
-    print("Warning: ChromaDB dependencies not available. Vector search will be disabled.")
+from .pdf_extraction import PDF_AVAILABLE, iter_pdf_pages
+from .ingestion_pipeline import clean_pages, chunk_pages, batched, embed_batches
 
+if PDF_AVAILABLE:
+    print("Библиотека PDF успешно загружена")
+else:
+    print("ОШИБКА: библиотека PDF не установлена. Установите: pip install pypdf")
 
 class DocumentProcessor:
     """Обработчик правовых документов для извлечения текста и создания фрагментов"""
     
     def __init__(self):
-        if CHROMA_AVAILABLE:
-            self.chroma_service = ChromaService()
-        else:
-            self.chroma_service = None
+        self.index_service = IndexService()
         self.chunk_size = 500   # Уменьшенный размер фрагмента для быстрой обработки
         self.chunk_overlap = 50  # Уменьшенное перекрытие
 
@@ -67,34 +58,21 @@ class DocumentProcessor:
             """
         
         try:
-            if isinstance(file_path_or_file, (InMemoryUploadedFile, str)):
-                if hasattr(file_path_or_file, 'read'):
-                    # Это загруженный файл
-                    file_content = file_path_or_file.read()
-                    pdf_file = BytesIO(file_content)
-                else:
-                    # Это путь к файлу
-                    pdf_file = open(file_path_or_file, 'rb')
-            else:
-                pdf_file = file_path_or_file
-            
-            pdf_reader = PyPDF2.PdfReader(pdf_file)
-            text = ""
+            pdf_file = file_path_or_file
+            if hasattr(pdf_file, 'seek'):
+                # Загруженный файл читается читателем PDF напрямую, без копии в памяти
+                pdf_file.seek(0)
             
-            for page_num, page in enumerate(pdf_reader.pages):
-                try:
-                    page_text = page.extract_text()
-                    if page_text:
-                        text += f"\n--- Страница {page_num + 1} ---\n"
-                        text += page_text
-                except Exception as e:
-                    print(f"Ошибка при извлечении текста со страницы {page_num + 1}: {e}")
-                    continue
+            parts = []
+            for page_num, page_text in iter_pdf_pages(
+                pdf_file,
+                max_workers=getattr(settings, 'PDF_EXTRACT_WORKERS', 0),
+                pages_per_task=getattr(settings, 'PDF_EXTRACT_PAGES_PER_TASK', 50),
+            ):
+                parts.append(f"\n--- Страница {page_num} ---\n")
+                parts.append(page_text)
             
-            if hasattr(pdf_file, 'close'):
-                pdf_file.close()
-                
-            return text.strip()
+            return "".join(parts).strip()
             
         except Exception as e:
             print(f"Ошибка при извлечении текста из PDF: {e}")
@@ -102,126 +80,102 @@ class DocumentProcessor:
 
     def clean_text(self, text: str) -> str:
         """Очистка и нормализация текста"""
-        # Удаляем лишние пробелы и переносы строк
-        text = re.sub(r'\s+', ' ', text)
-        
-        # Удаляем специальные символы, но оставляем знаки препинания
-        text = re.sub(r'[^\w\s\.\,\;\:\!\?\-\(\)\[\]\"\'№]', '', text, flags=re.UNICODE)
-        
-        # Нормализуем кавычки
-        text = text.replace('"', '"').replace('"', '"')
-        text = text.replace(''', "'").replace(''', "'")
-        
-        return text.strip()
+        return clean_text(text)
 
-    def split_into_chunks(self, text: str) -> List[str]:
-        """Разбивка текста на фрагменты с учетом структуры правовых документов"""
-        chunks = []
-        
-        # Сначала пытаемся разбить по статьям
-        article_pattern = r'(Статья\s+\d+[^\n]*)'
-        articles = re.split(article_pattern, text, flags=re.IGNORECASE)
-        
-        if len(articles) > 1:
-            # Документ содержит статьи
-            current_chunk = ""
-            
-            for i, part in enumerate(articles):
-                if not part.strip():
-                    continue
-                
-                # Если это заголовок статьи
-                if re.match(article_pattern, part, re.IGNORECASE):
-                    if current_chunk and len(current_chunk) > self.chunk_size:
-                        chunks.append(self.clean_text(current_chunk))
-                        current_chunk = part + " "
-                    else:
-                        current_chunk += part + " "
-                else:
-                    # Это содержимое статьи
-                    if len(current_chunk + part) > self.chunk_size:
-                        if current_chunk:
-                            chunks.append(self.clean_text(current_chunk))
-                        current_chunk = part
-                    else:
-                        current_chunk += part
-            
-            if current_chunk:
-                chunks.append(self.clean_text(current_chunk))
+    def make_chunker(self) -> ArticleChunker:
+        return ArticleChunker(chunk_size=self.chunk_size)
+
+    def split_into_chunks(self, text: str) -> List[Chunk]:
+        """Разбивка текста на фрагменты с учетом структуры правовых документов (статьи, главы, страницы)"""
+        return self.make_chunker().split(text)
+
+    def iter_pages(self, document: KnowledgeDocument, on_page_count=None):
+        """Постраничное чтение файла документа без загрузки текста целиком"""
+        if not PDF_AVAILABLE:
+            if on_page_count:
+                on_page_count(1)
+            yield 1, self.extract_text_from_pdf(None)
+            return
         
+        options = {
+            'max_workers': getattr(settings, 'PDF_EXTRACT_WORKERS', 0),
+            'pages_per_task': getattr(settings, 'PDF_EXTRACT_PAGES_PER_TASK', 50),
+            'on_page_count': on_page_count,
+        }
+        try:
+            # Локальный файл: доступен пул процессов
+            file_path = document.file.path
+        except NotImplementedError:
+            # Удаленное хранилище (S3/GCS): читаем как поток
+            with document.file.open('rb') as pdf_file:
+                yield from iter_pdf_pages(pdf_file, **options)
         else:
-            # Обычное разбиение по размеру
-            chunks = self._split_by_size(text)
-        
-        return [chunk for chunk in chunks if len(chunk.strip()) > 50]  # Уменьшенный минимум для быстрой обработки
+            yield from iter_pdf_pages(file_path, **options)
 
-    def _split_by_size(self, text: str) -> List[str]:
-        """Разбивка текста по размеру с учетом предложений"""
-        chunks = []
-        sentences = re.split(r'[.!?]+', text)
-        
-        current_chunk = ""
-        for sentence in sentences:
-            sentence = sentence.strip()
-            if not sentence:
-                continue
-                
-            if len(current_chunk + sentence) > self.chunk_size:
-                if current_chunk:
-                    chunks.append(self.clean_text(current_chunk))
-                current_chunk = sentence + ". "
-            else:
-                current_chunk += sentence + ". "
-        
-        if current_chunk:
-            chunks.append(self.clean_text(current_chunk))
-            
-        return chunks
+    def iter_chunks(self, document: KnowledgeDocument, progress: IngestionProgress = None):
+        """Поток фрагментов документа: страницы → очистка → разбиение по статьям"""
+        if progress:
+            pages = progress.track_pages(self.iter_pages(document, on_page_count=progress.set_total_pages))
+        else:
+            pages = self.iter_pages(document)
+        # Один разбивщик на документ: глава и страница переносятся между окнами
+        chunker = self.make_chunker()
+        return chunk_pages(clean_pages(pages), chunker.split, window_size=self.chunk_size * 20)
+
+    def embed_chunks(self, chunks: List[Chunk]):
+        return self.index_service.generate_embeddings([chunk.text for chunk in chunks])
+
+    def snapshot_periodically(self, batches_written: int) -> None:
+        """
+        Фиксация хранилища каждые INGEST_SNAPSHOT_EVERY партий: первые фрагменты большого
+        документа находятся поиском, пока обрабатываются остальные страницы
+        """
+        every = getattr(settings, 'INGEST_SNAPSHOT_EVERY', 16)
+        if every > 0 and batches_written % every == 0:
+            self.index_service.snapshot()
 
     def process_document(self, document: KnowledgeDocument) -> bool:
-        """Полная обработка документа: извлечение текста, создание фрагментов, добавление в ChromaDB"""
+        """
+        Полная обработка документа: потоковое извлечение текста, разбиение на фрагменты,
+        эмбеддинги и запись в ChromaDB партиями по INGEST_BATCH_SIZE фрагментов
+        """
         try:
             # Обновляем статус
             document.status = 'processing'
             document.save()
+            progress = IngestionProgress(document)
+            progress.start()
+            self.index_service.require_embeddings()
             
-            # Извлекаем текст из PDF
-            text = self.extract_text_from_pdf(document.file.path)
+            # Повторная обработка (например, повтор задания из очереди) начинается с чистого листа
+            if document.chunks.exists():
+                self.index_service.delete_document(document)
             
-            if not text:
-                raise Exception("Не удалось извлечь текст из документа")
+            batches = batched(self.iter_chunks(document, progress), getattr(settings, 'INGEST_BATCH_SIZE', 64))
+            # Без векторного хранилища фрагменты просто сохраняются в базе
+            embed = self.embed_chunks if self.index_service.store is not None else None
             
-            # Разбиваем на фрагменты
-            chunks = self.split_into_chunks(text)
+            writer = ChunkWriter(document)
+            for number, (batch, embeddings) in enumerate(embed_batches(batches, embed), 1):
+                self.index_service.add_chunk_batch(document, batch, embeddings, writer=writer)
+                # Счетчики обновляются без перезаписи остальных полей документа
+                progress.add_chunks(len(batch))
+                self.snapshot_periodically(number)
             
-            if not chunks:
-                raise Exception("Не удалось создать фрагменты документа")
+            total_chunks = writer.rows_written
+            progress.finish()
+            self.index_service.snapshot()
+            print(writer.report())
             
-            # Добавляем в ChromaDB (если доступно)
-            if self.chroma_service:
-                success = self.chroma_service.add_document_chunks(document, chunks)
-                
-                if success:
-                    document.status = 'ready'
-                    document.processed_at = timezone.now()
-                    document.save()
-                    return True
-                else:
-                    raise Exception("Ошибка при добавлении в векторную базу данных")
-            else:
-                # Если ChromaDB недоступно, просто сохраняем фрагменты в базе
-                from .models import DocumentChunk
-                for i, chunk in enumerate(chunks):
-                    DocumentChunk.objects.create(
-                        document=document,
-                        content=chunk,
-                        chunk_index=i,
-                        metadata={'source': 'document_processor'}
-                    )
-                document.status = 'ready'
-                document.processed_at = timezone.now()
-                document.save()
-                return True
+            if not total_chunks:
+                raise Exception("Не удалось извлечь текст и создать фрагменты документа")
+            
+            document.total_chunks = total_chunks
+            document.status = 'ready'
+            document.error_message = ''
+            document.processed_at = timezone.now()
+            document.save()
+            return True
                 
         except Exception as e:
             document.status = 'error'
@@ -231,15 +185,106 @@ class DocumentProcessor:
             return False
 
     def reprocess_document(self, document: KnowledgeDocument) -> bool:
-        """Переобработка документа (удаление старых данных и создание новых)"""
+        """
+        Инкрементальная переобработка: фрагменты, текст которых не изменился, сохраняют
+        свои ID и векторы; удаляются, создаются и эмбеддятся только изменившиеся.
+        Итог сохраняется в self.last_reprocess_stats
+        """
+        self.last_reprocess_stats = {'reused': 0, 'regenerated': 0, 'removed': 0}
+        
+        if not document.chunks.exists():
+            return self.process_document(document)
+        
         try:
-            # Удаляем старые данные из ChromaDB
-            self.chroma_service.delete_document(document)
+            document.status = 'processing'
+            document.save()
+            progress = IngestionProgress(document)
+            progress.start()
+            self.index_service.require_embeddings()
             
-            # Обрабатываем заново
-            return self.process_document(document)
+            # Сохраненные фрагменты по хэшу содержимого (у старых записей хэш вычисляется на лету)
+            stored = []
+            for pk, chroma_id, content_hash, content in document.chunks.values_list(
+                'pk', 'chroma_id', 'content_hash', 'content'
+            ).iterator():
+                row = DocumentChunk(pk=pk, chroma_id=chroma_id, document=document)
+                stored.append((content_hash or text_hash(content), row))
+            
+            # Фрагменты без вектора в хранилище (эмбеддинг не удался) не переиспользуются:
+            # они удаляются вместе с устаревшими, а их текст эмбеддится заново
+            existing = {}
+            unindexed = []
+            for (key, row), indexed in zip(stored, self.index_service.has_vectors([row for _, row in stored])):
+                if indexed:
+                    existing.setdefault(key, []).append(row)
+                else:
+                    unindexed.append(row)
+            
+            # Временно уводим индексы в отрицательную область, чтобы не нарушать unique_together
+            document.chunks.update(chunk_index=-F('chunk_index') - 1)
+            
+            writer = ChunkWriter(document)
+            chunk_index = 0
+            batches = batched(self.iter_chunks(document, progress), getattr(settings, 'INGEST_BATCH_SIZE', 64))
+            for number, batch in enumerate(batches, 1):
+                reused = []
+                new_chunks = []
+                new_indexes = []
+                for chunk in batch:
+                    matches = existing.get(text_hash(chunk.text))
+                    if matches:
+                        row = matches.pop()
+                        row.chunk_index = chunk_index
+                        ChunkWriter.apply_structure(row, chunk)
+                        reused.append(row)
+                    else:
+                        new_chunks.append(chunk)
+                        new_indexes.append(chunk_index)
+                    chunk_index += 1
+                
+                if reused:
+                    DocumentChunk.objects.bulk_update(
+                        reused, ['chunk_index', 'page_number', 'page_end', 'articles', 'chapter']
+                    )
+                    self.index_service.update_chunk_metadata(document, reused)
+                
+                if new_chunks:
+                    self.index_service.add_chunk_batch(document, new_chunks, writer=writer, indexes=new_indexes)
+                
+                self.last_reprocess_stats['reused'] += len(reused)
+                self.last_reprocess_stats['regenerated'] += len(new_chunks)
+                progress.add_chunks(len(batch))
+                self.snapshot_periodically(number)
+            
+            progress.finish()
+            
+            # Фрагменты, которых больше нет в документе
+            stale = [row for rows in existing.values() for row in rows] + unindexed
+            if stale:
+                self.index_service.delete_chunks(stale)
+            self.index_service.snapshot()
+            self.last_reprocess_stats['removed'] = len(stale)
+            
+            if not chunk_index:
+                raise Exception("Не удалось извлечь текст и создать фрагменты документа")
+            
+            document.total_chunks = chunk_index
+            document.status = 'ready'
+            document.error_message = ''
+            document.processed_at = timezone.now()
+            document.save()
+            
+            stats = self.last_reprocess_stats
+            print(
+                f"Документ {document.id} переобработан: сохранено {stats['reused']}, "
+                f"создано заново {stats['regenerated']}, удалено {stats['removed']}"
+            )
+            return True
             
         except Exception as e:
+            document.status = 'error'
+            document.error_message = str(e)
+            document.save()
             print(f"Ошибка при переобработке документа {document.id}: {e}")
             return False
 
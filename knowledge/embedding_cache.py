@@ -0,0 +1,175 @@
+"""
+Персистентный кэш эмбеддингов.
+
+Ключ — (модель, тип задачи, SHA-256 нормализованного текста), значение —
+вектор float32 в бинарном поле. Кэш проверяется перед каждым обращением к API
+эмбеддингов: при переобработке документа, повторной загрузке того же PDF и
+повторе одинакового запроса вектор берется из базы.
+"""
+import hashlib
+import threading
+import time
+import unicodedata
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+from django.conf import settings
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from .models import EmbeddingCacheEntry
+
+
+def normalize_text(text: str) -> str:
+    """Нормализация перед хэшированием: Unicode NFC и схлопнутые пробелы"""
+    return " ".join(unicodedata.normalize('NFC', text).split())
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(normalize_text(text).encode('utf-8')).hexdigest()
+
+
+class EmbeddingCache:
+    """Кэш эмбеддингов в таблице EmbeddingCacheEntry с вытеснением по размеру"""
+
+    # Счетчики общие для процесса
+    _lock = threading.Lock()
+    _hits = 0
+    _misses = 0
+    _embed_seconds = 0.0
+    _inserts_since_evict = 0
+
+    def __init__(self):
+        self.enabled = getattr(settings, 'EMBEDDING_CACHE_ENABLED', True)
+        self.max_bytes = getattr(settings, 'EMBEDDING_CACHE_MAX_BYTES', 512 * 1024 * 1024)
+        self.evict_every = getattr(settings, 'EMBEDDING_CACHE_EVICT_EVERY', 1000)
+
+    def get_many(self, model: str, task_type: str, hashes: List[str]) -> Dict[str, List[float]]:
+        """Векторы для известных хэшей; отмечает использование найденных записей"""
+        if not self.enabled or not hashes:
+            return {}
+
+        found = {}
+        rows = EmbeddingCacheEntry.objects.filter(
+            model=model, task_type=task_type, text_hash__in=set(hashes)
+        ).values_list('pk', 'text_hash', 'vector')
+        pks = []
+        for pk, key, vector in rows:
+            found[key] = np.frombuffer(bytes(vector), dtype='<f4').tolist()
+            pks.append(pk)
+
+        if pks:
+            EmbeddingCacheEntry.objects.filter(pk__in=pks).update(
+                last_used_at=timezone.now(),
+                hit_count=F('hit_count') + 1,
+            )
+        return found
+
+    def set_many(self, model: str, task_type: str, vectors: Dict[str, List[float]]) -> None:
+        if not self.enabled or not vectors:
+            return
+
+        entries = []
+        for key, vector in vectors.items():
+            data = np.asarray(vector, dtype='<f4').tobytes()
+            entries.append(EmbeddingCacheEntry(
+                model=model,
+                task_type=task_type,
+                text_hash=key,
+                dimensions=len(vector),
+                vector=data,
+                size_bytes=len(data),
+            ))
+        # Параллельный воркер мог успеть записать тот же ключ
+        EmbeddingCacheEntry.objects.bulk_create(entries, ignore_conflicts=True)
+
+        with self._lock:
+            EmbeddingCache._inserts_since_evict += len(entries)
+            should_evict = EmbeddingCache._inserts_since_evict >= self.evict_every
+            if should_evict:
+                EmbeddingCache._inserts_since_evict = 0
+        if should_evict:
+            self.evict()
+
+    def evict(self) -> int:
+        """Удаление давно не использованных записей, пока кэш больше max_bytes"""
+        total = EmbeddingCacheEntry.objects.aggregate(total=Sum('size_bytes'))['total'] or 0
+        excess = total - self.max_bytes
+        if excess <= 0:
+            return 0
+
+        to_delete = []
+        freed = 0
+        for pk, size in EmbeddingCacheEntry.objects.order_by('last_used_at').values_list('pk', 'size_bytes').iterator():
+            to_delete.append(pk)
+            freed += size
+            if freed >= excess:
+                break
+
+        deleted = 0
+        for start in range(0, len(to_delete), 500):
+            deleted += EmbeddingCacheEntry.objects.filter(pk__in=to_delete[start:start + 500]).delete()[0]
+        print(f"Кэш эмбеддингов: вытеснено {deleted} записей ({freed / 1024 / 1024:.1f} МБ)")
+        return deleted
+
+    def embed(self, texts: List[str], model: str, task_type: str,
+              embed_fn: Callable[[List[str]], List[List[float]]]) -> List[Optional[List[float]]]:
+        """
+        Эмбеддинги с кэшем: в embed_fn уходят только отсутствующие в кэше тексты,
+        одинаковые тексты внутри партии эмбеддятся один раз
+        """
+        hashes = [text_hash(text) for text in texts]
+        cached = self.get_many(model, task_type, hashes)
+
+        missing = {}
+        for key, text in zip(hashes, texts):
+            if key not in cached and key not in missing:
+                missing[key] = text
+
+        if missing:
+            start_time = time.perf_counter()
+            vectors = embed_fn(list(missing.values()))
+            elapsed = time.perf_counter() - start_time
+            fresh = dict(zip(missing.keys(), vectors))
+            # Неудавшиеся тексты (None) не кэшируются
+            self.set_many(model, task_type, {key: vector for key, vector in fresh.items() if vector is not None})
+            cached.update(fresh)
+        else:
+            elapsed = 0.0
+
+        with self._lock:
+            EmbeddingCache._hits += len(texts) - len(missing)
+            EmbeddingCache._misses += len(missing)
+            EmbeddingCache._embed_seconds += elapsed
+
+        return [cached[key] for key in hashes]
+
+    @classmethod
+    def stats(cls) -> Dict[str, float]:
+        """Счетчики процесса и оценка сэкономленных вызовов и времени"""
+        with cls._lock:
+            hits, misses, seconds = cls._hits, cls._misses, cls._embed_seconds
+        lookups = hits + misses
+        avg_latency = seconds / misses if misses else 0.0
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': hits / lookups if lookups else 0.0,
+            'saved_embed_calls': hits,
+            'saved_seconds': hits * avg_latency,
+        }
+
+    @staticmethod
+    def storage_stats() -> Dict[str, int]:
+        totals = EmbeddingCacheEntry.objects.aggregate(size=Sum('size_bytes'), hits=Sum('hit_count'))
+        return {
+            'entries': EmbeddingCacheEntry.objects.count(),
+            'size_bytes': totals['size'] or 0,
+            'total_hits': totals['hits'] or 0,
+        }
+
+
+def cached_embed(texts: List[str], model: str, task_type: str,
+                 embed_fn: Callable[[List[str]], List[List[float]]]) -> List[List[float]]:
+    return EmbeddingCache().embed(texts, model, task_type, embed_fn)
+
@@ -0,0 +1,155 @@
+"""
+Пакетная генерация эмбеддингов.
+
+Тексты отправляются партиями (один запрос — до batch_size текстов), несколько
+партий выполняются параллельно, частота запросов ограничивается token bucket
+под квоту провайдера. Ошибки 429/5xx повторяются с экспоненциальной задержкой
+для конкретной партии; неустранимая ошибка делит партию пополам, пока не будет
+найден проблемный текст, — остальные тексты документа получают векторы.
+"""
+import random
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+from django.conf import settings
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# Код статуса в тексте ошибки без атрибута code: в начале сообщения («503 Service Unavailable»)
+# или после слова status/code/HTTP («HTTP 429», «status code: 503»); прочие цифры в тексте не считаются
+STATUS_IN_MESSAGE_RE = re.compile(r'^\s*(\d{3})\b|\b(?:status|code|http)(?:\s*code)?\s*[:=]?\s*(\d{3})\b', re.IGNORECASE)
+
+
+class TokenBucket:
+    """Ограничитель частоты: rate токенов в секунду, запас не больше capacity"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1.0) -> None:
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                wait = (tokens - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+_buckets: Dict[str, TokenBucket] = {}
+_buckets_lock = threading.Lock()
+
+
+def get_rate_limiter(name: str, requests_per_minute: int) -> TokenBucket:
+    """Общий для процесса ограничитель: квота провайдера одна на все потоки"""
+    with _buckets_lock:
+        bucket = _buckets.get(name)
+        if bucket is None:
+            rate = requests_per_minute / 60.0
+            bucket = _buckets[name] = TokenBucket(rate=rate, capacity=max(1.0, rate))
+        return bucket
+
+
+def is_retryable(error: Exception) -> bool:
+    """429 и 5xx — временные ошибки провайдера"""
+    code = getattr(error, 'code', None)
+    if callable(code):
+        code = code()
+    code = getattr(code, 'value', code)
+    if isinstance(code, int):
+        return code in RETRYABLE_STATUS_CODES
+    status = getattr(error, 'status_code', None)
+    if isinstance(status, int):
+        return status in RETRYABLE_STATUS_CODES
+    message = str(error)
+    for match in STATUS_IN_MESSAGE_RE.finditer(message):
+        if int(match.group(1) or match.group(2)) in RETRYABLE_STATUS_CODES:
+            return True
+    return 'quota' in message.lower()
+
+
+class BatchEmbeddingEngine:
+    """Движок пакетных эмбеддингов поверх функции embed_batch(texts) -> vectors"""
+
+    # Счетчики общие для процесса
+    _stats_lock = threading.Lock()
+    _stats = {'requests': 0, 'retries': 0, 'failed_texts': 0}
+
+    def __init__(self, embed_batch: Callable[[List[str]], List[List[float]]], name: str = 'default',
+                 batch_size: int = None, max_in_flight: int = None,
+                 requests_per_minute: int = None, max_retries: int = None):
+        self.embed_batch = embed_batch
+        self.batch_size = batch_size or getattr(settings, 'EMBEDDING_BATCH_SIZE', 100)
+        self.max_in_flight = max_in_flight or getattr(settings, 'EMBEDDING_MAX_IN_FLIGHT', 4)
+        self.max_retries = max_retries if max_retries is not None else getattr(settings, 'EMBEDDING_MAX_RETRIES', 5)
+        self.base_delay = getattr(settings, 'EMBEDDING_RETRY_BASE_DELAY', 1.0)
+        self.rate_limiter = get_rate_limiter(
+            name, requests_per_minute or getattr(settings, 'EMBEDDING_REQUESTS_PER_MINUTE', 1500)
+        )
+
+    def embed(self, texts: List[str]) -> List[Optional[List[float]]]:
+        """Векторы в порядке texts; None — для текстов, которые не удалось обработать"""
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        if len(batches) <= 1 or self.max_in_flight <= 1:
+            results = [self._run_batch(batch) for batch in batches]
+        else:
+            with ThreadPoolExecutor(max_workers=min(self.max_in_flight, len(batches))) as executor:
+                results = list(executor.map(self._run_batch, batches))
+
+        embeddings = []
+        for batch_result in results:
+            embeddings.extend(batch_result)
+        return embeddings
+
+    def _call(self, texts: List[str]) -> List[List[float]]:
+        """Один запрос с повторами при 429/5xx"""
+        attempt = 0
+        while True:
+            self.rate_limiter.acquire()
+            self._count('requests')
+            try:
+                vectors = self.embed_batch(texts)
+                if len(vectors) != len(texts):
+                    raise ValueError(f"Ожидалось {len(texts)} векторов, получено {len(vectors)}")
+                return vectors
+            except Exception as e:
+                if not is_retryable(e) or attempt >= self.max_retries:
+                    raise
+                delay = self.base_delay * (2 ** attempt) * (1 + random.random())
+                attempt += 1
+                self._count('retries')
+                print(f"Эмбеддинги: временная ошибка ({e}), повтор {attempt} через {delay:.1f} сек")
+                time.sleep(delay)
+
+    def _run_batch(self, texts: List[str]) -> List[Optional[List[float]]]:
+        try:
+            return self._call(texts)
+        except Exception as e:
+            if len(texts) == 1 or is_retryable(e):
+                # Исчерпанная квота не лечится делением партии
+                self._count('failed_texts', len(texts))
+                print(f"Эмбеддинги: пропущено текстов: {len(texts)} ({e})")
+                return [None] * len(texts)
+            # Изолируем проблемный текст, не теряя остальную партию
+            middle = len(texts) // 2
+            return self._run_batch(texts[:middle]) + self._run_batch(texts[middle:])
+
+    @classmethod
+    def _count(cls, key: str, value: int = 1) -> None:
+        with cls._stats_lock:
+            cls._stats[key] += value
+
+    @classmethod
+    def stats(cls) -> Dict[str, int]:
+        with cls._stats_lock:
+            return dict(cls._stats)
@@ -0,0 +1,281 @@
+"""
+Поставщики эмбеддингов для индексации и поиска.
+
+EmbeddingProvider — общий интерфейс: name (модель и вариант вывода — часть
+ключа кэша эмбеддингов, поэтому векторы разных моделей не смешиваются)
+и embed_batch(texts). Поставщик выбирается настройкой EMBEDDING_PROVIDER:
+
+'gemini' — API text-embedding-004. Сетевой: партии идут через
+BatchEmbeddingEngine с ограничением частоты под квоту и повторами.
+
+'local' — модель sentence-transformers на CPU этого процесса (по умолчанию
+многоязычная MiniLM, 384 измерения). Эмбеддинг запроса — миллисекунды без
+обращения к сети, а массовая индексация упирается в ядра, а не в квоту API.
+Вывод пакетный (EMBEDDING_LOCAL_BATCH_SIZE текстов за проход), число потоков
+задает EMBEDDING_LOCAL_THREADS. EMBEDDING_LOCAL_BACKEND='onnx' включает
+ONNX Runtime (sentence-transformers >= 3.2; квантованная в int8 модель —
+файлом EMBEDDING_LOCAL_ONNX_FILE), EMBEDDING_LOCAL_QUANTIZE — динамическое
+int8-квантование линейных слоев PyTorch. Модель загружается один раз на
+процесс и общая для всех IndexService.
+
+'hashing' — детерминированные векторы без сети и моделей: символьные
+n-граммы слов, хэшированные в EMBEDDING_HASH_DIMENSIONS измерений. Тексты
+с общими словами и основами близки, поэтому на нем осмысленно мерить
+скорость и recall поиска (бенчмарки, CI). Включается только явно: если
+библиотека выбранного поставщика не установлена, IndexService не пишет
+векторы (документ получает статус ошибки), а не подменяет поставщика.
+
+Векторы разных поставщиков несовместимы (размерность и смысл): после смены
+нужно перестроить индекс — python manage.py vector_store --rebuild.
+"""
+import importlib.util
+import os
+import re
+import threading
+import time
+import unicodedata
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from django.conf import settings
+
+try:
+    import google.generativeai as genai
+    GENAI_AVAILABLE = True
+except ImportError:
+    GENAI_AVAILABLE = False
+
+# sentence-transformers и torch импортируются при загрузке локальной модели, а не модуля:
+# веб-процессы с другим поставщиком не держат их в памяти
+SENTENCE_TRANSFORMERS_AVAILABLE = importlib.util.find_spec('sentence_transformers') is not None
+
+GEMINI_MODEL = "models/text-embedding-004"
+DEFAULT_LOCAL_MODEL = 'sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2'
+
+
+class EmbeddingProvider:
+    """Интерфейс поставщика: embed_batch возвращает векторы партии в порядке текстов"""
+
+    provider = ''
+    name = ''
+    # Сетевой поставщик: партии параллелятся и ограничиваются по частоте (BatchEmbeddingEngine)
+    remote = False
+    # Векторы сохраняются в кэше эмбеддингов (вычислить дешевле, чем прочитать, — не сохраняются)
+    cacheable = True
+
+    def embed_batch(self, texts: List[str]) -> List[List[float]]:
+        raise NotImplementedError
+
+    def embed(self, texts: List[str]) -> List[Optional[List[float]]]:
+        """Векторы без повторов и деления партий (локальный вывод); при ошибке — None для всех"""
+        try:
+            return self.embed_batch(texts)
+        except Exception as e:
+            print(f"Эмбеддинги {self.name}: ошибка на партии из {len(texts)} текстов ({e})")
+            return [None] * len(texts)
+
+    def describe(self) -> Dict[str, Any]:
+        return {'provider': self.provider, 'model': self.name}
+
+
+class GeminiEmbeddingProvider(EmbeddingProvider):
+    """Эмбеддинги Gemini через API (один запрос на партию)"""
+
+    provider = 'gemini'
+    name = GEMINI_MODEL
+    remote = True
+
+    def __init__(self):
+        api_key = os.getenv("GEMINI_API_KEY")
+        if api_key:
+            genai.configure(api_key=api_key)
+
+    def embed_batch(self, texts):
+        result = genai.embed_content(
+            model=GEMINI_MODEL,
+            content=texts,
+            task_type="retrieval_document"
+        )
+        return result['embedding']
+
+
+# Загруженные локальные модели процесса: ключ — (модель, бэкенд, квантование, файл ONNX)
+_models: Dict[Tuple[str, str, bool, str], Any] = {}
+_models_lock = threading.Lock()
+
+
+class LocalEmbeddingProvider(EmbeddingProvider):
+    """Модель sentence-transformers на CPU; векторы нормированы"""
+
+    provider = 'local'
+
+    def __init__(self, model_name: str = None, backend: str = None, quantize: bool = None,
+                 threads: int = None, batch_size: int = None):
+        self.model_name = model_name or getattr(settings, 'EMBEDDING_LOCAL_MODEL', DEFAULT_LOCAL_MODEL)
+        self.backend = backend or getattr(settings, 'EMBEDDING_LOCAL_BACKEND', 'torch')
+        if self.backend not in ('torch', 'onnx'):
+            raise ValueError(f"Неизвестный бэкенд локальных эмбеддингов: {self.backend}")
+        self.quantize = quantize if quantize is not None else getattr(settings, 'EMBEDDING_LOCAL_QUANTIZE', False)
+        self.onnx_file = getattr(settings, 'EMBEDDING_LOCAL_ONNX_FILE', '') if self.backend == 'onnx' else ''
+        self.threads = threads if threads is not None else getattr(settings, 'EMBEDDING_LOCAL_THREADS', 0)
+        self.batch_size = batch_size or getattr(settings, 'EMBEDDING_LOCAL_BATCH_SIZE', 32)
+
+        variant = self.backend
+        if self.onnx_file:
+            variant += f":{os.path.splitext(os.path.basename(self.onnx_file))[0]}"
+        elif self.quantize and self.backend == 'torch':
+            variant += ':int8'
+        self.name = f"local:{self.model_name}:{variant}"[:100]
+
+    @property
+    def model(self):
+        key = (self.model_name, self.backend, self.quantize, self.onnx_file)
+        model = _models.get(key)
+        if model is None:
+            with _models_lock:
+                model = _models.get(key)
+                if model is None:
+                    model = _models[key] = self._load()
+        return model
+
+    def _load(self):
+        import torch
+        from sentence_transformers import SentenceTransformer
+        start_time = time.perf_counter()
+        if self.threads > 0:
+            torch.set_num_threads(self.threads)
+        if self.backend == 'onnx':
+            model = self._load_onnx()
+        else:
+            model = SentenceTransformer(self.model_name, device='cpu')
+            if self.quantize:
+                # Веса линейных слоев в int8, активации квантуются на лету
+                model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        model.eval()
+        print(f"Локальная модель эмбеддингов {self.name} загружена ({time.perf_counter() - start_time:.1f} с, "
+              f"{model.get_sentence_embedding_dimension()} измерений)")
+        return model
+
+    def _load_onnx(self):
+        from sentence_transformers import SentenceTransformer
+        model_kwargs: Dict[str, Any] = {'provider': 'CPUExecutionProvider'}
+        if self.onnx_file:
+            model_kwargs['file_name'] = self.onnx_file
+        if self.threads > 0:
+            import onnxruntime
+            options = onnxruntime.SessionOptions()
+            options.intra_op_num_threads = self.threads
+            model_kwargs['session_options'] = options
+        try:
+            return SentenceTransformer(self.model_name, device='cpu', backend='onnx', model_kwargs=model_kwargs)
+        except TypeError:
+            raise RuntimeError("EMBEDDING_LOCAL_BACKEND='onnx' требует sentence-transformers >= 3.2 "
+                               "и onnxruntime: pip install 'sentence-transformers[onnx]>=3.2'")
+
+    def embed_batch(self, texts):
+        model = self.model
+        import torch
+        with torch.inference_mode():
+            vectors = model.encode(
+                texts, batch_size=self.batch_size, convert_to_numpy=True,
+                normalize_embeddings=True, show_progress_bar=False,
+            )
+        return vectors.tolist()
+
+    def describe(self):
+        return dict(super().describe(), backend=self.backend, quantize=self.quantize, threads=self.threads or None)
+
+
+WORD_RE = re.compile(r'\w+')
+
+# Длины символьных n-грамм и константы хэша (полином по кодам символов, затем fmix64 из MurmurHash3)
+NGRAM_SIZES = (3, 4, 5)
+HASH_BASE = np.uint64(1000003)
+FMIX_1 = np.uint64(0xff51afd7ed558ccd)
+FMIX_2 = np.uint64(0xc4ceb9fe1a85ec53)
+
+
+class HashingEmbeddingProvider(EmbeddingProvider):
+    """
+    Хэширование признаков: каждая n-грамма слова (с пробелами по краям) дает ±1
+    в измерение по своему хэшу, счетчики сглаживаются log1p, вектор нормируется.
+    Вся партия считается массивами NumPy: тексты склеиваются, хэши n-грамм
+    получаются сдвигами массива кодов, векторы — одним bincount
+    """
+
+    provider = 'hashing'
+    cacheable = False
+
+    def __init__(self, dimensions: int = None):
+        self.dimensions = dimensions or getattr(settings, 'EMBEDDING_HASH_DIMENSIONS', 768)
+        self.name = f"hashing:{self.dimensions}"
+
+    def embed_batch(self, texts):
+        return self.vectors(texts).tolist()
+
+    def vectors(self, texts: List[str]) -> np.ndarray:
+        """Нормированная матрица float32 (len(texts) × dimensions); у текста без слов — нулевой вектор"""
+        prepared = [
+            ' ' + ' '.join(WORD_RE.findall(unicodedata.normalize('NFC', text).lower().replace('ё', 'е'))) + ' '
+            for text in texts
+        ]
+        codes = np.frombuffer(''.join(prepared).encode('utf-32-le'), dtype='<u4').astype('uint64')
+        owners = np.repeat(np.arange(len(texts)), [len(text) for text in prepared])
+
+        features, rows, signs = [], [], []
+        hashes = np.zeros(len(codes), dtype='uint64')
+        for n in range(1, max(NGRAM_SIZES) + 1):
+            # hashes[i] — полиномиальный хэш n символов, начиная с i
+            hashes = hashes[:len(codes) - n + 1] * HASH_BASE + codes[n - 1:]
+            if n not in NGRAM_SIZES:
+                continue
+            # n-граммы на стыке двух текстов и состоящие из одних пробелов отбрасываются
+            valid = owners[:len(hashes)] == owners[n - 1:]
+            mixed = self._fmix(hashes[valid] ^ np.uint64(n))
+            features.append((mixed % np.uint64(self.dimensions)).astype('int64'))
+            signs.append(np.where(mixed >> np.uint64(63), -1.0, 1.0))
+            rows.append(owners[:len(hashes)][valid])
+
+        matrix = np.zeros((len(texts), self.dimensions), dtype='float64')
+        if features:
+            cells = np.concatenate(rows) * self.dimensions + np.concatenate(features)
+            matrix = np.bincount(cells, weights=np.concatenate(signs),
+                                 minlength=len(texts) * self.dimensions).reshape(len(texts), self.dimensions)
+        matrix = np.sign(matrix) * np.log1p(np.abs(matrix))
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return (matrix / np.maximum(norms, 1e-12)).astype('float32')
+
+    @staticmethod
+    def _fmix(hashes: np.ndarray) -> np.ndarray:
+        hashes = hashes ^ (hashes >> np.uint64(33))
+        hashes = hashes * FMIX_1
+        hashes = hashes ^ (hashes >> np.uint64(33))
+        hashes = hashes * FMIX_2
+        return hashes ^ (hashes >> np.uint64(33))
+
+    def describe(self):
+        return dict(super().describe(), dimensions=self.dimensions)
+
+
+PROVIDERS = {
+    'gemini': (GeminiEmbeddingProvider, lambda: GENAI_AVAILABLE, 'pip install google-generativeai'),
+    'local': (LocalEmbeddingProvider, lambda: SENTENCE_TRANSFORMERS_AVAILABLE, 'pip install sentence-transformers'),
+    'hashing': (HashingEmbeddingProvider, lambda: True, ''),
+}
+
+
+def unavailable_message(provider: str = None) -> str:
+    provider = provider or getattr(settings, 'EMBEDDING_PROVIDER', 'gemini')
+    return f"Поставщик эмбеддингов '{provider}' недоступен. Установите: {PROVIDERS[provider][2]}"
+
+
+def get_embedding_provider(provider: str = None) -> Optional[EmbeddingProvider]:
+    """Поставщик по настройке EMBEDDING_PROVIDER; None, если его библиотека не установлена"""
+    provider = provider or getattr(settings, 'EMBEDDING_PROVIDER', 'gemini')
+    if provider not in PROVIDERS:
+        raise ValueError(f"Неизвестный поставщик эмбеддингов: {provider}")
+    provider_class, available, _ = PROVIDERS[provider]
+    if not available():
+        print(f"Warning: {unavailable_message(provider)}")
+        return None
+    return provider_class()
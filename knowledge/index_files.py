@@ -0,0 +1,242 @@
+"""
+Файлы векторного индекса на диске: манифест, дельта-сегменты и база.
+
+manifest.json перечисляет базу и сегменты, записанные после нее; атомарная
+замена манифеста — момент фиксации изменений. Сегмент (.npz) — добавления
+(ids, нормированные векторы, типы документов, pk загрузивших пользователей)
+и удаления одного snapshot().
+
+База после уплотнения хранится в формате для чтения через mmap:
+<name>.vectors (float32 N×D подряд), <name>.ids (int64) и <name>.types
+(uint8 — номер типа документа в manifest['type_names']). Все поля
+фиксированной ширины, поэтому смещение строки i в каждом файле равно
+i × размер поля, а процессы, отобразившие базу в память, делят одни страницы
+кэша ОС. Рядом может лежать приближенный индекс <name>.ann (manifest['ann'],
+см. knowledge.ann) — он удаляется вместе с базой.
+
+Строки базы разбиты на партиции по (тип документа, загрузивший пользователь):
+партиция — непрерывный диапазон строк, внутри него ids по возрастанию.
+manifest['partitions'] — список [код типа, pk пользователя (0 — не указан),
+начало, конец], поэтому поиск с фильтром читает только нужные диапазоны.
+<name>.order (int64) — номера строк в порядке возрастания ids, для поиска
+строки по pk. В базах без 'partitions' (записаны до разбиения) строки
+упорядочены по ids, а пользователь не указан. Индекс FAISS одним файлом
+(index.faiss, прежний формат) читается как база без mmap.
+
+Модуль не импортирует Django и используется в бенчмарках отдельно.
+"""
+import json
+import os
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+MANIFEST_NAME = 'manifest.json'
+LEGACY_BASE = ('index.faiss', 'document_types.json')
+RAW_SUFFIXES = ('.vectors', '.ids', '.types')
+ORDER_SUFFIX = '.order'
+
+
+def empty_manifest(next_segment: int = 1) -> Dict[str, Any]:
+    return {'base': None, 'types': None, 'segments': [], 'next_segment': next_segment}
+
+
+def read_manifest(directory: str) -> Dict[str, Any]:
+    path = os.path.join(directory, MANIFEST_NAME)
+    if os.path.exists(path):
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    if os.path.exists(os.path.join(directory, LEGACY_BASE[0])):
+        manifest = empty_manifest()
+        manifest['base'], manifest['types'] = LEGACY_BASE
+        return manifest
+    return empty_manifest()
+
+
+def write_manifest(directory: str, manifest: Dict[str, Any]) -> None:
+    path = os.path.join(directory, MANIFEST_NAME)
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(path + '.tmp', path)
+
+
+def write_segment(directory: str, name: str, ids: np.ndarray, vectors: np.ndarray,
+                  types: List[str], uploaders: np.ndarray, deletes: np.ndarray) -> None:
+    path = os.path.join(directory, name)
+    with open(path + '.tmp', 'wb') as f:
+        np.savez(f, ids=ids, vectors=vectors, types=np.array(types, dtype=str),
+                 uploaders=np.asarray(uploaders, dtype='int64'), deletes=deletes)
+    os.replace(path + '.tmp', path)
+
+
+def read_segment(directory: str, name: str) -> Tuple[np.ndarray, np.ndarray, List[str], np.ndarray, np.ndarray]:
+    """(ids, векторы, типы, пользователи, удаления); в сегментах до разбиения на партиции пользователь 0"""
+    with np.load(os.path.join(directory, name)) as data:
+        ids = data['ids']
+        uploaders = data['uploaders'] if 'uploaders' in data.files else np.zeros(len(ids), dtype='int64')
+        return ids, data['vectors'], data['types'].tolist(), uploaders, data['deletes']
+
+
+def read_segment_ids(directory: str, name: str) -> Tuple[np.ndarray, np.ndarray]:
+    """(ids, удаления) сегмента без чтения векторов"""
+    with np.load(os.path.join(directory, name)) as data:
+        return data['ids'], data['deletes']
+
+
+def is_raw_base(manifest: Dict[str, Any]) -> bool:
+    return bool(manifest['base']) and manifest.get('base_format') == 'raw'
+
+
+def write_raw_base(directory: str, name: str,
+                   blocks: Iterable[Tuple[np.ndarray, np.ndarray, np.ndarray]]) -> Tuple[int, int]:
+    """
+    Запись базы по блокам (ids, векторы, коды типов) в порядке строк базы,
+    чтобы не держать в памяти вторую копию индекса. Возвращает (N, D)
+    """
+    paths = [os.path.join(directory, name + suffix) for suffix in RAW_SUFFIXES]
+    count, dimensions = 0, 0
+    files = [open(path + '.tmp', 'wb') for path in paths]
+    try:
+        for ids, vectors, codes in blocks:
+            files[0].write(np.ascontiguousarray(vectors, dtype='float32').tobytes())
+            files[1].write(np.ascontiguousarray(ids, dtype='int64').tobytes())
+            files[2].write(np.ascontiguousarray(codes, dtype='uint8').tobytes())
+            count += len(ids)
+            dimensions = vectors.shape[1] if len(ids) else dimensions
+    finally:
+        for f in files:
+            f.close()
+    for path in paths:
+        os.replace(path + '.tmp', path)
+    return count, dimensions
+
+
+def open_raw_base(directory: str, manifest: Dict[str, Any],
+                  mmap: bool = True) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """(ids, векторы, коды типов) базы; при mmap=True — отображения файлов только для чтения"""
+    count, dimensions = manifest['count'], manifest['dimensions']
+    paths = [os.path.join(directory, manifest['base'] + suffix) for suffix in RAW_SUFFIXES]
+    if mmap:
+        vectors = np.memmap(paths[0], dtype='float32', mode='r', shape=(count, dimensions))
+        ids = np.memmap(paths[1], dtype='int64', mode='r', shape=(count,))
+        codes = np.memmap(paths[2], dtype='uint8', mode='r', shape=(count,))
+    else:
+        vectors = np.fromfile(paths[0], dtype='float32').reshape(count, dimensions)
+        ids = np.fromfile(paths[1], dtype='int64')
+        codes = np.fromfile(paths[2], dtype='uint8')
+    return ids, vectors, codes
+
+
+def write_row_order(directory: str, name: str, ids: np.ndarray) -> None:
+    """<name>.order: номера строк базы по возрастанию ids"""
+    path = os.path.join(directory, name + ORDER_SUFFIX)
+    with open(path + '.tmp', 'wb') as f:
+        f.write(np.argsort(ids, kind='stable').astype('int64').tobytes())
+    os.replace(path + '.tmp', path)
+
+
+def open_row_order(directory: str, manifest: Dict[str, Any], mmap: bool = True) -> Optional[np.ndarray]:
+    """Номера строк по возрастанию ids; None — строки базы и так упорядочены по ids"""
+    if manifest.get('partitions') is None:
+        return None
+    path = os.path.join(directory, manifest['base'] + ORDER_SUFFIX)
+    if mmap:
+        return np.memmap(path, dtype='int64', mode='r', shape=(manifest['count'],))
+    return np.fromfile(path, dtype='int64')
+
+
+def partition_table(codes: np.ndarray, uploaders: np.ndarray) -> List[List[int]]:
+    """Партиции упорядоченных строк: [код типа, пользователь, начало, конец] для каждой смены ключа"""
+    if not len(codes):
+        return []
+    changed = (codes[1:] != codes[:-1]) | (uploaders[1:] != uploaders[:-1])
+    starts = np.concatenate([[0], np.flatnonzero(changed) + 1])
+    ends = np.append(starts[1:], len(codes))
+    return [[int(codes[start]), int(uploaders[start]), int(start), int(end)] for start, end in zip(starts, ends)]
+
+
+def partition_uploaders(manifest: Dict[str, Any]) -> np.ndarray:
+    """Пользователь каждой строки базы по таблице партиций (0 в базах без нее)"""
+    partitions = manifest.get('partitions')
+    if partitions is None:
+        return np.zeros(manifest['count'], dtype='int64')
+    return np.repeat(np.array([uploader for _, uploader, _, _ in partitions], dtype='int64'),
+                     [end - start for _, _, start, end in partitions])
+
+
+def select_partitions(partitions: np.ndarray, codes: Optional[List[int]],
+                      uploaders: Optional[List[int]]) -> np.ndarray:
+    """
+    Диапазоны строк (M×2) партиций с нужными типами и пользователями (partitions —
+    таблица P×4); соседние диапазоны сливаются, чтобы читать их одним проходом
+    """
+    keep = np.ones(len(partitions), dtype=bool)
+    if codes is not None:
+        keep &= np.isin(partitions[:, 0], codes)
+    if uploaders is not None:
+        keep &= np.isin(partitions[:, 1], uploaders)
+    ranges = []
+    for start, end in partitions[keep][:, 2:4].tolist():
+        if ranges and ranges[-1][1] == start:
+            ranges[-1][1] = end
+        else:
+            ranges.append([start, end])
+    return np.array(ranges, dtype='int64').reshape(-1, 2)
+
+
+def base_files(manifest: Dict[str, Any]) -> List[str]:
+    if is_raw_base(manifest):
+        names = [manifest['base'] + suffix for suffix in RAW_SUFFIXES]
+        if manifest.get('partitions') is not None:
+            names.append(manifest['base'] + ORDER_SUFFIX)
+        if manifest.get('ann'):
+            names.append(manifest['ann']['file'])
+        return names
+    return [name for name in (manifest['base'], manifest.get('types')) if name]
+
+
+def remove_files(directory: str, manifest: Dict[str, Any]) -> None:
+    """Удаление файлов базы и сегментов манифеста (уже отображенные в память остаются доступны)"""
+    for name in base_files(manifest) + manifest['segments']:
+        path = os.path.join(directory, name)
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            # Windows не удаляет файл, пока он отображен в память другим процессом
+            print(f"Не удалось удалить {path}: {e}")
+
+
+def type_codes(type_names: List[str], types: Iterable[str]) -> np.ndarray:
+    """Коды типов документов; новые типы дописываются в type_names"""
+    positions = {name: code for code, name in enumerate(type_names)}
+    codes = []
+    for name in types:
+        if name not in positions:
+            positions[name] = len(type_names)
+            type_names.append(name)
+        codes.append(positions[name])
+    return np.array(codes, dtype='uint8')
+
+
+def find_rows(base_ids: np.ndarray, ids: np.ndarray, order: np.ndarray = None) -> np.ndarray:
+    """
+    Номера строк базы для тех ids, что в ней есть. order — номера строк по
+    возрастанию ids (open_row_order); None — base_ids уже по возрастанию
+    """
+    if not len(base_ids) or not len(ids):
+        return np.zeros(0, dtype='int64')
+    positions = np.searchsorted(base_ids, ids, sorter=order)
+    found = positions < len(base_ids)
+    rows = positions[found] if order is None else np.asarray(order[positions[found]])
+    matched = base_ids[rows] == ids[found]
+    return rows[matched]
+
+
+def legacy_types(directory: str, manifest: Dict[str, Any]) -> Dict[int, str]:
+    name: Optional[str] = manifest.get('types')
+    if not name or not os.path.exists(os.path.join(directory, name)):
+        return {}
+    with open(os.path.join(directory, name), encoding='utf-8') as f:
+        return {int(pk): value for pk, value in json.load(f).items()}
@@ -0,0 +1,367 @@
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import List, Dict, Any, Optional, Tuple, Union
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from . import article_index
+from .lexical import LexicalIndex
+from .query_cache import QueryCache, normalize_query
+from .reranker import CrossEncoderReranker
+from .models import KnowledgeDocument, DocumentChunk
+from .chunk_writer import ChunkWriter
+from .chunker import Chunk
+from .embedding_cache import EmbeddingCache, cached_embed
+from .embedding_engine import BatchEmbeddingEngine
+from .embedding_provider import EmbeddingProvider, get_embedding_provider, unavailable_message
+from .vector_store import VectorStore, chunk_metadata, get_vector_store
+
+# Эмбеддинги запросов гибридного поиска: запрос к API идет параллельно лексическому поиску
+_query_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='query-embedding')
+
+
+class IndexService:
+    """
+    Индексация и векторный поиск по базе знаний.
+
+    Эмбеддинги (поставщик EMBEDDING_PROVIDER — Gemini или локальная модель,
+    через кэш) считаются один раз и пишутся в векторное хранилище из настройки
+    VECTOR_STORE_BACKEND; этим же сервисом пользуются
+    чат (WebSocket и HTTP) и страницы базы знаний. Поиск по SEARCH_MODE:
+    векторный, лексический (BM25, см. knowledge.lexical) или гибридный,
+    при включенном RERANK_ENABLED — с переранжированием кросс-энкодером
+    """
+    
+    def __init__(self, store: VectorStore = None, lexical: LexicalIndex = None, query_cache: QueryCache = None,
+                 reranker: CrossEncoderReranker = None, embedding_provider: EmbeddingProvider = None):
+        # Поставщик эмбеддингов (None, если его библиотека не установлена: векторы не пишутся,
+        # а не подменяются другим поставщиком — в индексе векторы одной модели)
+        self.embedding_provider = embedding_provider if embedding_provider is not None else get_embedding_provider()
+        
+        # Пакетные эмбеддинги сетевого поставщика с ограничением частоты запросов
+        self.embedding_engine = BatchEmbeddingEngine(
+            self._embed_batch, name=self.embedding_provider.name if self.embedding_provider else 'default'
+        )
+        
+        # Векторное хранилище (None, если библиотека бэкенда не установлена)
+        self.store = store if store is not None else get_vector_store()
+        
+        # Лексический индекс (None — поиск только по векторам)
+        self.lexical = lexical
+        
+        # Кэш результатов поиска (None — каждый запрос ищется заново)
+        self.query_cache = query_cache
+        
+        # Кросс-энкодер для переранжирования кандидатов (None — порядок поиска)
+        self.reranker = reranker
+
+    def generate_embeddings(self, texts: List[str]) -> List[Optional[List[float]]]:
+        """
+        Генерация эмбеддингов поставщиком EMBEDDING_PROVIDER: у Gemini — партиями,
+        параллельно и с учетом квоты, у локальной модели — пакетным выводом в процессе.
+        Для текстов, которые не удалось обработать, и без поставщика возвращается None
+        """
+        provider = self.embedding_provider
+        if provider is None:
+            return [None] * len(texts)
+        
+        try:
+            # Ограничиваем длину текста для ускорения
+            truncated_texts = [text[:1000] if len(text) > 1000 else text for text in texts]
+            
+            if not provider.cacheable:
+                return provider.embed(truncated_texts)
+            
+            # Повторяющиеся тексты берутся из кэша, поставщику уходят только новые
+            embed = self.embedding_engine.embed if provider.remote else provider.embed
+            return cached_embed(truncated_texts, provider.name, "retrieval_document", embed)
+        except Exception as e:
+            print(f"Ошибка при создании эмбеддингов: {e}")
+            return [None] * len(texts)
+
+    def require_embeddings(self) -> None:
+        """
+        Ошибка, если векторы нужны (есть хранилище), а поставщик эмбеддингов недоступен:
+        документ уходит в статус ошибки, а не остается «готовым» без векторов
+        """
+        if self.store is not None and self.embedding_provider is None:
+            raise RuntimeError(unavailable_message())
+
+    def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        """Одна партия у поставщика (для Gemini — один запрос к API)"""
+        return self.embedding_provider.embed_batch(texts)
+
+    def add_chunk_batch(self, document: KnowledgeDocument, chunks: List[Union[Chunk, str]],
+                        embeddings: List[List[float]] = None, writer: ChunkWriter = None,
+                        indexes: List[int] = None) -> int:
+        """Запись партии фрагментов в Django и векторное хранилище. Возвращает число записанных фрагментов"""
+        if embeddings is None:
+            self.require_embeddings()
+        
+        if writer is None:
+            writer = ChunkWriter(document)
+        
+        # Сохраняем в Django модель одним bulk_create
+        rows = writer.write(chunks, indexes)
+        
+        if self.store is not None:
+            if embeddings is None:
+                embeddings = self.generate_embeddings([row.content for row in rows])
+            
+            # Фрагменты без вектора остаются в Django, но не попадают в хранилище
+            indexed = [i for i, embedding in enumerate(embeddings) if embedding is not None]
+            if len(indexed) < len(rows):
+                print(f"Документ {document.id}: {len(rows) - len(indexed)} фрагментов без эмбеддинга")
+            
+            if indexed:
+                self.store.add([rows[i] for i in indexed], [embeddings[i] for i in indexed])
+        
+        return len(rows)
+
+    def update_chunk_metadata(self, document: KnowledgeDocument, chunks: List[DocumentChunk]) -> None:
+        """Обновление метаданных сохраненных фрагментов без пересчета векторов"""
+        article_index.index_chunks(chunks, replace=True)
+        if self.store is not None and chunks:
+            self.store.update_metadata(chunks)
+
+    def has_vectors(self, chunks: List[DocumentChunk]) -> List[bool]:
+        """Есть ли вектор у каждого фрагмента; без хранилища векторы не нужны — True для всех"""
+        if self.store is None:
+            return [True] * len(chunks)
+        return self.store.has(chunks)
+
+    def delete_chunks(self, chunks: List[DocumentChunk]) -> None:
+        """Удаление отдельных фрагментов из векторного хранилища и Django"""
+        if self.store is not None:
+            self.store.delete(chunks)
+        pks = [chunk.pk for chunk in chunks]
+        for start in range(0, len(pks), 500):
+            DocumentChunk.objects.filter(pk__in=pks[start:start + 500]).delete()
+
+    def snapshot(self) -> Optional[Dict[str, Any]]:
+        """Фиксация изменений хранилища на диске (вызывается после обработки документа)"""
+        if self.store is None:
+            return None
+        return self.store.snapshot()
+
+    def add_document_chunks(self, document: KnowledgeDocument, chunks: List[str]) -> bool:
+        """Добавление фрагментов документа в векторное хранилище"""
+        try:
+            writer = ChunkWriter(document)
+            self.add_chunk_batch(document, chunks, writer=writer)
+            self.snapshot()
+            print(writer.report())
+            
+            # Обновляем статус документа
+            document.total_chunks = len(chunks)
+            document.status = 'ready'
+            document.save()
+            
+            return True
+            
+        except Exception as e:
+            print(f"Ошибка при добавлении фрагментов: {e}")
+            document.status = 'error'
+            document.error_message = str(e)
+            document.save()
+            return False
+
+    def search_documents(self, query: str, limit: int = 5, document_types: List[str] = None,
+                         mode: str = None, uploaders: List[int] = None) -> List[Dict[str, Any]]:
+        """
+        Поиск релевантных фрагментов по запросу; document_types и uploaders (pk
+        пользователей, загрузивших документы) ограничивают поиск их партициями индекса.
+
+        mode (по умолчанию SEARCH_MODE): 'vector' — по эмбеддингу запроса,
+        'lexical' — BM25 без обращения к API эмбеддингов, 'hybrid' — оба поиска
+        одновременно со слиянием списков (reciprocal rank fusion); если эмбеддинг
+        не получен за HYBRID_EMBEDDING_TIMEOUT секунд, ответ дает лексический поиск.
+        С кросс-энкодером поиск берет RERANK_CANDIDATES кандидатов, и limit лучших
+        выбирает он
+        """
+        mode = mode or getattr(settings, 'SEARCH_MODE', 'vector')
+        if self.lexical is None:
+            mode = 'vector'
+        if mode == 'vector' and self.store is None:
+            return []
+        try:
+            if self.query_cache is None:
+                return self._search(query, limit, document_types or None, uploaders or None, mode)[0]
+            # Одинаковые после нормализации запросы берутся из кэша, одновременные — ждут один поиск
+            key = (normalize_query(query), limit, tuple(sorted(set(document_types or ()))),
+                   tuple(sorted(set(uploaders or ()))), mode)
+            return list(self.query_cache.get_or_compute(
+                key, lambda: self._search(query, limit, document_types or None, uploaders or None, mode)
+            ))
+            
+        except Exception as e:
+            print(f"Ошибка при поиске: {e}")
+            return []
+
+    def _search(self, query: str, limit: int, document_types: Optional[List[str]],
+                uploaders: Optional[List[int]], mode: str) -> Tuple[List[Dict[str, Any]], bool]:
+        """
+        Результаты и признак полноты: без эмбеддинга запроса или переранжирования
+        (бюджет, загрузка модели) результат не кэшируется
+        """
+        if self.reranker is None:
+            return self._retrieve(query, limit, document_types, uploaders, mode)
+        candidates, complete = self._retrieve(query, max(limit, self.reranker.candidates),
+                                              document_types, uploaders, mode)
+        try:
+            results, reranked = self.reranker.rerank(query, candidates, limit)
+        except Exception as e:
+            print(f"Ошибка переранжирования: {e}")
+            results, reranked = candidates[:limit], False
+        return results, complete and reranked
+
+    def _retrieve(self, query: str, limit: int, document_types: Optional[List[str]],
+                  uploaders: Optional[List[int]], mode: str) -> Tuple[List[Dict[str, Any]], bool]:
+        if mode == 'lexical':
+            # Оценки BM25 не ограничены сверху: в ответе они приводятся к шкале гибридного поиска
+            hits = reciprocal_rank_fusion([self.lexical.search(query, limit, document_types, uploaders)], limit,
+                                          getattr(settings, 'RRF_K', 60))
+            return self.hydrate(hits), True
+        if mode == 'hybrid':
+            hits, complete = self._hybrid_search(query, limit, document_types, uploaders)
+            return self.hydrate(hits), complete
+        
+        # Генерируем эмбеддинг для запроса
+        query_embedding = self.generate_embeddings([query])[0]
+        if query_embedding is None:
+            return [], False
+        hits = self.store.search(query_embedding, limit, document_types=document_types, uploaders=uploaders)
+        return self.hydrate(hits), True
+
+    def search_context(self, query: str, limit: int = 5) -> List[Dict[str, Any]]:
+        """
+        Контекст для ответа в чате: если в вопросе названа статья (и кодекс), ее текст
+        берется из указателя статей без эмбеддинга, иначе — обычный поиск search_documents
+        """
+        reference = article_index.parse_article_reference(query)
+        if reference is not None:
+            try:
+                hits = article_index.lookup(reference)
+                if hits:
+                    return self.hydrate(hits)
+            except Exception as e:
+                print(f"Ошибка поиска по указателю статей: {e}")
+        return self.search_documents(query, limit)
+
+    def _hybrid_search(self, query: str, limit: int, document_types: Optional[List[str]],
+                       uploaders: Optional[List[int]]) -> Tuple[List[Tuple[int, float]], bool]:
+        depth = max(limit, getattr(settings, 'HYBRID_SEARCH_DEPTH', 20))
+        embedding = None
+        if self.store is not None:
+            embedding = _query_executor.submit(self._query_embedding, query)
+
+        lexical_hits = self.lexical.search(query, depth, document_types, uploaders)
+
+        vector_hits = []
+        query_embedding = None
+        if embedding is not None:
+            try:
+                query_embedding = embedding.result(timeout=getattr(settings, 'HYBRID_EMBEDDING_TIMEOUT', 2.0))
+            except FutureTimeoutError:
+                # Запрос к API дорабатывает в фоне, и его результат попадет в кэш эмбеддингов
+                print("Эмбеддинг запроса не получен вовремя: поиск только по словам")
+                query_embedding = None
+            if query_embedding is not None:
+                vector_hits = self.store.search(query_embedding, depth, document_types=document_types,
+                                                uploaders=uploaders)
+
+        fused = reciprocal_rank_fusion([vector_hits, lexical_hits], limit, getattr(settings, 'RRF_K', 60))
+        return fused, embedding is None or query_embedding is not None
+
+    def _query_embedding(self, query: str) -> Optional[List[float]]:
+        """Эмбеддинг запроса в потоке пула: кэш эмбеддингов читается через свое соединение с БД"""
+        close_old_connections()
+        try:
+            return self.generate_embeddings([query])[0]
+        finally:
+            close_old_connections()
+
+    @staticmethod
+    def hydrate(hits) -> List[Dict[str, Any]]:
+        """Результаты поиска: текст и метаданные фрагментов из Django одним запросом"""
+        rows = DocumentChunk.objects.select_related('document').in_bulk([pk for pk, _ in hits])
+        results = []
+        for pk, score in hits:
+            chunk = rows.get(pk)
+            if chunk is None:
+                # Фрагмент удален, а хранилище еще не обновлено
+                continue
+            metadata = chunk_metadata(chunk)
+            results.append({
+                'content': chunk.content,
+                'metadata': metadata,
+                'score': score,
+                'distance': 1.0 - score,
+                'chunk_id': pk,
+                'document_id': chunk.document_id,
+                'document_title': chunk.document.title,
+                'document_type': chunk.document.document_type,
+                'chunk_index': chunk.chunk_index,
+                'page_number': chunk.page_number,
+            })
+        return results
+
+    def delete_document(self, document: KnowledgeDocument) -> bool:
+        """Удаление фрагментов документа из векторного хранилища и Django"""
+        try:
+            chunks = list(document.chunks.only('pk', 'chroma_id'))
+            if chunks and self.store is not None:
+                self.store.delete(chunks)
+                self.store.snapshot()
+            
+            # Удаляем из Django
+            document.chunks.all().delete()
+            
+            return True
+            
+        except Exception as e:
+            print(f"Ошибка при удалении документа: {e}")
+            return False
+
+    def get_collection_stats(self) -> Dict[str, Any]:
+        """Получение статистики хранилища"""
+        total_documents = KnowledgeDocument.objects.filter(status='ready').count()
+        try:
+            if self.store is None:
+                # Если хранилище недоступно, считаем из Django
+                return {
+                    'total_chunks': DocumentChunk.objects.count(),
+                    'total_documents': total_documents,
+                    'backend': None
+                }
+            
+            return {
+                'total_chunks': self.store.count(),
+                'total_documents': total_documents,
+                'backend': self.store.backend,
+                'embedding_provider': self.embedding_provider.describe() if self.embedding_provider else None,
+                'embedding_cache': EmbeddingCache.stats(),
+                'query_cache': self.query_cache.stats() if self.query_cache is not None else None,
+                'reranker': self.reranker.stats() if self.reranker is not None else None,
+            }
+        except Exception as e:
+            print(f"Ошибка при получении статистики: {e}")
+            return {
+                'total_chunks': DocumentChunk.objects.count(),
+                'total_documents': total_documents,
+                'backend': None
+            }
+
+
+def reciprocal_rank_fusion(rankings: List[List[Tuple[int, float]]], limit: int, k: int = 60) -> List[Tuple[int, float]]:
+    """
+    Слияние ранжированных списков (pk, оценка): сумма 1 / (k + ранг) по спискам.
+    Оценка нормируется на максимум, так что фрагмент, первый во всех списках, получает 1.0
+    """
+    fused: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, (pk, _) in enumerate(ranking, start=1):
+            fused[pk] = fused.get(pk, 0.0) + 1.0 / (k + rank)
+    best = sum(1.0 / (k + 1) for ranking in rankings if ranking) or 1.0
+    ordered = sorted(fused.items(), key=lambda item: -item[1])[:limit]
+    return [(pk, score / best) for pk, score in ordered]
@@ -0,0 +1,77 @@
+"""
+Потоковый конвейер индексации: страница PDF → очистка → фрагменты → эмбеддинги → запись.
+
+Каждая стадия — генератор, поэтому в памяти одновременно находится лишь окно
+текста и одна партия фрагментов, независимо от размера документа. Партии
+записываются в базу и векторное хранилище по мере готовности, так что первые
+фрагменты доступны для поиска еще до разбора последней страницы.
+"""
+import re
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
+
+from .chunker import ARTICLE_HEADER_RE, Chunk
+
+_SPACES_RE = re.compile(r'[ \t\f\v\xa0]+')
+
+
+def clean_pages(pages: Iterable[Tuple[int, str]]) -> Iterator[Tuple[int, str]]:
+    """Нормализация страниц: схлопывание пробелов и пустых строк (переносы строк сохраняются)"""
+    for page_num, text in pages:
+        lines = (_SPACES_RE.sub(' ', line).strip() for line in text.splitlines())
+        cleaned = "\n".join(line for line in lines if line)
+        if cleaned:
+            yield page_num, cleaned
+
+
+def chunk_pages(
+    pages: Iterable[Tuple[int, str]],
+    split: Callable[[str], List[Chunk]],
+    window_size: int,
+) -> Iterator[Chunk]:
+    """
+    Разбиение потока страниц на фрагменты.
+
+    Текст накапливается в окне; когда окно превышает window_size, его часть до
+    последнего заголовка статьи (или до последнего переноса строки, если статей
+    нет) передается в split, а хвост остается для следующих страниц. Так статья,
+    начавшаяся на одной странице и продолжившаяся на другой, не разрывается.
+    """
+    buffer = ""
+    for page_num, text in pages:
+        buffer += f"\n--- Страница {page_num} ---\n{text}"
+        if len(buffer) < window_size:
+            continue
+
+        cut = 0
+        for match in ARTICLE_HEADER_RE.finditer(buffer):
+            cut = match.start()
+        if cut <= 0:
+            cut = buffer.rfind("\n") + 1
+
+        if cut > 0:
+            yield from split(buffer[:cut])
+            buffer = buffer[cut:]
+
+    if buffer.strip():
+        yield from split(buffer)
+
+
+def batched(items: Iterable, batch_size: int) -> Iterator[list]:
+    """Группировка потока в списки фиксированного размера"""
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def embed_batches(
+    batches: Iterable[List[Chunk]],
+    embed: Optional[Callable[[List[Chunk]], List[List[float]]]],
+) -> Iterator[Tuple[List[Chunk], Optional[List[List[float]]]]]:
+    """Эмбеддинги для каждой партии (None, если векторное хранилище недоступно)"""
+    for batch in batches:
+        yield batch, (embed(batch) if embed else None)
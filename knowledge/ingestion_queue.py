@@ -0,0 +1,238 @@
+import os
+import socket
+import threading
+from datetime import timedelta
+from typing import Iterable, Optional
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import KnowledgeDocument, IngestionJob
+
+
+def _lease_seconds() -> int:
+    return getattr(settings, 'INGEST_LEASE_SECONDS', 900)
+
+
+def default_worker_id() -> str:
+    """Идентификатор воркера: хост и PID процесса"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def enqueue_document(document: KnowledgeDocument) -> IngestionJob:
+    """Постановка документа в очередь индексации (без дублей активных заданий)"""
+    job = IngestionJob.objects.filter(
+        document=document,
+        status__in=['pending', 'running']
+    ).first()
+    if job:
+        return job
+
+    return IngestionJob.objects.create(
+        document=document,
+        max_attempts=getattr(settings, 'INGEST_MAX_ATTEMPTS', 3),
+    )
+
+
+def _claimable(now) -> Q:
+    # Новые задания и задания, аренда которых истекла (воркер упал или был перезапущен)
+    return (
+        (Q(status='pending', run_after__lte=now) |
+         Q(status='running', lease_expires_at__lt=now))
+        & Q(attempts__lt=F('max_attempts'))
+    )
+
+
+def claim_job(worker_id: str, document_ids: Iterable[int] = None) -> Optional[IngestionJob]:
+    """
+    Захват следующего задания (только среди заданий документов document_ids, если заданы).
+
+    На PostgreSQL используется SELECT ... FOR UPDATE SKIP LOCKED, поэтому воркеры
+    на разных узлах не блокируют друг друга. На SQLite блокировок строк нет,
+    поэтому задание захватывается условным UPDATE по старому значению аренды:
+    из нескольких конкурентов выигрывает только один.
+    """
+    now = timezone.now()
+    lease_until = now + timedelta(seconds=_lease_seconds())
+    jobs = IngestionJob.objects.all()
+    if document_ids is not None:
+        jobs = jobs.filter(document_id__in=list(document_ids))
+
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            job = (
+                jobs
+                .select_for_update(skip_locked=True)
+                .filter(_claimable(now))
+                .order_by('created_at')
+                .first()
+            )
+            if job is None:
+                return None
+            IngestionJob.objects.filter(pk=job.pk).update(
+                status='running',
+                locked_by=worker_id,
+                lease_expires_at=lease_until,
+                attempts=F('attempts') + 1,
+                updated_at=now,
+            )
+        return IngestionJob.objects.select_related('document').get(pk=job.pk)
+
+    for _ in range(5):
+        candidate = (
+            jobs
+            .filter(_claimable(now))
+            .order_by('created_at')
+            .values('pk', 'status', 'lease_expires_at')
+            .first()
+        )
+        if candidate is None:
+            return None
+
+        won = IngestionJob.objects.filter(
+            pk=candidate['pk'],
+            status=candidate['status'],
+            lease_expires_at=candidate['lease_expires_at'],
+        ).update(
+            status='running',
+            locked_by=worker_id,
+            lease_expires_at=lease_until,
+            attempts=F('attempts') + 1,
+            updated_at=now,
+        )
+        if won:
+            return IngestionJob.objects.select_related('document').get(pk=candidate['pk'])
+
+    return None
+
+
+def renew_lease(job: IngestionJob, worker_id: str) -> bool:
+    """Продление аренды. False означает, что задание уже перехвачено другим воркером"""
+    now = timezone.now()
+    return IngestionJob.objects.filter(
+        pk=job.pk, status='running', locked_by=worker_id
+    ).update(
+        lease_expires_at=now + timedelta(seconds=_lease_seconds()),
+        updated_at=now,
+    ) == 1
+
+
+def complete_job(job: IngestionJob, worker_id: str) -> None:
+    now = timezone.now()
+    IngestionJob.objects.filter(pk=job.pk, locked_by=worker_id).update(
+        status='done',
+        lease_expires_at=None,
+        last_error='',
+        finished_at=now,
+        updated_at=now,
+    )
+
+
+def fail_job(job: IngestionJob, worker_id: str, error: str) -> None:
+    """Ошибка выполнения: повтор с экспоненциальной задержкой или окончательный отказ"""
+    now = timezone.now()
+    job.refresh_from_db(fields=['attempts', 'max_attempts'])
+
+    if job.attempts < job.max_attempts:
+        backoff = getattr(settings, 'INGEST_RETRY_BACKOFF_SECONDS', 30) * (2 ** (job.attempts - 1))
+        IngestionJob.objects.filter(pk=job.pk, locked_by=worker_id).update(
+            status='pending',
+            lease_expires_at=None,
+            run_after=now + timedelta(seconds=backoff),
+            last_error=error,
+            updated_at=now,
+        )
+    else:
+        IngestionJob.objects.filter(pk=job.pk, locked_by=worker_id).update(
+            status='failed',
+            lease_expires_at=None,
+            last_error=error,
+            finished_at=now,
+            updated_at=now,
+        )
+
+
+def release_jobs(document_ids: Iterable[int], locked_by_prefix: str) -> int:
+    """
+    Возврат в очередь заданий, захваченных завершившимся процессом (например,
+    упавшим запуском ingest_corpus), не дожидаясь истечения аренды
+    """
+    now = timezone.now()
+    return IngestionJob.objects.filter(
+        document_id__in=list(document_ids),
+        status='running',
+        locked_by__startswith=locked_by_prefix,
+    ).update(
+        status='pending',
+        lease_expires_at=None,
+        run_after=now,
+        updated_at=now,
+    )
+
+
+def fail_exhausted_jobs() -> int:
+    """Задания, исчерпавшие попытки и брошенные упавшим воркером, помечаются как failed"""
+    now = timezone.now()
+    return IngestionJob.objects.filter(
+        status='running',
+        lease_expires_at__lt=now,
+        attempts__gte=F('max_attempts'),
+    ).update(
+        status='failed',
+        lease_expires_at=None,
+        last_error='Аренда истекла после последней попытки',
+        finished_at=now,
+        updated_at=now,
+    )
+
+
+def run_job(job: IngestionJob) -> None:
+    """
+    Выполнение задания: индексация документа. Исключение означает неудачу.
+    Если у документа уже есть фрагменты (переобработка или повтор после сбоя),
+    неизменившиеся фрагменты сохраняют свои векторы
+    """
+    from .document_processor import DocumentProcessor
+
+    document = KnowledgeDocument.objects.get(pk=job.document_id)
+
+    # Один проход: фрагменты, эмбеддинги и векторное хранилище из VECTOR_STORE_BACKEND;
+    # без фрагментов reprocess_document выполняет полную обработку (process_document)
+    processor = DocumentProcessor()
+    if not processor.reprocess_document(document):
+        document.refresh_from_db(fields=['error_message'])
+        raise Exception(document.error_message or "Ошибка при обработке документа")
+
+
+def _heartbeat_loop(job: IngestionJob, worker_id: str, done: threading.Event) -> None:
+    interval = max(1, _lease_seconds() // 3)
+    try:
+        while not done.wait(interval):
+            if not renew_lease(job, worker_id):
+                print(f"[{worker_id}] Аренда задания {job.pk} потеряна")
+                return
+    finally:
+        connection.close()
+
+
+def execute_job(job: IngestionJob, worker_id: str) -> Optional[str]:
+    """
+    Выполнение захваченного задания с продлением аренды в фоновом потоке.
+    Задание отмечается выполненным или уходит на повтор; возвращает текст ошибки или None
+    """
+    done = threading.Event()
+    heartbeat = threading.Thread(target=_heartbeat_loop, args=(job, worker_id, done), daemon=True)
+    heartbeat.start()
+    try:
+        run_job(job)
+    except Exception as e:
+        fail_job(job, worker_id, str(e))
+        return str(e)
+    else:
+        complete_job(job, worker_id)
+        return None
+    finally:
+        done.set()
+        heartbeat.join()
@@ -0,0 +1,217 @@
+"""
+Лексический индекс BM25 над текстами фрагментов (DocumentChunk.content).
+
+Запросы вроде «статья 45 трудового кодекса» находятся по словам без
+эмбеддинга запроса, то есть без обращения к API. Индекс строится в памяти
+процесса при первом поиске и дальше обновляется по приращению: фрагменты
+не меняются после записи, поэтому при новом поколении индекса дочитываются
+только фрагменты с pk больше последнего, а удаленные помечаются по разнице
+числа строк. Не зависит от СУБД (SQLite и PostgreSQL одинаково).
+
+Токенизация учитывает русский и таджикский (ғ, ӣ, қ, ӯ, ҳ, ҷ), числа
+сохраняются как слова (номера статей). Легкий стемминг отрезает до двух
+частых окончаний и суффиксов (падежные окончания, таджикские -ҳо, -он, -ро,
+изафет -и), оставляя основу не короче трех букв: «статьи», «статей» и
+«статья» сводятся к одной основе, «моддаи» и «моддаҳо» — к другой.
+"""
+import math
+import re
+import threading
+import time
+from collections import Counter
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from .models import DocumentChunk, KnowledgeDocument
+from .vector_store import top_k_rows
+
+TOKEN_RE = re.compile(r'[0-9a-zа-яёғӣқӯҳҷ]+')
+
+STOP_WORDS = frozenset('''
+    а без бы был была были было быть в вам вас во вот все всех вы где да для до его ее ей если есть еще же за
+    и из или им их к как ко когда кто ли либо лишь между мы на над не нее нет ни них но о об однако он она они
+    оно от по под после при про с со так также те тем то того тоже только том у уже чем что чтобы эта эти это
+    этого этой этом этот
+    аз агар аст ба барои бе бо буд бояд ва ё дар ин к ки мебошад на не низ пас то ҳам ҳар чун чунки як
+'''.split())
+
+# Окончания и суффиксы для легкого стемминга (русские и таджикские), длинные проверяются первыми
+SUFFIXES = tuple(sorted(set('''
+    иями ями ами иях ях ах иям ям ам ией ов ев ей ом ем ию ия ие ий ии ью ья ье ьи ьям ьях ьев
+    ыми ими ого его ому ему ая яя ое ее ые ие ый ий ой ым им ую юю ых их ою ею
+    ать ять ить еть ться тся ет ют ит ат ят ут ла ло ли ся сь
+    а я о е ы и у ю ь й
+    ҳоро ҳои ҳо гон вон он ён ро ӣ амон атон ашон ам ат аш
+'''.split()), key=len, reverse=True))
+MIN_STEM = 3
+
+# Параметры BM25
+K1 = 1.2
+B = 0.75
+
+# Доля удаленных строк, после которой постинги пересобираются без них
+COMPACT_DEAD_RATIO = 0.25
+
+
+@lru_cache(maxsize=200_000)
+def stem(word: str) -> str:
+    if word.isdigit():
+        return word
+    for _ in range(2):
+        for suffix in SUFFIXES:
+            if word.endswith(suffix) and len(word) - len(suffix) >= MIN_STEM:
+                word = word[:-len(suffix)]
+                break
+        else:
+            break
+    return word
+
+
+def analyze(text: str) -> List[str]:
+    """Термы текста: слова в нижнем регистре без стоп-слов, после стемминга"""
+    return [stem(token) for token in TOKEN_RE.findall(text.lower().replace('ё', 'е')) if token not in STOP_WORDS]
+
+
+class _State:
+    """Неизменяемый снимок индекса: поиск читает его без блокировки, обновление подменяет целиком"""
+
+    def __init__(self, postings=None, pks=None, documents=None, lengths=None, alive=None, document_types=None,
+                 document_uploaders=None):
+        # терм -> (строки, частоты терма в строках)
+        self.postings: Dict[str, Tuple[np.ndarray, np.ndarray]] = postings or {}
+        self.pks = pks if pks is not None else np.zeros(0, dtype='int64')  # по возрастанию
+        self.documents = documents if documents is not None else np.zeros(0, dtype='int64')
+        self.lengths = lengths if lengths is not None else np.zeros(0, dtype='float32')
+        self.alive = alive if alive is not None else np.zeros(0, dtype=bool)
+        self.document_types: Dict[int, str] = document_types or {}
+        self.document_uploaders: Dict[int, int] = document_uploaders or {}
+        self.count = int(self.alive.sum())
+        self.average_length = float(self.lengths[self.alive].mean()) if self.count else 0.0
+
+
+class LexicalIndex:
+    """BM25 по фрагментам базы знаний; обновляется refresh() при новом поколении индекса"""
+
+    def __init__(self):
+        self._state = _State()
+        self._lock = threading.Lock()
+
+    def count(self) -> int:
+        return self._state.count
+
+    def refresh(self) -> None:
+        """Дочитывает новые фрагменты, помечает удаленные и обновляет типы и пользователей документов"""
+        with self._lock:
+            start_time = time.perf_counter()
+            state = self._state
+            last_pk = int(state.pks[-1]) if len(state.pks) else 0
+
+            new_chunks = (
+                DocumentChunk.objects.filter(pk__gt=last_pk).order_by('pk')
+                .values_list('pk', 'document_id', 'content').iterator(chunk_size=2000)
+            )
+            state = self._appended(state, new_chunks)
+            added = len(state.pks) - len(self._state.pks)
+
+            # Удаления видны по числу строк; полный список pk читается, только если они были
+            alive = state.alive
+            if DocumentChunk.objects.count() != int(alive.sum()):
+                existing = np.fromiter(DocumentChunk.objects.values_list('pk', flat=True).iterator(chunk_size=10000),
+                                       dtype='int64')
+                alive = alive & np.isin(state.pks, existing)
+            removed = int(state.alive.sum() - alive.sum())
+
+            documents = list(KnowledgeDocument.objects.values_list('id', 'document_type', 'uploaded_by_id'))
+            state = _State(state.postings, state.pks, state.documents, state.lengths, alive,
+                           {pk: document_type for pk, document_type, _ in documents},
+                           {pk: uploader or 0 for pk, _, uploader in documents})
+            if len(state.pks) and 1 - state.count / len(state.pks) > COMPACT_DEAD_RATIO:
+                state = self._compacted(state)
+            self._state = state
+
+            if added or removed:
+                print(f"Лексический индекс: +{added} / -{removed} фрагментов, всего {state.count} "
+                      f"({len(state.postings)} термов, {time.perf_counter() - start_time:.1f} с)")
+
+    @staticmethod
+    def _appended(state: _State, chunks: Iterable[Tuple[int, int, str]]) -> _State:
+        """Снимок с добавленными фрагментами; постинги неизменившихся термов общие с прежним"""
+        offset = len(state.pks)
+        pks, documents, lengths = [], [], []
+        rows: Dict[str, List[int]] = {}
+        frequencies: Dict[str, List[int]] = {}
+        for pk, document_id, content in chunks:
+            terms = analyze(content)
+            row = offset + len(pks)
+            pks.append(pk)
+            documents.append(document_id)
+            lengths.append(len(terms))
+            for term, frequency in Counter(terms).items():
+                rows.setdefault(term, []).append(row)
+                frequencies.setdefault(term, []).append(frequency)
+        if not pks:
+            return state
+
+        postings = dict(state.postings)
+        for term, term_rows in rows.items():
+            new_rows = np.array(term_rows, dtype='int32')
+            new_frequencies = np.array(frequencies[term], dtype='float32')
+            if term in postings:
+                old_rows, old_frequencies = postings[term]
+                new_rows = np.concatenate([old_rows, new_rows])
+                new_frequencies = np.concatenate([old_frequencies, new_frequencies])
+            postings[term] = (new_rows, new_frequencies)
+
+        return _State(
+            postings,
+            np.concatenate([state.pks, np.array(pks, dtype='int64')]),
+            np.concatenate([state.documents, np.array(documents, dtype='int64')]),
+            np.concatenate([state.lengths, np.array(lengths, dtype='float32')]),
+            np.concatenate([state.alive, np.ones(len(pks), dtype=bool)]),
+            state.document_types,
+            state.document_uploaders,
+        )
+
+    @staticmethod
+    def _compacted(state: _State) -> _State:
+        """Снимок без удаленных строк (номера строк сдвигаются, термы без строк уходят)"""
+        new_rows = np.cumsum(state.alive, dtype='int64') - 1
+        postings = {}
+        for term, (rows, frequencies) in state.postings.items():
+            keep = state.alive[rows]
+            if keep.any():
+                postings[term] = (new_rows[rows[keep]].astype('int32'), frequencies[keep])
+        alive = state.alive
+        return _State(postings, state.pks[alive], state.documents[alive], state.lengths[alive],
+                      np.ones(int(alive.sum()), dtype=bool), state.document_types, state.document_uploaders)
+
+    def search(self, query: str, k: int, document_types: Optional[List[str]] = None,
+               uploaders: Optional[List[int]] = None) -> List[Tuple[int, float]]:
+        """До k пар (pk фрагмента, оценка BM25) по убыванию оценки; фрагменты без слов запроса не попадают"""
+        state = self._state
+        if not state.count:
+            return []
+        scores = np.zeros(len(state.pks), dtype='float32')
+        for term in set(analyze(query)):
+            posting = state.postings.get(term)
+            if posting is None:
+                continue
+            rows, frequencies = posting
+            frequency = len(rows)
+            idf = math.log(1 + (state.count - frequency + 0.5) / (frequency + 0.5))
+            norm = K1 * (1 - B + B * state.lengths[rows] / state.average_length)
+            scores[rows] += idf * frequencies * (K1 + 1) / (frequencies + norm)
+
+        mask = state.alive & (scores > 0)
+        if document_types:
+            wanted = set(document_types)
+            allowed = [document_id for document_id, document_type in state.document_types.items()
+                       if document_type in wanted]
+            mask &= np.isin(state.documents, allowed)
+        if uploaders:
+            wanted = set(uploaders)
+            allowed = [document_id for document_id, uploader in state.document_uploaders.items() if uploader in wanted]
+            mask &= np.isin(state.documents, allowed)
+        return [(int(state.pks[row]), float(scores[row])) for row in top_k_rows(scores, k, mask) if mask[row]]
@@ -0,0 +1,150 @@
+import random
+import re
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from knowledge.chunker import ArticleChunker
+from knowledge.document_processor import DocumentProcessor
+from knowledge.models import KnowledgeDocument
+
+SENTENCES = [
+    'Работодатель обязан своевременно и в полном размере выплачивать работнику заработную плату',
+    'Трудовой договор заключается в письменной форме в двух экземплярах',
+    'Работник имеет право на отдых, включая ограничение рабочего времени',
+    'Споры между сторонами разрешаются в порядке, установленном настоящим Кодексом',
+    'Условия договора, ухудшающие положение работника, являются недействительными',
+    'Порядок применения настоящей статьи определяется Правительством Республики Таджикистан',
+]
+
+
+def legacy_split_into_chunks(text, chunk_size=500):
+    """Прежний алгоритм DocumentProcessor.split_into_chunks — эталон для сравнения"""
+
+    def clean(chunk):
+        chunk = re.sub(r'\s+', ' ', chunk)
+        chunk = re.sub(r'[^\w\s\.\,\;\:\!\?\-\(\)\[\]\"\'№]', '', chunk, flags=re.UNICODE)
+        return chunk.strip()
+
+    chunks = []
+    article_pattern = r'(Статья\s+\d+[^\n]*)'
+    articles = re.split(article_pattern, text, flags=re.IGNORECASE)
+
+    if len(articles) > 1:
+        current_chunk = ""
+        for part in articles:
+            if not part.strip():
+                continue
+            if re.match(article_pattern, part, re.IGNORECASE):
+                if current_chunk and len(current_chunk) > chunk_size:
+                    chunks.append(clean(current_chunk))
+                    current_chunk = part + " "
+                else:
+                    current_chunk += part + " "
+            else:
+                if len(current_chunk + part) > chunk_size:
+                    if current_chunk:
+                        chunks.append(clean(current_chunk))
+                    current_chunk = part
+                else:
+                    current_chunk += part
+        if current_chunk:
+            chunks.append(clean(current_chunk))
+    else:
+        current_chunk = ""
+        for sentence in re.split(r'[.!?]+', text):
+            sentence = sentence.strip()
+            if not sentence:
+                continue
+            if len(current_chunk + sentence) > chunk_size:
+                if current_chunk:
+                    chunks.append(clean(current_chunk))
+                current_chunk = sentence + ". "
+            else:
+                current_chunk += sentence + ". "
+        if current_chunk:
+            chunks.append(clean(current_chunk))
+
+    return [chunk for chunk in chunks if len(chunk.strip()) > 50]
+
+
+def synthetic_code(pages, seed=42):
+    """Текст кодекса: главы, статьи разной длины, маркеры страниц, ~3000 символов на страницу"""
+    rng = random.Random(seed)
+    parts = []
+    page, page_chars, article = 1, 0, 0
+    parts.append(f"\n--- Страница {page} ---\n")
+    while page <= pages:
+        if article % 20 == 0:
+            parts.append(f"Глава {article // 20 + 1}. Общие положения\n")
+        article += 1
+        body = []
+        for _ in range(rng.randint(2, 25)):
+            body.append(rng.choice(SENTENCES) + '.')
+        text = f"Статья {article}. Предмет регулирования\n" + "\n".join(body) + "\n"
+        parts.append(text)
+        page_chars += len(text)
+        while page_chars >= 3000 and page <= pages:
+            page += 1
+            page_chars -= 3000
+            parts.append(f"\n--- Страница {page} ---\n")
+    return "".join(parts)
+
+
+class Command(BaseCommand):
+    help = 'Микро-бенчмарк разбиения на фрагменты: прежний и однопроходный алгоритмы (фрагментов/сек)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--document-id', type=int, help='Текст загруженного документа')
+        parser.add_argument('--file', help='Путь к PDF файлу')
+        parser.add_argument('--pages', type=int, default=600, help='Размер синтетического кодекса в страницах')
+        parser.add_argument('--repeat', type=int, default=5, help='Число прогонов (берется лучший)')
+
+    def handle(self, *args, **options):
+        processor = DocumentProcessor()
+        if options['document_id']:
+            try:
+                document = KnowledgeDocument.objects.get(id=options['document_id'])
+            except KnowledgeDocument.DoesNotExist:
+                raise CommandError(f'Документ с ID {options["document_id"]} не найден')
+            text = processor.extract_text_from_pdf(document.file.path)
+        elif options['file']:
+            text = processor.extract_text_from_pdf(options['file'])
+        else:
+            text = synthetic_code(options['pages'])
+
+        if not text:
+            raise CommandError('Не удалось получить текст для бенчмарка')
+        self.stdout.write(f'Текст: {len(text)} символов')
+
+        chunk_size = processor.chunk_size
+        runs = [
+            ('Прежний', lambda: legacy_split_into_chunks(text, chunk_size)),
+            ('Однопроходный', lambda: ArticleChunker(chunk_size=chunk_size).split(text)),
+        ]
+        results = {}
+        for name, run in runs:
+            best = None
+            for _ in range(options['repeat']):
+                start_time = time.perf_counter()
+                chunks = run()
+                elapsed = time.perf_counter() - start_time
+                best = elapsed if best is None else min(best, elapsed)
+            results[name] = (chunks, best)
+            self.stdout.write(
+                f'{name}: {len(chunks)} фрагментов за {best * 1000:.1f} мс — '
+                f'{len(chunks) / best:.0f} фрагментов/сек, {len(text) / best / 1024 / 1024:.1f} МБ/сек'
+            )
+
+        legacy_time = results['Прежний'][1]
+        chunks, new_time = results['Однопроходный']
+        self.stdout.write(self.style.SUCCESS(f'Ускорение по времени: {legacy_time / new_time:.1f}x'))
+
+        if chunks:
+            with_article = sum(1 for chunk in chunks if chunk.articles)
+            with_page = sum(1 for chunk in chunks if chunk.page_start is not None)
+            with_chapter = sum(1 for chunk in chunks if chunk.chapter)
+            self.stdout.write(
+                f'Метаданные: статья — {with_article * 100 // len(chunks)}%, '
+                f'страница — {with_page * 100 // len(chunks)}%, глава — {with_chapter * 100 // len(chunks)}%'
+            )
@@ -0,0 +1,132 @@
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from knowledge import index_files
+from knowledge.models import KnowledgeDocument
+from knowledge.vector_store import MmapVectorStore, exact_top_k, normalize
+
+
+def build_partitioned_index(path: str, count: int, dimensions: int, uploaders: int, seed: int = 0) -> None:
+    """
+    Синтетическая база, разбитая на партиции (тип, пользователь), как после уплотнения.
+    Типы распределены неравномерно (первые — самые частые), pk перемешаны между партициями
+    """
+    rng = np.random.default_rng(seed)
+    type_names = [name for name, _ in KnowledgeDocument.DOCUMENT_TYPES]
+    type_weights = 1.0 / np.arange(1, len(type_names) + 1)
+    codes = np.sort(rng.choice(len(type_names), count, p=type_weights / type_weights.sum())).astype('uint8')
+    owners = rng.integers(1, uploaders + 1, count)
+    order = np.lexsort((owners, codes))
+    codes, owners = codes[order], owners[order]
+    partitions = index_files.partition_table(codes, owners)
+
+    ids = rng.permutation(count).astype('int64') + 1
+    for _, _, start, end in partitions:
+        ids[start:end].sort()
+
+    def blocks():
+        for start in range(0, count, 65536):
+            size = min(65536, count - start)
+            vectors = rng.standard_normal((size, dimensions), dtype='float32')
+            vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+            yield ids[start:start + size], vectors, codes[start:start + size]
+
+    os.makedirs(path, exist_ok=True)
+    written, _ = index_files.write_raw_base(path, 'base-000001', blocks())
+    index_files.write_row_order(path, 'base-000001', ids)
+    manifest = index_files.empty_manifest(2)
+    manifest.update({
+        'base': 'base-000001', 'base_format': 'raw', 'count': written,
+        'dimensions': dimensions, 'type_names': type_names, 'partitions': partitions,
+    })
+    index_files.write_manifest(path, manifest)
+
+
+def percentiles(latencies) -> tuple:
+    return float(np.percentile(latencies, 50)) * 1000, float(np.percentile(latencies, 99)) * 1000
+
+
+class Command(BaseCommand):
+    help = 'Задержка поиска с фильтром по типу документа и пользователю: партиции против полного перебора с маской'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes',
+            default='10000,100000,1000000',
+            help='Размеры синтетического индекса через запятую (фрагментов)',
+        )
+        parser.add_argument('--dimensions', type=int, default=768, help='Размерность векторов')
+        parser.add_argument('--uploaders', type=int, default=20, help='Число пользователей, загружавших документы')
+        parser.add_argument('--queries', type=int, default=50, help='Запросов на каждый фильтр')
+        parser.add_argument('-k', type=int, default=20, help='Результатов на запрос')
+        parser.add_argument('--path', help='Каталог для индекса (по умолчанию временный)')
+
+    def handle(self, *args, **options):
+        try:
+            sizes = [int(size) for size in options['sizes'].split(',')]
+        except ValueError:
+            raise CommandError('--sizes: ожидаются целые числа через запятую')
+
+        root = options['path'] or tempfile.mkdtemp(prefix='filtered_search_')
+        queries = normalize(np.random.default_rng(1).standard_normal((options['queries'], options['dimensions'])))
+        type_names = [name for name, _ in KnowledgeDocument.DOCUMENT_TYPES]
+        filters = [
+            ('без фильтра', None, None),
+            ('частый тип', [type_names[0]], None),
+            ('редкий тип', [type_names[-1]], None),
+            ('пользователь', None, [1]),
+            ('тип + польз.', [type_names[0]], [1]),
+        ]
+
+        self.stdout.write(f'{"Фрагментов":>10}  {"Фильтр":<14}{"Доля":>7}{"Маска p50":>11}{"p99":>8}'
+                          f'{"Партиции p50":>14}{"p99":>8}{"Ускорение":>11}')
+        try:
+            for size in sizes:
+                path = os.path.join(root, str(size))
+                build_partitioned_index(path, size, options['dimensions'], options['uploaders'])
+                store = MmapVectorStore(path)
+                # Прежний поиск: перебор всей базы и маска по типам и пользователям строк
+                row_uploaders = store._row_uploaders(np.arange(size))
+
+                for label, document_types, uploaders in filters:
+                    mask = None
+                    if document_types:
+                        codes = [type_names.index(name) for name in document_types]
+                        mask = np.isin(store.base_codes, codes)
+                    if uploaders:
+                        uploader_mask = np.isin(row_uploaders, uploaders)
+                        mask = uploader_mask if mask is None else mask & uploader_mask
+                    share = 1.0 if mask is None else float(mask.mean())
+
+                    scan, partitioned = [], []
+                    for query in queries:
+                        start_time = time.perf_counter()
+                        expected = exact_top_k(store.base_vectors, store.base_ids, None, query, options['k'], alive=mask)
+                        scan.append(time.perf_counter() - start_time)
+
+                        start_time = time.perf_counter()
+                        hits = store.search(query, options['k'], document_types, uploaders)
+                        partitioned.append(time.perf_counter() - start_time)
+                        if [pk for pk, _ in hits] != [pk for pk, _ in expected]:
+                            raise CommandError(f'Результаты с партициями и без расходятся ({label}, {size})')
+
+                    scan_p50, scan_p99 = percentiles(scan)
+                    part_p50, part_p99 = percentiles(partitioned)
+                    self.stdout.write(
+                        f'{size:>10}  {label:<14}{share:>7.1%}{scan_p50:>11.2f}{scan_p99:>8.2f}'
+                        f'{part_p50:>14.2f}{part_p99:>8.2f}{scan_p50 / part_p50:>10.1f}×'
+                    )
+                del store
+                shutil.rmtree(path)
+        finally:
+            if not options['path']:
+                shutil.rmtree(root, ignore_errors=True)
+
+        self.stdout.write('')
+        self.stdout.write('Задержки в мс. Маска — перебор всей базы с фильтром по строкам (как до разбиения), '
+                          'партиции — MmapVectorStore.search, читающий только строки нужных партиций.')
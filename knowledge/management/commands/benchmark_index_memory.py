@@ -0,0 +1,165 @@
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from knowledge import index_files
+from knowledge.models import KnowledgeDocument
+from knowledge.vector_store import FaissVectorStore, MmapVectorStore
+
+
+def read_memory() -> dict:
+    """Память процесса (КБ): RSS, анонимная (собственная) и файловая части, PSS"""
+    memory = {}
+    with open('/proc/self/status') as f:
+        for line in f:
+            key, _, value = line.partition(':')
+            if key in ('VmRSS', 'RssAnon', 'RssFile'):
+                memory[key] = int(value.split()[0])
+    with open('/proc/self/smaps_rollup') as f:
+        for line in f:
+            if line.startswith('Pss:'):
+                memory['Pss'] = int(line.split()[1])
+    return memory
+
+
+def build_index(path: str, count: int, dimensions: int, seed: int = 0) -> None:
+    """Синтетическая база в формате для mmap, записанная блоками (без копии индекса в памяти)"""
+    rng = np.random.default_rng(seed)
+    type_names = [name for name, _ in KnowledgeDocument.DOCUMENT_TYPES]
+
+    def blocks():
+        for start in range(0, count, 65536):
+            size = min(65536, count - start)
+            vectors = rng.standard_normal((size, dimensions), dtype='float32')
+            vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+            yield np.arange(start + 1, start + size + 1), vectors, rng.integers(0, len(type_names), size)
+
+    os.makedirs(path, exist_ok=True)
+    written, _ = index_files.write_raw_base(path, 'base-000001', blocks())
+    manifest = index_files.empty_manifest(2)
+    manifest.update({
+        'base': 'base-000001', 'base_format': 'raw', 'count': written,
+        'dimensions': dimensions, 'type_names': type_names,
+    })
+    index_files.write_manifest(path, manifest)
+
+
+def worker(mode, path, queries, barrier, results):
+    """Воркер как в gunicorn: открывает индекс, отвечает на запросы, сообщает память"""
+    before = read_memory()
+    start_time = time.perf_counter()
+    store = MmapVectorStore(path) if mode == 'mmap' else FaissVectorStore(path)
+    load_seconds = time.perf_counter() - start_time
+
+    latencies = []
+    for query in queries:
+        start_time = time.perf_counter()
+        store.search(query, 5)
+        latencies.append(time.perf_counter() - start_time)
+
+    # Замер, когда все воркеры держат индекс открытым: PSS делит общие страницы между ними
+    barrier.wait()
+    after = read_memory()
+    results.put({
+        'rss': after['VmRSS'],
+        'private': after['RssAnon'] - before['RssAnon'],
+        'shared': after['RssFile'] - before['RssFile'],
+        'pss': after['Pss'],
+        'load': load_seconds,
+        'p50': float(np.percentile(latencies, 50)),
+    })
+    barrier.wait()
+
+
+class Command(BaseCommand):
+    help = 'Память воркеров (RSS/PSS) при поиске по индексу FAISS: в памяти процесса и через mmap'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes',
+            default='100000,1000000',
+            help='Размеры синтетического индекса через запятую (фрагментов)',
+        )
+        parser.add_argument('--dimensions', type=int, default=768, help='Размерность векторов')
+        parser.add_argument('--workers', type=int, default=3, help='Число воркеров (как gunicorn --workers)')
+        parser.add_argument('--queries', type=int, default=20, help='Запросов на воркер')
+        parser.add_argument('--path', help='Каталог для индекса (по умолчанию временный)')
+
+    def handle(self, *args, **options):
+        if not os.path.exists('/proc/self/smaps_rollup'):
+            raise CommandError('Замер памяти поддерживается только на Linux')
+        try:
+            sizes = [int(size) for size in options['sizes'].split(',')]
+        except ValueError:
+            raise CommandError('--sizes: ожидаются целые числа через запятую')
+
+        root = options['path'] or tempfile.mkdtemp(prefix='index_memory_')
+        queries = np.random.default_rng(1).standard_normal((options['queries'], options['dimensions']), dtype='float32')
+        context = multiprocessing.get_context('fork')
+
+        self.stdout.write(f'{"Режим":<8}{"Фрагментов":>12}{"Воркеров":>10}{"RSS, МБ":>10}'
+                          f'{"Свое, МБ":>10}{"Общее, МБ":>11}{"PSS, МБ":>10}{"Загрузка, с":>13}{"p50, мс":>10}')
+        try:
+            for size in sizes:
+                path = os.path.join(root, str(size))
+                build_index(path, size, options['dimensions'])
+                index_bytes = size * options['dimensions'] * 4
+
+                for mode in ('memory', 'mmap'):
+                    workers = options['workers']
+                    if mode == 'memory':
+                        # Каждый воркер держит свою копию (векторы и словарь типов):
+                        # запускаем столько, сколько помещается
+                        worker_bytes = int(index_bytes * 1.15)
+                        workers = min(workers, int(self.available_bytes() * 0.9 // worker_bytes))
+                        if workers < 1:
+                            self.stdout.write(f'{mode:<8}{size:>12}  не помещается в память '
+                                              f'(нужно ~{worker_bytes // 2**20} МБ на воркер)')
+                            continue
+
+                    results = self.run_workers(context, mode, path, queries, workers)
+                    self.stdout.write(
+                        f'{mode:<8}{size:>12}{workers:>10}'
+                        f'{np.mean([r["rss"] for r in results]) / 1024:>10.0f}'
+                        f'{np.mean([r["private"] for r in results]) / 1024:>10.0f}'
+                        f'{np.mean([r["shared"] for r in results]) / 1024:>11.0f}'
+                        f'{np.mean([r["pss"] for r in results]) / 1024:>10.0f}'
+                        f'{np.mean([r["load"] for r in results]):>13.2f}'
+                        f'{np.mean([r["p50"] for r in results]) * 1000:>10.1f}'
+                    )
+                shutil.rmtree(path)
+        finally:
+            if not options['path']:
+                shutil.rmtree(root, ignore_errors=True)
+
+        self.stdout.write('')
+        self.stdout.write('Свое — анонимная память воркера, общее — страницы файла индекса (кэш ОС, '
+                          'одни на всех), PSS — доля воркера с учетом общих страниц.')
+
+    @staticmethod
+    def run_workers(context, mode, path, queries, workers):
+        barrier = context.Barrier(workers)
+        results = context.Queue()
+        processes = [
+            context.Process(target=worker, args=(mode, path, queries, barrier, results))
+            for _ in range(workers)
+        ]
+        for process in processes:
+            process.start()
+        collected = [results.get() for _ in processes]
+        for process in processes:
+            process.join()
+        return collected
+
+    @staticmethod
+    def available_bytes() -> int:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+        return 0
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+from knowledge.embedding_cache import EmbeddingCache
+from knowledge.models import EmbeddingCacheEntry
+
+
+class Command(BaseCommand):
+    help = 'Статистика и обслуживание кэша эмбеддингов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--evict',
+            action='store_true',
+            help='Вытеснить записи сверх EMBEDDING_CACHE_MAX_MB',
+        )
+        parser.add_argument(
+            '--clear',
+            action='store_true',
+            help='Полностью очистить кэш',
+        )
+
+    def handle(self, *args, **options):
+        cache = EmbeddingCache()
+
+        if options['clear']:
+            deleted = EmbeddingCacheEntry.objects.all().delete()[0]
+            self.stdout.write(self.style.SUCCESS(f'Удалено записей: {deleted}'))
+            return
+
+        if options['evict']:
+            deleted = cache.evict()
+            self.stdout.write(self.style.SUCCESS(f'Вытеснено записей: {deleted}'))
+
+        stats = cache.storage_stats()
+        self.stdout.write(f'Записей: {stats["entries"]}')
+        self.stdout.write(
+            f'Размер: {stats["size_bytes"] / 1024 / 1024:.1f} МБ из {cache.max_bytes / 1024 / 1024:.0f} МБ'
+        )
+        self.stdout.write(f'Попаданий (всего, по записям): {stats["total_hits"]}')
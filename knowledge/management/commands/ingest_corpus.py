@@ -0,0 +1,265 @@
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+from django.contrib.auth import get_user_model
+from django.core.files import File
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connection
+
+from knowledge.embedding_cache import EmbeddingCache
+from knowledge.embedding_engine import BatchEmbeddingEngine
+from knowledge.ingestion_queue import (
+    claim_job,
+    default_worker_id,
+    enqueue_document,
+    execute_job,
+    fail_exhausted_jobs,
+    release_jobs,
+)
+from knowledge.models import IngestionJob, KnowledgeDocument
+
+CHECKPOINT_NAME = '.ingest_checkpoint.json'
+
+
+class Checkpoint:
+    """
+    Состояние загрузки каталога в JSON-файле: путь PDF → документ и статус.
+    Файл перезаписывается атомарно (через временный файл), поэтому падение
+    процесса в момент записи не портит уже сохраненный прогресс.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.data = {'run_id': None, 'documents': {}}
+        if path.exists():
+            with open(path, encoding='utf-8') as f:
+                self.data = json.load(f)
+
+    @property
+    def documents(self) -> dict:
+        return self.data['documents']
+
+    def update(self, key: str, **values) -> None:
+        with self.lock:
+            self.documents.setdefault(key, {}).update(values)
+
+    def save(self) -> None:
+        with self.lock:
+            tmp_path = self.path.with_name(self.path.name + '.tmp')
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.data, f, ensure_ascii=False, indent=1)
+            os.replace(tmp_path, self.path)
+
+
+class Command(BaseCommand):
+    help = 'Пакетная загрузка каталога PDF в базу знаний с возобновлением после сбоя'
+
+    def add_arguments(self, parser):
+        parser.add_argument('directory', help='Каталог с PDF (обходится рекурсивно)')
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=2,
+            help='Количество параллельных потоков обработки',
+        )
+        parser.add_argument(
+            '--document-type',
+            default='other',
+            choices=[choice for choice, _ in KnowledgeDocument.DOCUMENT_TYPES],
+            help='Тип для новых документов',
+        )
+        parser.add_argument('--user', help='Имя пользователя, от которого загружаются документы')
+        parser.add_argument(
+            '--checkpoint',
+            help=f'Файл контрольной точки (по умолчанию <directory>/{CHECKPOINT_NAME})',
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=2.0,
+            help='Пауза (сек), пока задания ждут повтора',
+        )
+
+    def handle(self, *args, **options):
+        root = Path(options['directory']).resolve()
+        if not root.is_dir():
+            raise CommandError(f'Каталог не найден: {root}')
+
+        user = None
+        if options['user']:
+            try:
+                user = get_user_model().objects.get(username=options['user'])
+            except get_user_model().DoesNotExist:
+                raise CommandError(f'Пользователь не найден: {options["user"]}')
+
+        checkpoint = Checkpoint(Path(options['checkpoint']) if options['checkpoint'] else root / CHECKPOINT_NAME)
+        self.run_id = f'ingest_corpus:{default_worker_id()}'
+
+        files = sorted(path for path in root.rglob('*') if path.is_file() and path.suffix.lower() == '.pdf')
+        self.stdout.write(f'Найдено PDF: {len(files)}')
+
+        pending, skipped = self.register(files, root, checkpoint, options['document_type'], user)
+        self.stdout.write(f'К обработке: {len(pending)}, пропущено (уже готовы): {skipped}')
+        if not pending:
+            return
+
+        # Задания, захваченные прошлым запуском, который не дожил до конца
+        previous_run = checkpoint.data.get('run_id')
+        if previous_run and previous_run != self.run_id:
+            released = release_jobs(pending.values(), previous_run)
+            if released:
+                self.stdout.write(f'Возвращено в очередь заданий прошлого запуска: {released}')
+        checkpoint.data['run_id'] = self.run_id
+        checkpoint.save()
+
+        self.checkpoint = checkpoint
+        self.keys = {document_id: key for key, document_id in pending.items()}
+        self.totals = {'done': 0, 'failed': 0, 'pages': 0, 'chunks': 0}
+        self.totals_lock = threading.Lock()
+        self.poll_interval = options['poll_interval']
+        embed_before = BatchEmbeddingEngine.stats()
+        cache_before = EmbeddingCache.stats()
+        start_time = time.time()
+
+        workers = max(1, options['workers'])
+        threads = [
+            threading.Thread(target=self.worker_loop, args=(f'{self.run_id}:{n}',), daemon=True)
+            for n in range(workers)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        elapsed = time.time() - start_time
+        embed_after = BatchEmbeddingEngine.stats()
+        cache_after = EmbeddingCache.stats()
+        self.print_summary(
+            elapsed,
+            embed_calls=embed_after['requests'] - embed_before['requests'],
+            embed_retries=embed_after['retries'] - embed_before['retries'],
+            cache_hits=cache_after['hits'] - cache_before['hits'],
+        )
+
+    def register(self, files, root, checkpoint, document_type, user):
+        """Регистрация PDF как документов; возвращает {путь: id документа} к обработке и число пропущенных"""
+        pending = {}
+        skipped = 0
+        for n, path in enumerate(files, 1):
+            key = str(path.relative_to(root))
+            stat = path.stat()
+            entry = checkpoint.documents.get(key, {})
+            unchanged = entry.get('size') == stat.st_size and entry.get('mtime') == stat.st_mtime
+            document = KnowledgeDocument.objects.filter(pk=entry.get('document_id')).first()
+
+            if document and unchanged and entry.get('status') == 'done' and document.status == 'ready':
+                skipped += 1
+                continue
+
+            if document is None:
+                document = KnowledgeDocument(title=path.stem[:255], document_type=document_type, uploaded_by=user)
+                with open(path, 'rb') as f:
+                    # Сохранение создает документ, сигнал ставит его в очередь
+                    document.file.save(path.name, File(f), save=True)
+            elif not unchanged:
+                # Файл изменился с прошлого запуска — заменяем копию в хранилище
+                document.file.delete(save=False)
+                with open(path, 'rb') as f:
+                    document.file.save(path.name, File(f), save=True)
+
+            enqueue_document(document)
+            checkpoint.update(key, document_id=document.pk, size=stat.st_size, mtime=stat.st_mtime, status='pending')
+            pending[key] = document.pk
+            if n % 50 == 0:
+                checkpoint.save()
+
+        checkpoint.save()
+        return pending, skipped
+
+    def has_active_jobs(self) -> bool:
+        return IngestionJob.objects.filter(
+            document_id__in=list(self.keys),
+            status__in=['pending', 'running'],
+        ).exists()
+
+    def worker_loop(self, worker_id: str):
+        try:
+            while True:
+                close_old_connections()
+                fail_exhausted_jobs()
+
+                job = claim_job(worker_id, document_ids=self.keys)
+                if job is None:
+                    # Оставшиеся задания ждут повтора или обрабатываются другими потоками
+                    if not self.has_active_jobs():
+                        return
+                    time.sleep(self.poll_interval)
+                    continue
+
+                self.process_job(job, worker_id)
+        finally:
+            connection.close()
+
+    def process_job(self, job, worker_id: str):
+        document = job.document
+        self.stdout.write(f'[{worker_id}] {document.title} (попытка {job.attempts})')
+        start_time = time.time()
+
+        error = execute_job(job, worker_id)
+        elapsed = time.time() - start_time
+        document.refresh_from_db()
+        job.refresh_from_db(fields=['status'])
+
+        if error is None:
+            status = 'done'
+        elif job.status == 'failed':
+            status = 'failed'
+        else:
+            # Задание уйдет на повтор — документ остается в контрольной точке как незавершенный
+            status = 'pending'
+
+        key = self.keys[document.pk]
+        self.checkpoint.update(
+            key,
+            status=status,
+            pages=document.pages_total,
+            chunks=document.total_chunks,
+            seconds=round(elapsed, 2),
+            error=error or '',
+        )
+        self.checkpoint.save()
+
+        with self.totals_lock:
+            if status == 'done':
+                self.totals['done'] += 1
+                self.totals['pages'] += document.pages_total
+                self.totals['chunks'] += document.total_chunks
+            elif status == 'failed':
+                self.totals['failed'] += 1
+
+        if error:
+            self.stdout.write(self.style.ERROR(f'[{worker_id}] ✗ {document.title}: {error}'))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f'[{worker_id}] ✓ {document.title}: {document.pages_total} стр., '
+                f'{document.total_chunks} фрагм. за {elapsed:.1f} сек'
+            ))
+
+    def print_summary(self, elapsed: float, embed_calls: int, embed_retries: int, cache_hits: int):
+        totals = self.totals
+        elapsed = max(elapsed, 1e-9)
+        self.stdout.write('')
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово: {totals["done"]}, с ошибкой: {totals["failed"]}, за {elapsed:.1f} сек'
+        ))
+        self.stdout.write(f'Документов/мин: {totals["done"] / elapsed * 60:.2f}')
+        self.stdout.write(f'Страниц/сек: {totals["pages"] / elapsed:.1f} (всего {totals["pages"]})')
+        self.stdout.write(f'Фрагментов/сек: {totals["chunks"] / elapsed:.1f} (всего {totals["chunks"]})')
+        self.stdout.write(
+            f'Запросов к API эмбеддингов: {embed_calls} (повторов: {embed_retries}, '
+            f'взято из кэша: {cache_hits} текстов)'
+        )
@@ -0,0 +1,123 @@
+import signal
+import threading
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connection
+
+from knowledge.ingestion_queue import (
+    claim_job,
+    default_worker_id,
+    execute_job,
+    fail_exhausted_jobs,
+)
+
+# Предел паузы (сек) после ошибок подряд, например недоступной или заблокированной БД
+MAX_ERROR_BACKOFF = 60.0
+
+
+class Command(BaseCommand):
+    help = 'Воркер очереди индексации документов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=1,
+            help='Количество параллельных потоков обработки',
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=5.0,
+            help='Пауза (сек) между опросами пустой очереди',
+        )
+        parser.add_argument(
+            '--burst',
+            action='store_true',
+            help='Завершиться, когда очередь опустеет',
+        )
+
+    def handle(self, *args, **options):
+        concurrency = max(1, options['concurrency'])
+        self.poll_interval = options['poll_interval']
+        self.burst = options['burst']
+        self.stop_event = threading.Event()
+        self.finished = set()
+
+        # SIGTERM (остановка контейнера) — как Ctrl+C: текущие задания дорабатываются
+        signal.signal(signal.SIGTERM, self.request_stop)
+
+        base_id = default_worker_id()
+        self.stdout.write(f'Запуск воркера {base_id} с {concurrency} потоками')
+
+        threads = []
+        for n in range(concurrency):
+            thread = threading.Thread(
+                target=self.worker_loop,
+                args=(f'{base_id}:{n}',),
+                daemon=True,
+            )
+            thread.start()
+            threads.append(thread)
+
+        try:
+            while any(thread.is_alive() for thread in threads):
+                for thread in threads:
+                    thread.join(timeout=1)
+        except KeyboardInterrupt:
+            self.request_stop()
+            for thread in threads:
+                thread.join()
+
+        if len(self.finished) < len(threads):
+            raise CommandError(f'Потоков завершилось аварийно: {len(threads) - len(self.finished)}')
+        self.stdout.write(self.style.SUCCESS('Воркер остановлен'))
+
+    def request_stop(self, *args):
+        if not self.stop_event.is_set():
+            self.stdout.write('Остановка: дожидаемся завершения текущих заданий...')
+            self.stop_event.set()
+
+    def worker_loop(self, worker_id: str):
+        initial_backoff = max(self.poll_interval, 1.0)
+        backoff = initial_backoff
+        try:
+            while not self.stop_event.is_set():
+                try:
+                    close_old_connections()
+                    fail_exhausted_jobs()
+
+                    job = claim_job(worker_id)
+                    if job is None:
+                        if self.burst:
+                            break
+                        self.stop_event.wait(self.poll_interval)
+                        continue
+
+                    self.process_job(job, worker_id)
+                except Exception as e:
+                    # Захваченное задание вернется в очередь по истечении аренды
+                    self.stderr.write(self.style.ERROR(f'[{worker_id}] Ошибка: {e}; повтор через {backoff:.0f} сек'))
+                    connection.close()
+                    self.stop_event.wait(backoff)
+                    backoff = min(backoff * 2, MAX_ERROR_BACKOFF)
+                else:
+                    backoff = initial_backoff
+            self.finished.add(worker_id)
+        finally:
+            connection.close()
+
+    def process_job(self, job, worker_id: str):
+        self.stdout.write(f'[{worker_id}] Задание {job.pk}: {job.document.title} (попытка {job.attempts})')
+        start_time = time.time()
+
+        error = execute_job(job, worker_id)
+        if error:
+            self.stdout.write(
+                self.style.ERROR(f'[{worker_id}] ✗ Задание {job.pk}: {error}')
+            )
+        else:
+            self.stdout.write(
+                self.style.SUCCESS(f'[{worker_id}] ✓ Задание {job.pk} за {time.time() - start_time:.2f} сек')
+            )
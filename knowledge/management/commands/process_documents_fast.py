@@ -1,6 +1,7 @@
 from django.core.management.base import BaseCommand
 from django.db import transaction
-from knowledge.models import KnowledgeDocument, DocumentChunk
+from knowledge.models import KnowledgeDocument
+from knowledge.chunk_writer import ChunkWriter
 from knowledge.document_processor import DocumentProcessor
 import time
 
@@ -92,17 +93,12 @@ class Command(BaseCommand):
                 document.chunks.all().delete()
                 
                 # Сохраняем новые фрагменты
-                for i, chunk_text in enumerate(chunks):
-                    if len(chunk_text.strip()) > 20:  # Минимальная длина
-                        DocumentChunk.objects.create(
-                            document=document,
-                            content=chunk_text,
-                            chunk_index=i,
-                            chroma_id=f"{document.id}_{i}"
-                        )
+                writer = ChunkWriter(document)
+                writer.write([chunk_text for chunk_text in chunks if len(chunk_text.strip()) > 20])  # Минимальная длина
+                self.stdout.write(writer.report())
                 
                 # Обновляем статус документа
-                document.total_chunks = len(chunks)
+                document.total_chunks = writer.rows_written
                 document.status = 'ready'
                 document.save()
                 
@@ -0,0 +1,333 @@
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from knowledge.vector_store import (
+    CHROMADB_AVAILABLE,
+    FAISS_AVAILABLE,
+    ann_config,
+    chroma_collection_metadata,
+    get_vector_store,
+    top_k_rows,
+)
+
+if FAISS_AVAILABLE:
+    import faiss
+
+    from knowledge import ann
+
+if CHROMADB_AVAILABLE:
+    import chromadb
+    from chromadb.config import Settings
+
+
+def parse_ints(value: str, option: str) -> list:
+    try:
+        return [int(item) for item in value.split(',') if item.strip()]
+    except ValueError:
+        raise CommandError(f'{option}: ожидаются целые числа через запятую')
+
+
+class Command(BaseCommand):
+    help = ('Подбор типа, параметров и сжатия индекса на фрагментах из хранилища: '
+            'recall@k относительно точного поиска, задержка запроса p50/p99 и размер индекса')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--backend', help='Откуда взять векторы (по умолчанию VECTOR_STORE_BACKEND)')
+        parser.add_argument('--k', type=int, default=10, help='Сколько ближайших сравнивать (recall@k)')
+        parser.add_argument('--queries', type=int, default=200, help='Число запросов (случайные фрагменты корпуса)')
+        parser.add_argument('--sample', type=int, default=0, help='Взять не больше N векторов (0 — все)')
+        parser.add_argument('--hnsw-m', default='16,32', help='HNSW: значения M')
+        parser.add_argument('--ef-construction', default='200', help='HNSW: значения efConstruction')
+        parser.add_argument('--ef-search', default='16,32,64,128,256', help='HNSW: значения efSearch')
+        parser.add_argument('--nlist', default='', help='IVF: значения nlist (по умолчанию — вокруг 4·√N)')
+        parser.add_argument('--nprobe', default='1,4,16,64', help='IVF: значения nprobe')
+        parser.add_argument(
+            '--compression',
+            default='none',
+            help='Сжатие векторов через запятую: none, float16, int8, pca (каждое — со всеми типами индекса)',
+        )
+        parser.add_argument(
+            '--pca-dimensions',
+            default=str(getattr(settings, 'FAISS_PCA_DIMENSIONS', 256)),
+            help='PCA: значения размерности',
+        )
+        parser.add_argument(
+            '--rescore-factor',
+            type=int,
+            default=getattr(settings, 'FAISS_RESCORE_FACTOR', 4),
+            help='Сжатые индексы: пересчитывать по полным векторам k × фактор кандидатов',
+        )
+        parser.add_argument(
+            '--chroma',
+            action='store_true',
+            help='Также перебрать HNSW ChromaDB (коллекция в памяти на каждое сочетание M и search_ef)',
+        )
+        parser.add_argument('--chroma-m', default='16,32', help='ChromaDB: значения hnsw:M')
+        parser.add_argument('--chroma-search-ef', default='10,50,100', help='ChromaDB: значения hnsw:search_ef')
+        parser.add_argument('--target-recall', type=float, default=0.95, help='Порог recall@k для рекомендации')
+
+    def handle(self, *args, **options):
+        if not FAISS_AVAILABLE:
+            raise CommandError('Для подбора нужна библиотека FAISS: pip install faiss-cpu')
+        if options['chroma'] and not CHROMADB_AVAILABLE:
+            raise CommandError('Для --chroma нужна библиотека ChromaDB: pip install chromadb')
+        compressions = [item.strip() for item in options['compression'].split(',') if item.strip()]
+        unknown = set(compressions) - set(ann.COMPRESSIONS)
+        if unknown:
+            raise CommandError(f'--compression: неизвестное сжатие {", ".join(sorted(unknown))}')
+
+        self.backend = options['backend'] or getattr(settings, 'VECTOR_STORE_BACKEND', 'chroma')
+        store = get_vector_store(options['backend'])
+        if store is None:
+            raise CommandError('Библиотека векторного хранилища не установлена')
+        _, vectors = store.vectors()
+        rng = np.random.default_rng(0)
+        if options['sample'] and len(vectors) > options['sample']:
+            vectors = vectors[np.sort(rng.choice(len(vectors), options['sample'], replace=False))]
+        k = options['k']
+        if len(vectors) <= k:
+            raise CommandError(f'В хранилище {len(vectors)} векторов — нужно больше, чем k={k}')
+
+        # Индексы строятся с id = номер строки; запросы — векторы самих фрагментов,
+        # совпадение с собой из ответа исключается
+        self.vectors = np.ascontiguousarray(vectors, dtype='float32')
+        self.rows = np.arange(len(vectors), dtype='int64')
+        query_rows = rng.choice(len(vectors), min(options['queries'], len(vectors)), replace=False)
+        self.queries = self.vectors[query_rows]
+        self.query_rows = query_rows
+        self.k = k
+        self.rescore_factor = options['rescore_factor']
+        self.truth = self.exact_neighbours()
+        self.config = ann_config()
+        self.stdout.write(f'Векторов: {len(vectors)} × {vectors.shape[1]}, запросов: {len(query_rows)}, k={k}')
+        self.stdout.write('')
+        self.stdout.write(f'{"Индекс":<8}{"Параметры":<52}{"Построение, с":>15}{"Размер, МБ":>12}{"Экономия":>10}'
+                          f'{"recall@" + str(k):>11}{"p50, мс":>10}{"p99, мс":>10}')
+
+        self.results = []
+        self.tmp_dir = tempfile.mkdtemp(prefix='tune_index_')
+        try:
+            for extra in self.compression_variants(compressions, options):
+                self.sweep_flat(extra)
+                self.sweep_hnsw(extra, options)
+                self.sweep_ivf(extra, options)
+            if options['chroma']:
+                self.sweep_chroma(options)
+        finally:
+            shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+        self.stdout.write('')
+        self.stdout.write('* — текущие настройки. Задержка — один запрос без фильтра, без учета mmap и кэша ОС.')
+        self.stdout.write('Экономия — размер индекса поиска против матрицы float32; при сжатии полные векторы '
+                          'остаются на диске для пересчета (rescore) и читаются из mmap точечно.')
+        self.recommend(options['target_recall'])
+
+    def compression_variants(self, compressions, options) -> list:
+        """Параметры сжатия для build_params каждого типа индекса"""
+        variants = []
+        for compression in compressions:
+            if compression == 'pca':
+                for dimensions in parse_ints(options['pca_dimensions'], '--pca-dimensions'):
+                    if dimensions < self.vectors.shape[1]:
+                        variants.append({'compression': 'pca', 'pca_dimensions': dimensions})
+            else:
+                variants.append({'compression': compression})
+        return variants
+
+    def exact_neighbours(self) -> list:
+        truth = []
+        for start in range(0, len(self.queries), 256):
+            scores = self.queries[start:start + 256] @ self.vectors.T
+            for query_row, rows in zip(self.query_rows[start:start + 256], top_k_rows(scores, self.k + 1)):
+                truth.append(set([row for row in rows.tolist() if row != query_row][:self.k]))
+        return truth
+
+    def measure(self, kind, params, search_params, build_seconds, size_bytes, search, rescore=0):
+        """search(запрос 1×D, n) → (номера строк, оценки) ближайших по убыванию сходства"""
+        latencies, recalls = [], []
+        wanted = self.k + 1
+        for query, query_row, truth in zip(self.queries, self.query_rows, self.truth):
+            start_time = time.perf_counter()
+            rows, _ = search(query[None], wanted * rescore if rescore else wanted)
+            if rescore:
+                rows, _ = ann.rescore(self.vectors, rows, query, wanted)
+            latencies.append(time.perf_counter() - start_time)
+            found = [row for row in rows.tolist() if row != query_row][:self.k]
+            recalls.append(len(truth.intersection(found)) / len(truth))
+
+        result = {
+            'kind': kind,
+            'params': params,
+            'search': search_params,
+            'rescore': rescore,
+            'size': size_bytes,
+            'recall': float(np.mean(recalls)),
+            'p50': float(np.percentile(latencies, 50)) * 1000,
+            'p99': float(np.percentile(latencies, 99)) * 1000,
+        }
+        self.results.append(result)
+
+        label = ' '.join(
+            [f'{key}={value}' for key, value in params.items() if key not in ('compression', 'dimensions')]
+            + ([self.compression_label(params)] if 'compression' in params else [])
+            + [f'{key}={value}' for key, value in search_params.items()]
+            + ([f'rescore={rescore}'] if 'compression' in params else [])
+        ) or 'точный'
+        label += ' *' if self.is_current(result) else ''
+        if size_bytes is None:
+            size, saved = '—', '—'
+        else:
+            size, saved = f'{size_bytes / 2**20:.1f}', f'{1 - size_bytes / self.vectors.nbytes:.0%}'
+        self.stdout.write(f'{kind:<8}{label:<52}{build_seconds:>15.2f}{size:>12}{saved:>10}'
+                          f'{result["recall"]:>11.3f}{result["p50"]:>10.2f}{result["p99"]:>10.2f}')
+
+    @staticmethod
+    def compression_label(params) -> str:
+        return params['compression'] + str(params.get('dimensions', ''))
+
+    def is_current(self, result) -> bool:
+        config = self.config
+        if result['kind'] == 'chroma':
+            configured = chroma_collection_metadata()
+            return self.backend == 'chroma' and all(
+                configured[f'hnsw:{key}'] == value for key, value in result['params'].items()
+            )
+        if self.backend != 'faiss' or result['kind'] != config['type']:
+            return False
+        configured = dict(config['params'])
+        if configured.get('nlist') == 0:
+            configured['nlist'] = min(ann.default_nlist(len(self.vectors)), len(self.vectors))
+        search = {key: value for key, value in config['search'].items() if key in result['search']}
+        return configured == result['params'] and search == result['search'] and config['rescore'] == result['rescore']
+
+    def measure_faiss(self, kind, params, search_params, build_seconds, index, size=None):
+        size = size or self.index_size(index)
+
+        def search(query, n):
+            scores, rows = index.search(query, n)
+            found = rows[0] >= 0
+            return rows[0][found], scores[0][found]
+
+        self.measure(kind, params, search_params, build_seconds, size, search)
+        if 'compression' in params and self.rescore_factor:
+            self.measure(kind, params, search_params, build_seconds, size, search, self.rescore_factor)
+
+    def build(self, index_type, params):
+        start_time = time.perf_counter()
+        index = ann.build_index(self.vectors, self.rows, index_type, params)
+        return index, time.perf_counter() - start_time
+
+    def index_size(self, index) -> int:
+        path = os.path.join(self.tmp_dir, 'index' + ann.ANN_SUFFIX)
+        faiss.write_index(index, path)
+        size = os.path.getsize(path)
+        os.remove(path)
+        return size
+
+    def sweep_flat(self, extra):
+        params = ann.build_params('flat', **extra)
+        if params:
+            index, build_seconds = self.build('flat', params)
+        else:
+            start_time = time.perf_counter()
+            index = faiss.IndexIDMap(faiss.IndexFlatIP(self.vectors.shape[1]))
+            index.add_with_ids(self.vectors, self.rows)
+            build_seconds = time.perf_counter() - start_time
+        # Точный поиск идет по самой базе — размер индекса равен матрице векторов
+        self.measure_faiss('flat', params, {}, build_seconds, index, None if params else self.vectors.nbytes)
+
+    def sweep_hnsw(self, extra, options):
+        for m in parse_ints(options['hnsw_m'], '--hnsw-m'):
+            for ef_construction in parse_ints(options['ef_construction'], '--ef-construction'):
+                params = ann.build_params('hnsw', hnsw_m=m, ef_construction=ef_construction, **extra)
+                index, build_seconds = self.build('hnsw', params)
+                for ef_search in parse_ints(options['ef_search'], '--ef-search'):
+                    ann.set_search_params(index, ef_search=ef_search)
+                    self.measure_faiss('hnsw', params, {'ef_search': ef_search}, build_seconds, index)
+                del index
+
+    def sweep_ivf(self, extra, options):
+        if options['nlist']:
+            nlists = parse_ints(options['nlist'], '--nlist')
+        else:
+            auto = ann.default_nlist(len(self.vectors))
+            nlists = sorted({max(1, auto // 2), auto, min(auto * 2, max(1, len(self.vectors) // 39))})
+        for nlist in nlists:
+            params = ann.build_params('ivf', nlist=nlist, **extra)
+            index, build_seconds = self.build('ivf', params)
+            for nprobe in parse_ints(options['nprobe'], '--nprobe'):
+                if nprobe > nlist:
+                    continue
+                ann.set_search_params(index, nprobe=nprobe)
+                self.measure_faiss('ivf', params, {'nprobe': nprobe}, build_seconds, index)
+            del index
+
+    def sweep_chroma(self, options):
+        client = chromadb.EphemeralClient(settings=Settings(anonymized_telemetry=False))
+        construction_ef = chroma_collection_metadata()['hnsw:construction_ef']
+        str_ids = [str(row) for row in self.rows.tolist()]
+        for m in parse_ints(options['chroma_m'], '--chroma-m'):
+            for search_ef in parse_ints(options['chroma_search_ef'], '--chroma-search-ef'):
+                # search_ef ChromaDB тоже фиксируется при создании коллекции — на каждое значение своя
+                params = {'M': m, 'construction_ef': construction_ef, 'search_ef': search_ef}
+                start_time = time.perf_counter()
+                collection = client.create_collection(
+                    'tune_index', metadata={f'hnsw:{key}': value for key, value in params.items()}
+                )
+                for start in range(0, len(str_ids), 5000):
+                    collection.add(ids=str_ids[start:start + 5000],
+                                   embeddings=self.vectors[start:start + 5000].tolist())
+                build_seconds = time.perf_counter() - start_time
+
+                def search(query, n, collection=collection):
+                    result = collection.query(query_embeddings=query.tolist(), n_results=n, include=['distances'])
+                    return np.array(result['ids'][0], dtype='int64'), 1 - np.array(result['distances'][0]) / 2
+
+                self.measure('chroma', params, {}, build_seconds, None, search)
+                client.delete_collection('tune_index')
+
+    def recommend(self, target_recall: float):
+        suitable = [result for result in self.results if result['recall'] >= target_recall]
+        if not suitable:
+            self.stdout.write(self.style.WARNING(
+                f'Ни одна конфигурация не дает recall@{self.k} ≥ {target_recall}: оставьте FAISS_INDEX_TYPE=flat'
+            ))
+            return
+        fastest = min(suitable, key=lambda result: result['p50'])
+        self.print_choice(f'Самая быстрая конфигурация с recall@{self.k} ≥ {target_recall}', fastest)
+        sized = [result for result in suitable if result['size'] is not None]
+        smallest = min(sized, key=lambda result: (result['size'], result['p50'])) if sized else None
+        if smallest is not None and smallest is not fastest:
+            self.print_choice(f'Самый компактный индекс с recall@{self.k} ≥ {target_recall}', smallest)
+
+    def print_choice(self, title, result):
+        self.stdout.write(self.style.SUCCESS(
+            f'{title}: {result["kind"]} (recall {result["recall"]:.3f}, p50 {result["p50"]:.2f} мс)'
+        ))
+        params = {**result['params'], **result['search']}
+        if result['kind'] == 'chroma':
+            self.stdout.write(f'  VECTOR_STORE_BACKEND=chroma CHROMA_HNSW_M={params["M"]} '
+                              f'CHROMA_HNSW_CONSTRUCTION_EF={params["construction_ef"]} '
+                              f'CHROMA_HNSW_SEARCH_EF={params["search_ef"]}')
+            self.stdout.write('  затем: python manage.py vector_store --rebuild')
+            return
+
+        variables = [f'FAISS_INDEX_TYPE={result["kind"]}']
+        if result['kind'] == 'hnsw':
+            variables += [f'FAISS_HNSW_M={params["M"]}', f'FAISS_HNSW_EF_CONSTRUCTION={params["ef_construction"]}',
+                          f'FAISS_HNSW_EF_SEARCH={params["ef_search"]}']
+        elif result['kind'] == 'ivf':
+            variables += [f'FAISS_IVF_NLIST={params["nlist"]}', f'FAISS_IVF_NPROBE={params["nprobe"]}']
+        variables.append(f'FAISS_VECTOR_COMPRESSION={params.get("compression", "none")}')
+        if 'dimensions' in params:
+            variables.append(f'FAISS_PCA_DIMENSIONS={params["dimensions"]}')
+        if 'compression' in params:
+            variables.append(f'FAISS_RESCORE_FACTOR={result["rescore"]}')
+        self.stdout.write(f'  VECTOR_STORE_BACKEND=faiss {" ".join(variables)}')
+        self.stdout.write('  затем: python manage.py vector_store --compact')
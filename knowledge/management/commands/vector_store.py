@@ -0,0 +1,78 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from knowledge.embedding_provider import unavailable_message
+from knowledge.index_service import IndexService
+from knowledge.models import DocumentChunk
+from knowledge.vector_store import get_vector_store
+
+
+class Command(BaseCommand):
+    help = 'Состояние векторного хранилища и его перестройка из фрагментов в базе'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--backend',
+            help='Бэкенд (по умолчанию VECTOR_STORE_BACKEND)',
+        )
+        parser.add_argument(
+            '--rebuild',
+            action='store_true',
+            help='Очистить хранилище и заново добавить все фрагменты (векторы берутся из кэша эмбеддингов)',
+        )
+        parser.add_argument(
+            '--compact',
+            action='store_true',
+            help='Слить дельта-сегменты индекса (бэкенды faiss и numpy) в новую базу',
+        )
+
+    def handle(self, *args, **options):
+        store = get_vector_store(options['backend'])
+        if store is None:
+            raise CommandError('Библиотека векторного хранилища не установлена')
+
+        if options['rebuild']:
+            self.rebuild(store)
+
+        if options['compact']:
+            if not hasattr(store, 'compact'):
+                raise CommandError(f'Бэкенд {store.backend} не использует дельта-сегменты')
+            segments = store.snapshot().get('segments', 0)
+            summary = store.compact()
+            self.stdout.write(self.style.SUCCESS(f'Слито сегментов: {segments}'))
+        else:
+            summary = store.snapshot()
+        self.stdout.write(f'Бэкенд: {summary["backend"]}')
+        self.stdout.write(f'Путь: {summary["path"]}')
+        self.stdout.write(f'Векторов: {store.count()} (фрагментов в базе: {DocumentChunk.objects.count()})')
+        self.stdout.write(f'Размер на диске: {summary["size_bytes"] / 1024 / 1024:.1f} МБ')
+        if 'segments' in summary:
+            self.stdout.write(f'Дельта-сегментов: {summary["segments"]} (слить: manage.py vector_store --compact)')
+
+    def rebuild(self, store):
+        service = IndexService(store=store)
+        if service.embedding_provider is None:
+            # Иначе хранилище очистится, а новых векторов не будет
+            raise CommandError(unavailable_message())
+        batch_size = getattr(settings, 'INGEST_BATCH_SIZE', 64)
+        store.clear()
+
+        added = 0
+        batch = []
+        chunks = DocumentChunk.objects.select_related('document').order_by('pk').iterator(chunk_size=1000)
+        for chunk in chunks:
+            batch.append(chunk)
+            if len(batch) >= batch_size:
+                added += self.add_batch(service, batch)
+                batch = []
+        if batch:
+            added += self.add_batch(service, batch)
+
+        self.stdout.write(self.style.SUCCESS(f'Добавлено векторов: {added}'))
+
+    @staticmethod
+    def add_batch(service, batch) -> int:
+        embeddings = service.generate_embeddings([chunk.content for chunk in batch])
+        indexed = [i for i, embedding in enumerate(embeddings) if embedding is not None]
+        service.store.add([batch[i] for i in indexed], [embeddings[i] for i in indexed])
+        return len(indexed)
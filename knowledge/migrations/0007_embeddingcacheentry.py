@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:28
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('knowledge', '0006_ingestionjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EmbeddingCacheEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(max_length=100, verbose_name='Модель эмбеддингов')),
+                ('task_type', models.CharField(max_length=50, verbose_name='Тип задачи')),
+                ('text_hash', models.CharField(max_length=64, verbose_name='SHA-256 текста')),
+                ('dimensions', models.IntegerField(verbose_name='Размерность')),
+                ('vector', models.BinaryField(verbose_name='Вектор')),
+                ('size_bytes', models.IntegerField(verbose_name='Размер, байт')),
+                ('hit_count', models.IntegerField(default=0, verbose_name='Попаданий')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+                ('last_used_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now, verbose_name='Последнее использование')),
+            ],
+            options={
+                'verbose_name': 'Кэшированный эмбеддинг',
+                'verbose_name_plural': 'Кэш эмбеддингов',
+                'unique_together': {('model', 'task_type', 'text_hash')},
+            },
+        ),
+    ]
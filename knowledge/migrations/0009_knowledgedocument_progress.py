@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('knowledge', '0008_documentchunk_content_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='knowledgedocument',
+            name='chunks_embedded',
+            field=models.IntegerField(default=0, verbose_name='Фрагментов проиндексировано'),
+        ),
+        migrations.AddField(
+            model_name='knowledgedocument',
+            name='pages_processed',
+            field=models.IntegerField(default=0, verbose_name='Страниц обработано'),
+        ),
+        migrations.AddField(
+            model_name='knowledgedocument',
+            name='pages_total',
+            field=models.IntegerField(default=0, verbose_name='Страниц всего'),
+        ),
+        migrations.AddField(
+            model_name='knowledgedocument',
+            name='processing_started_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Начало обработки'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('knowledge', '0009_knowledgedocument_progress'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='documentchunk',
+            name='articles',
+            field=models.CharField(blank=True, default='', max_length=255, verbose_name='Статьи'),
+        ),
+        migrations.AddField(
+            model_name='documentchunk',
+            name='chapter',
+            field=models.CharField(blank=True, default='', max_length=255, verbose_name='Глава'),
+        ),
+        migrations.AddField(
+            model_name='documentchunk',
+            name='page_end',
+            field=models.IntegerField(blank=True, null=True, verbose_name='Последняя страница'),
+        ),
+    ]
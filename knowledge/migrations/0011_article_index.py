@@ -0,0 +1,51 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:27
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def fill_article_index(apps, schema_editor):
+    """Указатель для уже разобранных фрагментов: номера статей из поля articles"""
+    DocumentChunk = apps.get_model('knowledge', 'DocumentChunk')
+    ArticleIndexEntry = apps.get_model('knowledge', 'ArticleIndexEntry')
+    max_length = DocumentChunk._meta.get_field('articles').max_length
+    entries = []
+    chunks = DocumentChunk.objects.exclude(articles='').values_list('pk', 'document_id', 'articles')
+    for pk, document_id, articles in chunks.iterator(chunk_size=2000):
+        numbers = articles.split(',')
+        if len(articles) >= max_length:
+            numbers = numbers[:-1]  # последний номер мог быть обрезан
+        entries.extend(
+            ArticleIndexEntry(document_id=document_id, chunk_id=pk, article=number[:32])
+            for number in dict.fromkeys(numbers)
+        )
+        if len(entries) >= 2000:
+            ArticleIndexEntry.objects.bulk_create(entries)
+            entries = []
+    ArticleIndexEntry.objects.bulk_create(entries)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('knowledge', '0010_documentchunk_structure'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArticleIndexEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('article', models.CharField(max_length=32, verbose_name='Номер статьи')),
+                ('chunk', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='article_entries', to='knowledge.documentchunk', verbose_name='Фрагмент')),
+                ('document', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='article_entries', to='knowledge.knowledgedocument', verbose_name='Документ')),
+            ],
+            options={
+                'verbose_name': 'Статья в указателе',
+                'verbose_name_plural': 'Указатель статей',
+                'indexes': [models.Index(fields=['article', 'document'], name='knowledge_article_lookup_idx')],
+                'unique_together': {('chunk', 'article')},
+            },
+        ),
+        migrations.RunPython(fill_article_index, migrations.RunPython.noop),
+    ]
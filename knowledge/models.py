@@ -1,5 +1,6 @@
 from django.db import models
 from django.contrib.auth import get_user_model
+from django.utils import timezone
 
 User = get_user_model()
 
@@ -37,10 +38,49 @@ class KnowledgeDocument(models.Model):
     # Метаданные для поиска
     total_chunks = models.IntegerField(default=0, verbose_name="Количество фрагментов")
     processed_at = models.DateTimeField(null=True, blank=True, verbose_name="Дата обработки")
+    
+    # Прогресс индексации (обновляется воркером по ходу обработки)
+    pages_total = models.IntegerField(default=0, verbose_name="Страниц всего")
+    pages_processed = models.IntegerField(default=0, verbose_name="Страниц обработано")
+    chunks_embedded = models.IntegerField(default=0, verbose_name="Фрагментов проиндексировано")
+    processing_started_at = models.DateTimeField(null=True, blank=True, verbose_name="Начало обработки")
+
+    PROGRESS_FIELDS = ['status', 'error_message', 'total_chunks', 'pages_total', 'pages_processed',
+                       'chunks_embedded', 'processing_started_at']
 
     def __str__(self):
         return self.title
 
+    @property
+    def progress_percent(self) -> int:
+        if self.status == 'ready':
+            return 100
+        if not self.pages_total:
+            return 0
+        return min(100, int(self.pages_processed * 100 / self.pages_total))
+
+    @property
+    def eta_seconds(self):
+        """Оценка оставшегося времени по средней скорости разбора страниц"""
+        if self.status != 'processing' or not self.processing_started_at or not self.pages_processed:
+            return None
+        elapsed = (timezone.now() - self.processing_started_at).total_seconds()
+        remaining_pages = max(0, self.pages_total - self.pages_processed)
+        return int(elapsed / self.pages_processed * remaining_pages)
+
+    def progress_payload(self) -> dict:
+        return {
+            'status': self.status,
+            'status_display': self.get_status_display(),
+            'pages_total': self.pages_total,
+            'pages_processed': self.pages_processed,
+            'chunks_embedded': self.chunks_embedded,
+            'total_chunks': self.total_chunks,
+            'percent': self.progress_percent,
+            'eta_seconds': self.eta_seconds,
+            'error': (self.error_message or '') if self.status == 'error' else '',
+        }
+
     class Meta:
         verbose_name = "Документ базы знаний"
         verbose_name_plural = "Документы базы знаний"
@@ -53,6 +93,14 @@ class DocumentChunk(models.Model):
     content = models.TextField(verbose_name="Содержимое фрагмента")
     chunk_index = models.IntegerField(verbose_name="Индекс фрагмента")
     page_number = models.IntegerField(null=True, blank=True, verbose_name="Номер страницы")
+    page_end = models.IntegerField(null=True, blank=True, verbose_name="Последняя страница")
+    
+    # Структура документа: номера статей фрагмента через запятую и глава
+    articles = models.CharField(max_length=255, blank=True, default='', verbose_name="Статьи")
+    chapter = models.CharField(max_length=255, blank=True, default='', verbose_name="Глава")
+    
+    # SHA-256 содержимого: при переобработке неизменившиеся фрагменты не эмбеддятся заново
+    content_hash = models.CharField(max_length=64, blank=True, default='', db_index=True, verbose_name="Хэш содержимого")
     
     # Метаданные для ChromaDB
     chroma_id = models.CharField(max_length=255, unique=True, verbose_name="ID в ChromaDB")
@@ -67,3 +115,88 @@ class DocumentChunk(models.Model):
 
     def __str__(self):
         return f"{self.document.title} - Фрагмент {self.chunk_index}"
+
+    @property
+    def article_list(self):
+        return self.articles.split(',') if self.articles else []
+
+
+class ArticleIndexEntry(models.Model):
+    """
+    Указатель статей: (документ, номер статьи) -> фрагмент с текстом статьи.
+    Заполняется при записи фрагментов; длинная статья занимает несколько фрагментов
+    """
+    document = models.ForeignKey(KnowledgeDocument, on_delete=models.CASCADE, related_name='article_entries', verbose_name="Документ")
+    chunk = models.ForeignKey(DocumentChunk, on_delete=models.CASCADE, related_name='article_entries', verbose_name="Фрагмент")
+    article = models.CharField(max_length=32, verbose_name="Номер статьи")
+
+    class Meta:
+        verbose_name = "Статья в указателе"
+        verbose_name_plural = "Указатель статей"
+        unique_together = ['chunk', 'article']
+        indexes = [
+            models.Index(fields=['article', 'document'], name='knowledge_article_lookup_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.document_id}: статья {self.article}"
+
+
+class IngestionJob(models.Model):
+    """Задание очереди индексации документов (обрабатывается командой ingest_worker)"""
+    STATUS_CHOICES = (
+        ('pending', 'Ожидает'),
+        ('running', 'Выполняется'),
+        ('done', 'Выполнено'),
+        ('failed', 'Ошибка'),
+    )
+
+    document = models.ForeignKey(KnowledgeDocument, on_delete=models.CASCADE, related_name='ingestion_jobs', verbose_name="Документ")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending', verbose_name="Статус")
+    attempts = models.IntegerField(default=0, verbose_name="Попыток")
+    max_attempts = models.IntegerField(default=3, verbose_name="Максимум попыток")
+
+    # Аренда: воркер владеет заданием, пока не истечет lease_expires_at
+    locked_by = models.CharField(max_length=255, blank=True, verbose_name="Воркер")
+    lease_expires_at = models.DateTimeField(null=True, blank=True, verbose_name="Аренда до")
+    run_after = models.DateTimeField(default=timezone.now, verbose_name="Не раньше")
+
+    last_error = models.TextField(blank=True, verbose_name="Последняя ошибка")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Дата обновления")
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name="Дата завершения")
+
+    class Meta:
+        verbose_name = "Задание индексации"
+        verbose_name_plural = "Задания индексации"
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='knowledge_job_claim_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.document_id}: {self.status} ({self.attempts}/{self.max_attempts})"
+
+
+class EmbeddingCacheEntry(models.Model):
+    """Кэш эмбеддингов: ключ — модель, тип задачи и SHA-256 нормализованного текста"""
+    model = models.CharField(max_length=100, verbose_name="Модель эмбеддингов")
+    task_type = models.CharField(max_length=50, verbose_name="Тип задачи")
+    text_hash = models.CharField(max_length=64, verbose_name="SHA-256 текста")
+
+    # Вектор хранится компактно: float32, little-endian
+    dimensions = models.IntegerField(verbose_name="Размерность")
+    vector = models.BinaryField(verbose_name="Вектор")
+    size_bytes = models.IntegerField(verbose_name="Размер, байт")
+
+    hit_count = models.IntegerField(default=0, verbose_name="Попаданий")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
+    last_used_at = models.DateTimeField(default=timezone.now, db_index=True, verbose_name="Последнее использование")
+
+    class Meta:
+        verbose_name = "Кэшированный эмбеддинг"
+        verbose_name_plural = "Кэш эмбеддингов"
+        unique_together = ['model', 'task_type', 'text_hash']
+
+    def __str__(self):
+        return f"{self.model}/{self.task_type}: {self.text_hash[:12]}"
@@ -0,0 +1,100 @@
+"""
+Извлечение текста из PDF по страницам, с распараллеливанием по процессам.
+
+Модуль намеренно не импортирует Django: функции выполняются в дочерних
+процессах (spawn), где настройки Django не загружены.
+"""
+import os
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Iterator, List, Optional, Tuple
+
+# Try to import PyPDF2, fall back to pypdf (его преемник с тем же API)
+try:
+    import PyPDF2
+    PDF_AVAILABLE = True
+except ImportError:
+    try:
+        import pypdf as PyPDF2
+        PDF_AVAILABLE = True
+    except ImportError:
+        PyPDF2 = None
+        PDF_AVAILABLE = False
+
+
+# Открытый документ в дочернем процессе: диапазоны одного файла не разбирают его заново
+_worker_reader = {}
+
+
+def _extract_page_range(file_path: str, start: int, end: int) -> List[Tuple[int, str]]:
+    """Извлечение текста страниц [start, end) — выполняется в дочернем процессе"""
+    pdf_reader = _worker_reader.get(file_path)
+    if pdf_reader is None:
+        _worker_reader.clear()
+        pdf_reader = _worker_reader[file_path] = PyPDF2.PdfReader(file_path)
+    pages = []
+    for page_num in range(start, end):
+        try:
+            page_text = pdf_reader.pages[page_num].extract_text()
+        except Exception as e:
+            print(f"Ошибка при извлечении текста со страницы {page_num + 1}: {e}")
+            continue
+        if page_text:
+            pages.append((page_num + 1, page_text))
+    return pages
+
+
+def resolve_worker_count(max_workers: int = 0) -> int:
+    """Число процессов: настройка (0 — по числу ядер), но не больше числа ядер"""
+    cpu_count = os.cpu_count() or 1
+    if max_workers <= 0:
+        return cpu_count
+    return min(max_workers, cpu_count)
+
+
+def iter_pdf_pages(pdf_file, max_workers: int = 0, pages_per_task: int = 50,
+                   on_page_count: Optional[Callable[[int], None]] = None) -> Iterator[Tuple[int, str]]:
+    """
+    Постраничное извлечение текста: (номер страницы с 1, текст).
+
+    Для файла на диске с числом страниц больше pages_per_task диапазоны страниц
+    раздаются пулу процессов. В работе одновременно не более 2 * workers
+    диапазонов, результаты отдаются строго по порядку страниц.
+    Файловые объекты (загруженные файлы) читаются последовательно.
+    on_page_count вызывается с числом страниц до начала извлечения.
+    """
+    pdf_reader = PyPDF2.PdfReader(pdf_file)
+    total_pages = len(pdf_reader.pages)
+    if on_page_count:
+        on_page_count(total_pages)
+    workers = resolve_worker_count(max_workers)
+
+    if not isinstance(pdf_file, str) or workers <= 1 or total_pages <= pages_per_task:
+        for page_num, page in enumerate(pdf_reader.pages):
+            try:
+                page_text = page.extract_text()
+            except Exception as e:
+                print(f"Ошибка при извлечении текста со страницы {page_num + 1}: {e}")
+                continue
+            if page_text:
+                yield page_num + 1, page_text
+        return
+
+    ranges = [
+        (start, min(start + pages_per_task, total_pages))
+        for start in range(0, total_pages, pages_per_task)
+    ]
+    workers = min(workers, len(ranges))
+    context = multiprocessing.get_context('spawn')
+
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+        pending = deque()
+        next_range = 0
+        while next_range < len(ranges) or pending:
+            while next_range < len(ranges) and len(pending) < workers * 2:
+                start, end = ranges[next_range]
+                pending.append(executor.submit(_extract_page_range, pdf_file, start, end))
+                next_range += 1
+            for page in pending.popleft().result():
+                yield page
@@ -0,0 +1,66 @@
+import time
+from typing import Iterable, Iterator, Tuple
+
+from django.utils import timezone
+
+from .models import KnowledgeDocument
+
+
+class IngestionProgress:
+    """
+    Счетчики прогресса индексации документа.
+
+    Значения пишутся в строку KnowledgeDocument точечным UPDATE не чаще
+    одного раза в min_interval секунд, поэтому страница документа может
+    опрашивать их дешево, а обработка не тормозит на записи.
+    """
+
+    def __init__(self, document: KnowledgeDocument, min_interval: float = 1.0):
+        self.document = document
+        self.min_interval = min_interval
+        self.pages_total = 0
+        self.pages_processed = 0
+        self.chunks_embedded = 0
+        self._flushed_at = 0.0
+
+    def start(self) -> None:
+        self._update(processing_started_at=timezone.now())
+
+    def set_total_pages(self, pages_total: int) -> None:
+        self.pages_total = pages_total
+        self.flush(force=True)
+
+    def track_pages(self, pages: Iterable[Tuple[int, str]]) -> Iterator[Tuple[int, str]]:
+        """Пропускает поток страниц, запоминая номер последней прочитанной"""
+        for page_num, text in pages:
+            self.pages_processed = max(self.pages_processed, page_num)
+            yield page_num, text
+
+    def add_chunks(self, count: int) -> None:
+        self.chunks_embedded += count
+        self.flush()
+
+    def finish(self) -> None:
+        """Последние страницы без текста не проходят через поток — засчитываем их"""
+        self.pages_processed = max(self.pages_processed, self.pages_total)
+        self.flush(force=True)
+
+    def flush(self, force: bool = False) -> None:
+        now = time.monotonic()
+        if not force and now - self._flushed_at < self.min_interval:
+            return
+        self._flushed_at = now
+        self._update()
+
+    def _update(self, **extra) -> None:
+        values = {
+            'pages_total': self.pages_total,
+            'pages_processed': self.pages_processed,
+            'chunks_embedded': self.chunks_embedded,
+            'total_chunks': self.chunks_embedded,
+            **extra,
+        }
+        KnowledgeDocument.objects.filter(pk=self.document.pk).update(**values)
+        # Объект в памяти тоже обновляется: иначе последующий document.save() затрет счетчики
+        for field, value in values.items():
+            setattr(self.document, field, value)
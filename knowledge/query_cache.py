@@ -0,0 +1,108 @@
+"""
+Кэш результатов поиска в памяти процесса.
+
+Почти одинаковые вопросы («Как уволиться по собственному желанию?» и «как
+уволиться по собственному желанию») сводятся к одному ключу: текст запроса
+нормализуется, к нему добавляются k, фильтры и режим поиска. Записи
+вытесняются по LRU и живут не дольше TTL; при новом поколении индекса кэш
+сбрасывается (см. knowledge.retrieval). Одновременные одинаковые запросы
+не ищут параллельно: первый выполняет поиск, остальные ждут его результат.
+"""
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+PUNCTUATION_RE = re.compile(r'[^\w\s.\-]+')
+
+
+def normalize_query(query: str) -> str:
+    """Регистр, ё/е, пробелы и знаки препинания вокруг слов не меняют ключ; номера вида 12.1 сохраняются"""
+    text = unicodedata.normalize('NFC', query).lower().replace('ё', 'е')
+    text = PUNCTUATION_RE.sub(' ', text)
+    return ' '.join(word.strip('.-') for word in text.split() if word.strip('.-'))
+
+
+class _Flight:
+    """Поиск, который уже выполняется: остальные запросы с тем же ключом ждут его"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class QueryCache:
+    """LRU с TTL и объединением одновременных одинаковых запросов (single-flight)"""
+
+    def __init__(self, max_entries: int = 1000, ttl: float = 300.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: 'OrderedDict[Hashable, Tuple[float, Any]]' = OrderedDict()
+        self._flights: Dict[Hashable, _Flight] = {}
+        self._lock = threading.Lock()
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def clear(self) -> None:
+        """Сброс при новом поколении индекса; поиски, начатые до сброса, результат не сохранят"""
+        with self._lock:
+            self._entries.clear()
+            self._generation += 1
+
+    def get_or_compute(self, key: Hashable, compute: Callable[[], Tuple[Any, bool]]) -> Any:
+        """
+        Значение из кэша или результат compute() — пары (значение, можно ли сохранить).
+        Неполный результат (например, поиск без эмбеддинга) отдается, но не кэшируется
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                generation = self._generation
+                self.misses += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        cacheable = False
+        try:
+            flight.value, cacheable = compute()
+            return flight.value
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+                if cacheable and generation == self._generation and self.max_entries > 0:
+                    self._entries[key] = (time.monotonic() + self.ttl, flight.value)
+                    self._entries.move_to_end(key)
+                    while len(self._entries) > self.max_entries:
+                        self._entries.popitem(last=False)
+            flight.done.set()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'coalesced': self.coalesced,
+            'hit_rate': round((self.hits + self.coalesced) / lookups, 3) if lookups else 0.0,
+        }
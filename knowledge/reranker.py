@@ -0,0 +1,209 @@
+"""
+Переранжирование результатов поиска кросс-энкодером на CPU.
+
+Векторный и лексический поиск оценивают запрос и фрагмент порознь, поэтому
+в первых 3–4 результатах, которые уходят в контекст модели, бывают фрагменты
+лишь похожие на вопрос. Кросс-энкодер (CrossEncoder из sentence-transformers)
+читает запрос и фрагмент вместе. Если RERANK_ENABLED включен, поиск берет
+RERANK_CANDIDATES кандидатов, кросс-энкодер оценивает все пары (запрос,
+фрагмент) одним пакетным проходом, и в ответ идут лучшие по его оценке.
+Оценки пар кэшируются в памяти процесса: фрагменты после записи не меняются.
+
+Бюджет RERANK_BUDGET_MS: по времени прошлых проходов на одну пару число
+оцениваемых кандидатов урезается так, чтобы проход уложился в бюджет; если
+не помещается даже столько кандидатов, сколько нужно в ответе, остается
+порядок поиска. Такой пропуск уменьшает оценку времени на пару, поэтому после
+одного медленного прохода (например, при конкуренции за CPU) переранжирование
+через несколько запросов пробует снова и заново измеряет время. Модель (и
+sentence-transformers с torch) грузится в фоне при первом поиске — до ее
+готовности поиск тоже отвечает без переранжирования.
+"""
+import importlib.util
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from django.conf import settings
+
+from .query_cache import normalize_query
+
+# Сама библиотека (и torch) импортируется только при загрузке модели: без RERANK_ENABLED
+# процессы не платят за нее памятью
+SENTENCE_TRANSFORMERS_AVAILABLE = importlib.util.find_spec('sentence_transformers') is not None
+
+# Многоязычный кросс-энкодер MS MARCO (русский в обучающих данных; таджикский — через кириллицу)
+DEFAULT_MODEL = 'cross-encoder/mmarco-mMiniLMv2-L12-H384-v1'
+
+# Вес нового замера в скользящей оценке времени прохода на одну пару
+COST_SMOOTHING = 0.3
+
+# Множитель оценки времени на пару при каждом пропуске из-за бюджета: завышенная
+# оценка не может отключить переранжирование навсегда
+SKIP_DECAY = 0.8
+
+
+class ScoreCache:
+    """LRU оценок пар (нормализованный запрос, pk фрагмента)"""
+
+    def __init__(self, max_entries: int = 20000):
+        self.max_entries = max_entries
+        self._entries: 'OrderedDict[Tuple[str, int], float]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, query: str, pks: List[int]) -> Dict[int, float]:
+        found = {}
+        with self._lock:
+            for pk in pks:
+                score = self._entries.get((query, pk))
+                if score is not None:
+                    self._entries.move_to_end((query, pk))
+                    found[pk] = score
+        return found
+
+    def put_many(self, query: str, scores: Dict[int, float]) -> None:
+        with self._lock:
+            for pk, score in scores.items():
+                self._entries[(query, pk)] = score
+                self._entries.move_to_end((query, pk))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class CrossEncoderReranker:
+    """Кросс-энкодер процесса с бюджетом времени на проход и кэшем оценок пар"""
+
+    def __init__(self, model_name: str = None, candidates: int = None, budget_ms: float = None):
+        self.model_name = model_name or getattr(settings, 'RERANK_MODEL', DEFAULT_MODEL)
+        self.candidates = candidates or getattr(settings, 'RERANK_CANDIDATES', 20)
+        budget_ms = budget_ms if budget_ms is not None else getattr(settings, 'RERANK_BUDGET_MS', 300)
+        self.budget = budget_ms / 1000
+        self.max_length = getattr(settings, 'RERANK_MAX_LENGTH', 512)
+        self.cache = ScoreCache(getattr(settings, 'RERANK_CACHE_MAX_ENTRIES', 20000))
+        self.model = None
+        self.failed = False
+        self._loader: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        # Скользящая оценка секунд прохода на пару (None — проходов еще не было)
+        self.pair_seconds: Optional[float] = None
+        self.reranked = 0
+        self.truncated = 0
+        self.skipped = 0
+        self.over_budget = 0
+        self.cached_pairs = 0
+        self.scored_pairs = 0
+
+    def _ready_model(self):
+        """Загруженная модель или None; первый вызов запускает загрузку в фоне"""
+        if self.model is not None or self.failed:
+            return self.model
+        with self._lock:
+            if self._loader is None:
+                self._loader = threading.Thread(target=self._load, name='cross-encoder-load', daemon=True)
+                self._loader.start()
+        return None
+
+    def _load(self) -> None:
+        start_time = time.perf_counter()
+        try:
+            from sentence_transformers import CrossEncoder
+            model = CrossEncoder(self.model_name, max_length=self.max_length, device='cpu')
+            # Первый проход заметно дольше следующих — прогреваем до первого поиска
+            model.predict([('прогрев', 'прогрев')], show_progress_bar=False)
+            self.model = model
+            print(f"Кросс-энкодер {self.model_name} загружен ({time.perf_counter() - start_time:.1f} с)")
+        except Exception as e:
+            self.failed = True
+            print(f"Не удалось загрузить кросс-энкодер {self.model_name}: {e}. Поиск без переранжирования")
+
+    def wait_ready(self, timeout: float = None) -> bool:
+        """Дождаться загрузки модели (команды и бенчмарки)"""
+        self._ready_model()
+        if self._loader is not None:
+            self._loader.join(timeout)
+        return self.model is not None
+
+    def _affordable(self) -> Optional[int]:
+        """Сколько новых пар помещается в бюджет (None — оценки времени еще нет)"""
+        if self.pair_seconds is None:
+            return None
+        return int(self.budget / self.pair_seconds)
+
+    def rerank(self, query: str, results: List[Dict[str, Any]], limit: int) -> Tuple[List[Dict[str, Any]], bool]:
+        """
+        До limit результатов по убыванию оценки кросс-энкодера (поле rerank_score) и признак
+        того, что переранжирование выполнено; иначе — первые limit в порядке поиска
+        """
+        if len(results) <= 1:
+            return results[:limit], True
+        model = self._ready_model()
+        if model is None:
+            self.skipped += 1
+            return results[:limit], False
+
+        key = normalize_query(query)
+        scores = self.cache.get_many(key, [result['chunk_id'] for result in results])
+
+        # Кандидаты по порядку поиска, пока новых пар не больше, чем помещается в бюджет
+        affordable = self._affordable()
+        pool, missing = [], []
+        for result in results:
+            if result['chunk_id'] not in scores:
+                if affordable is not None and len(missing) >= affordable:
+                    break
+                missing.append(result)
+            pool.append(result)
+        if len(pool) < min(limit, len(results)):
+            self.skipped += 1
+            self.pair_seconds *= SKIP_DECAY
+            return results[:limit], False
+        if len(pool) < len(results):
+            self.truncated += 1
+
+        if missing:
+            start_time = time.perf_counter()
+            predicted = model.predict(
+                [(query, result['content']) for result in missing],
+                batch_size=len(missing), show_progress_bar=False, convert_to_numpy=True,
+            )
+            elapsed = time.perf_counter() - start_time
+            new_scores = {result['chunk_id']: float(score) for result, score in zip(missing, predicted)}
+            self.cache.put_many(key, new_scores)
+            scores.update(new_scores)
+            self._observe(elapsed, len(missing))
+
+        self.reranked += 1
+        self.cached_pairs += len(pool) - len(missing)
+        self.scored_pairs += len(missing)
+        ranked = sorted(pool, key=lambda result: -scores[result['chunk_id']])[:limit]
+        return [dict(result, rerank_score=scores[result['chunk_id']]) for result in ranked], True
+
+    def _observe(self, elapsed: float, pairs: int) -> None:
+        if elapsed > self.budget:
+            self.over_budget += 1
+        per_pair = elapsed / pairs
+        if self.pair_seconds is None:
+            self.pair_seconds = per_pair
+        else:
+            self.pair_seconds += COST_SMOOTHING * (per_pair - self.pair_seconds)
+
+    def stats(self) -> Dict[str, Any]:
+        pairs = self.cached_pairs + self.scored_pairs
+        return {
+            'model': self.model_name,
+            'ready': self.model is not None,
+            'reranked': self.reranked,
+            'truncated': self.truncated,
+            'skipped': self.skipped,
+            'over_budget': self.over_budget,
+            'pair_ms': round(self.pair_seconds * 1000, 2) if self.pair_seconds is not None else None,
+            'cache_entries': len(self.cache),
+            'cache_hit_rate': round(self.cached_pairs / pairs, 3) if pairs else 0.0,
+        }
@@ -0,0 +1,69 @@
+"""
+Общий для процесса сервис поиска по базе знаний.
+
+Чат и страницы поиска не создают IndexService на каждый запрос: хранилище
+открывается один раз при первом обращении. Перед каждым поиском сверяется
+поколение индекса (файл index.version, который пишет snapshot() после
+индексации); если оно изменилось, хранилище открывается заново и подменяется
+одним присваиванием — поиски, уже начатые на прежнем хранилище, дорабатывают
+на нем. Для FAISS хранилище открывается только для чтения через mmap, и
+воркеры одного узла делят страницы индекса. Лексический индекс (SEARCH_MODE
+'lexical' или 'hybrid') живет в памяти процесса и с каждым поколением
+дочитывает новые фрагменты из базы данных. Кэш результатов поиска
+(QUERY_CACHE_*) сбрасывается с каждым новым поколением, а кросс-энкодер
+(RERANK_*) и его кэш оценок живут весь процесс. Записи (удаление документов,
+индексация) идут через собственные экземпляры IndexService.
+"""
+import threading
+from typing import Optional
+
+from django.conf import settings
+
+from .index_service import IndexService
+from .lexical import LexicalIndex
+from .query_cache import QueryCache
+from .reranker import SENTENCE_TRANSFORMERS_AVAILABLE, CrossEncoderReranker
+from .vector_store import get_vector_store, index_version
+
+_lock = threading.Lock()
+_service: Optional[IndexService] = None
+_version: Optional[int] = None
+
+
+def get_retrieval_service() -> IndexService:
+    """Сервис поиска процесса; перечитывает индекс, только когда опубликовано новое поколение"""
+    global _service, _version
+    version = index_version()
+    service = _service
+    if service is not None and version == _version:
+        return service
+
+    with _lock:
+        if _service is None or version != _version:
+            store = get_vector_store(readonly=True)
+            if _service is None:
+                lexical = None
+                if getattr(settings, 'SEARCH_MODE', 'vector') in ('lexical', 'hybrid'):
+                    lexical = LexicalIndex()
+                query_cache = None
+                if getattr(settings, 'QUERY_CACHE_ENABLED', True):
+                    query_cache = QueryCache(getattr(settings, 'QUERY_CACHE_MAX_ENTRIES', 1000),
+                                             getattr(settings, 'QUERY_CACHE_TTL', 300))
+                reranker = None
+                if getattr(settings, 'RERANK_ENABLED', False):
+                    if SENTENCE_TRANSFORMERS_AVAILABLE:
+                        reranker = CrossEncoderReranker()
+                    else:
+                        print("Warning: RERANK_ENABLED, но sentence-transformers не установлен. "
+                              "Установите: pip install sentence-transformers")
+                _service = IndexService(store=store, lexical=lexical, query_cache=query_cache, reranker=reranker)
+            else:
+                _service.store = store
+            if _service.query_cache is not None:
+                _service.query_cache.clear()
+            if _service.lexical is not None:
+                _service.lexical.refresh()
+            _version = version
+            print(f"Индекс для поиска загружен (поколение {version})")
+        return _service
+
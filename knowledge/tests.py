@@ -1,3 +1,217 @@
-from django.test import TestCase
+import shutil
+import tempfile
+import threading
+from datetime import timedelta
 
-# Create your tests here.
+import numpy as np
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from .chunker import ArticleChunker
+from .ingestion_queue import claim_job, fail_exhausted_jobs, fail_job
+from .models import DocumentChunk, IngestionJob, KnowledgeDocument
+from .query_cache import QueryCache
+from .vector_store import FAISS_AVAILABLE, FaissVectorStore, MmapVectorStore, NumpyVectorStore
+
+
+def create_document(title='Трудовой кодекс'):
+    # Сигнал post_save ставит новый документ в очередь индексации
+    return KnowledgeDocument.objects.create(title=title, document_type='labor_code', status='pending')
+
+
+class IngestionQueueTests(TestCase):
+    def setUp(self):
+        self.document = create_document()
+        self.job = IngestionJob.objects.get(document=self.document)
+
+    def test_job_is_claimed_by_one_worker(self):
+        claimed = claim_job('worker-1')
+        self.assertEqual(claimed.pk, self.job.pk)
+        self.assertEqual(claimed.status, 'running')
+        self.assertEqual(claimed.locked_by, 'worker-1')
+        self.assertEqual(claimed.attempts, 1)
+        self.assertIsNone(claim_job('worker-2'))
+
+    def test_expired_lease_is_claimed_again(self):
+        claim_job('worker-1')
+        IngestionJob.objects.filter(pk=self.job.pk).update(lease_expires_at=timezone.now() - timedelta(seconds=1))
+
+        claimed = claim_job('worker-2')
+        self.assertEqual(claimed.pk, self.job.pk)
+        self.assertEqual(claimed.locked_by, 'worker-2')
+        self.assertEqual(claimed.attempts, 2)
+
+    @override_settings(INGEST_RETRY_BACKOFF_SECONDS=10)
+    def test_failed_job_is_retried_with_backoff(self):
+        for attempt in (1, 2):
+            job = claim_job('worker-1')
+            started = timezone.now()
+            fail_job(job, 'worker-1', 'ошибка')
+            job.refresh_from_db()
+            self.assertEqual(job.status, 'pending')
+            self.assertEqual(job.last_error, 'ошибка')
+            self.assertGreaterEqual(job.run_after, started + timedelta(seconds=10 * 2 ** (attempt - 1)))
+            # До run_after задание не выдается
+            self.assertIsNone(claim_job('worker-1'))
+            IngestionJob.objects.filter(pk=job.pk).update(run_after=timezone.now())
+
+        job = claim_job('worker-1')
+        fail_job(job, 'worker-1', 'ошибка')
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'failed')
+        self.assertIsNotNone(job.finished_at)
+
+    def test_exhausted_job_with_expired_lease_fails(self):
+        IngestionJob.objects.filter(pk=self.job.pk).update(attempts=2)
+        claim_job('worker-1')
+        IngestionJob.objects.filter(pk=self.job.pk).update(lease_expires_at=timezone.now() - timedelta(seconds=1))
+
+        self.assertIsNone(claim_job('worker-2'))
+        self.assertEqual(fail_exhausted_jobs(), 1)
+        self.job.refresh_from_db()
+        self.assertEqual(self.job.status, 'failed')
+
+
+class ArticleChunkerTests(TestCase):
+    TEXT = (
+        "--- Страница 1 ---\n"
+        "Глава 1. Общие положения\n"
+        "Статья 1. Цели кодекса\n"
+        "Настоящий кодекс регулирует трудовые отношения.\n"
+        "Статья 2. Сфера действия\n"
+        "Кодекс действует на всей территории республики\n"
+        "--- Страница 2 ---\n"
+        "для всех организаций и работодателей.\n"
+        "Глава 2. Трудовой договор\n"
+        "Статья 3. Понятие договора\n"
+        "Трудовой договор есть соглашение между работником и работодателем.\n"
+    )
+
+    def test_split_keeps_structure(self):
+        chunks = ArticleChunker(chunk_size=300, min_length=20).split(self.TEXT)
+
+        self.assertEqual(len(chunks), 2)
+        first, second = chunks
+        # Короткие статьи одной главы объединяются, статья 2 переходит на страницу 2
+        self.assertEqual(first.articles, ('1', '2'))
+        self.assertEqual(first.chapter, 'Глава 1. Общие положения')
+        self.assertEqual((first.page_start, first.page_end), (1, 2))
+        self.assertNotIn('Страница', first.text)
+        # Заголовок главы начинает новый фрагмент
+        self.assertEqual(second.articles, ('3',))
+        self.assertEqual(second.article_number, '3')
+        self.assertEqual(second.chapter, 'Глава 2. Трудовой договор')
+        self.assertEqual((second.page_start, second.page_end), (2, 2))
+
+    def test_page_and_chapter_carry_over_between_windows(self):
+        chunker = ArticleChunker(chunk_size=300, min_length=20)
+        chunker.split("--- Страница 7 ---\nГлава 4. Отпуска\nСтатья 40. Ежегодный отпуск\nТекст статьи об отпуске.\n")
+        chunks = chunker.split("Статья 41. Учебный отпуск\nРаботникам, совмещающим работу с учебой, предоставляется отпуск.\n")
+
+        self.assertEqual(chunks[0].articles, ('41',))
+        self.assertEqual(chunks[0].chapter, 'Глава 4. Отпуска')
+        self.assertEqual(chunks[0].page_start, 7)
+
+
+class SegmentedVectorStoreTests(TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp(prefix='vector_store_test_')
+        self.addCleanup(shutil.rmtree, self.path, ignore_errors=True)
+        document = create_document()
+        self.chunks = [
+            DocumentChunk.objects.create(document=document, content=f'Фрагмент {i}', chunk_index=i,
+                                         chroma_id=f'test_{i}')
+            for i in range(40)
+        ]
+        rng = np.random.default_rng(0)
+        self.vectors = rng.standard_normal((40, 16)).astype('float32')
+        self.queries = rng.standard_normal((5, 16)).astype('float32')
+
+    def search_all(self, store):
+        return [store.search(query.tolist(), 5) for query in self.queries]
+
+    def assertSameHits(self, expected, actual):
+        for expected_hits, actual_hits in zip(expected, actual):
+            self.assertEqual([pk for pk, _ in expected_hits], [pk for pk, _ in actual_hits])
+            np.testing.assert_allclose([score for _, score in expected_hits],
+                                       [score for _, score in actual_hits], rtol=1e-5)
+
+    def write(self, store_class):
+        writer = store_class(self.path)
+        writer.add(self.chunks[:30], self.vectors[:30])
+        writer.snapshot()
+        writer.add(self.chunks[30:], self.vectors[30:])
+        writer.delete(self.chunks[:5])
+        writer.snapshot()
+        # Запись только дописывает сегменты, индекс в память не загружается
+        self.assertFalse(writer.loaded)
+        self.assertEqual(writer.has(self.chunks[3:7]), [False, False, True, True])
+
+    def test_numpy_round_trip(self):
+        self.write(NumpyVectorStore)
+        reader = NumpyVectorStore(self.path)
+        self.assertEqual(reader.count(), 35)
+        before = self.search_all(reader)
+        deleted = {chunk.pk for chunk in self.chunks[:5]}
+        self.assertFalse(deleted & {pk for hits in before for pk, _ in hits})
+
+        summary = NumpyVectorStore(self.path).compact()
+        self.assertEqual(summary['segments'], 0)
+        self.assertEqual(summary['count'], 35)
+        self.assertSameHits(before, self.search_all(NumpyVectorStore(self.path)))
+
+    @override_settings(FAISS_INDEX_TYPE='flat', FAISS_VECTOR_COMPRESSION='none')
+    def test_faiss_round_trip(self):
+        if not FAISS_AVAILABLE:
+            self.skipTest('faiss не установлен')
+        self.write(FaissVectorStore)
+        before = self.search_all(FaissVectorStore(self.path))
+        self.assertSameHits(before, self.search_all(MmapVectorStore(self.path)))
+
+        FaissVectorStore(self.path).compact()
+        self.assertSameHits(before, self.search_all(FaissVectorStore(self.path)))
+        mmap_reader = MmapVectorStore(self.path)
+        self.assertEqual(mmap_reader.count(), 35)
+        self.assertSameHits(before, self.search_all(mmap_reader))
+
+
+class QueryCacheTests(TestCase):
+    def test_cached_value_is_reused(self):
+        cache = QueryCache(max_entries=10, ttl=60)
+        calls = []
+
+        def compute():
+            calls.append(1)
+            return 'результат', True
+
+        self.assertEqual(cache.get_or_compute('ключ', compute), 'результат')
+        self.assertEqual(cache.get_or_compute('ключ', compute), 'результат')
+        self.assertEqual(len(calls), 1)
+
+        cache.clear()
+        cache.get_or_compute('ключ', compute)
+        self.assertEqual(len(calls), 2)
+
+    def test_result_started_before_clear_is_not_stored(self):
+        cache = QueryCache(max_entries=10, ttl=60)
+        started, release = threading.Event(), threading.Event()
+
+        def slow_compute():
+            started.set()
+            release.wait(5)
+            return 'старое поколение', True
+
+        thread = threading.Thread(target=cache.get_or_compute, args=('ключ', slow_compute))
+        thread.start()
+        started.wait(5)
+        # Новое поколение индекса во время поиска
+        cache.clear()
+        release.set()
+        thread.join(5)
+
+        self.assertEqual(cache.get_or_compute('ключ', lambda: ('новое поколение', True)), 'новое поколение')
+
+    def test_incomplete_result_is_not_stored(self):
+        cache = QueryCache(max_entries=10, ttl=60)
+        cache.get_or_compute('ключ', lambda: ('без эмбеддинга', False))
+        self.assertEqual(cache.get_or_compute('ключ', lambda: ('полный', True)), 'полный')
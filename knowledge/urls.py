@@ -13,6 +13,11 @@ urlpatterns = [
     # Детали документа
     path('document/<int:pk>/', views.document_detail, name='document_detail'),
     
+    # Прогресс индексации документа
+    path('document/<int:pk>/progress/stream/', views.document_progress_stream, name='document_progress_stream'),
+    path('api/document/<int:pk>/progress/', views.api_document_progress, name='api_document_progress'),
+    path('api/documents/progress/', views.api_documents_progress, name='api_documents_progress'),
+    
     # Удаление документа
     path('delete/<int:pk>/', views.delete_document, name='delete_document'),
     
@@ -0,0 +1,1211 @@
+"""
+Векторное хранилище фрагментов базы знаний.
+
+VectorStore — общий интерфейс (add, delete, update_metadata, search, count,
+snapshot) над векторами строк DocumentChunk. Бэкенд выбирается настройкой
+VECTOR_STORE_BACKEND: 'chroma' (ChromaDB), 'faiss' (индекс FAISS на диске) или
+'numpy' (точный перебор на NumPy, тот же формат файлов, что у faiss).
+Хранилище держит только векторы и поля для фильтрации (тип документа и
+загрузивший его пользователь): текст и метаданные фрагмента берутся из базы
+Django по pk, поэтому данные не дублируются.
+
+Каждый snapshot() с изменениями увеличивает счетчик поколений в файле
+index.version рядом с индексом: по нему читатели в других процессах узнают,
+что индекс пора перечитать (см. knowledge.retrieval).
+"""
+import os
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from django.conf import settings
+
+from . import index_files
+from .models import DocumentChunk
+
+try:
+    from chromadb.api import ServerAPI
+    from chromadb.api.client import Client as ChromaClient
+    from chromadb.config import Settings, System
+    CHROMADB_AVAILABLE = True
+except ImportError:
+    CHROMADB_AVAILABLE = False
+
+try:
+    import faiss
+    from . import ann
+    FAISS_AVAILABLE = True
+except ImportError:
+    FAISS_AVAILABLE = False
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: блокировка только внутри процесса
+    fcntl = None
+
+VERSION_NAME = 'index.version'
+
+# Доля строк базы, до которой поиск с фильтром перебирает партиции точно, даже
+# если есть приближенный индекс: шире фильтр — поиск по индексу с отсевом
+PARTITION_SCAN_FRACTION = 0.1
+
+# Значения ChromaDB по умолчанию для коллекций, созданных без параметров HNSW
+CHROMA_HNSW_DEFAULTS = {'hnsw:M': 16, 'hnsw:construction_ef': 100, 'hnsw:search_ef': 10}
+
+
+def chunk_metadata(chunk: DocumentChunk) -> Dict[str, Any]:
+    """Метаданные фрагмента для хранилища (ChromaDB не принимает None — пустые поля не передаем)"""
+    document = chunk.document
+    metadata = {
+        "document_id": str(document.id),
+        "document_title": document.title,
+        "document_type": document.document_type,
+        "chunk_index": chunk.chunk_index,
+        "django_chunk_id": str(chunk.id)
+    }
+    if document.uploaded_by_id is not None:
+        metadata["uploaded_by"] = document.uploaded_by_id
+    if chunk.page_number is not None:
+        metadata["page_number"] = chunk.page_number
+        metadata["page_end"] = chunk.page_end
+    if chunk.articles:
+        metadata["articles"] = chunk.articles
+    if chunk.chapter:
+        metadata["chapter"] = chunk.chapter
+    return metadata
+
+
+def chunk_uploader(chunk: DocumentChunk) -> int:
+    """pk пользователя, загрузившего документ фрагмента (0 — не указан)"""
+    return chunk.document.uploaded_by_id or 0
+
+
+def normalize(vectors) -> np.ndarray:
+    """Векторы единичной длины (float32): скалярное произведение равно косинусу"""
+    matrix = np.array(vectors, dtype='float32', ndmin=2)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+
+def read_version(path: str) -> int:
+    """Поколение индекса из файла версии (0, если индекс еще не публиковался)"""
+    try:
+        with open(path, encoding='utf-8') as f:
+            return int(f.read().strip() or 0)
+    except (OSError, ValueError):
+        return 0
+
+
+def directory_size(path: str) -> int:
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for filename in filenames:
+            total += os.path.getsize(os.path.join(dirpath, filename))
+    return total
+
+
+def ann_config() -> Dict[str, Any]:
+    """
+    Индекс FAISS для поиска (FAISS_INDEX_TYPE, FAISS_VECTOR_COMPRESSION) с параметрами
+    построения и поиска. Пустые params — точный поиск по базе без отдельного индекса
+    """
+    index_type = getattr(settings, 'FAISS_INDEX_TYPE', 'flat')
+    params = ann.build_params(
+        index_type,
+        hnsw_m=getattr(settings, 'FAISS_HNSW_M', 32),
+        ef_construction=getattr(settings, 'FAISS_HNSW_EF_CONSTRUCTION', 200),
+        nlist=getattr(settings, 'FAISS_IVF_NLIST', 0),
+        compression=getattr(settings, 'FAISS_VECTOR_COMPRESSION', 'none'),
+        pca_dimensions=getattr(settings, 'FAISS_PCA_DIMENSIONS', 256),
+    )
+    return {
+        'type': index_type,
+        'params': params,
+        'search': {
+            'ef_search': getattr(settings, 'FAISS_HNSW_EF_SEARCH', 64),
+            'nprobe': getattr(settings, 'FAISS_IVF_NPROBE', 16),
+        },
+        # Сжатые оценки приближенные: k × rescore лучших пересчитываются по полным векторам
+        'rescore': getattr(settings, 'FAISS_RESCORE_FACTOR', 4) if 'compression' in params else 0,
+    }
+
+
+def ann_matches(built: Optional[Dict[str, Any]], config: Dict[str, Any]) -> bool:
+    """Построен ли приближенный индекс базы (manifest['ann']) с типом и параметрами из настроек"""
+    return bool(built) and built['type'] == config['type'] and built['params'] == config['params']
+
+
+def chroma_collection_metadata() -> Dict[str, Any]:
+    """Метаданные новой коллекции: параметры HNSW ChromaDB задаются только при создании"""
+    return {
+        "description": "Правовые документы Республики Таджикистан",
+        "hnsw:M": getattr(settings, 'CHROMA_HNSW_M', CHROMA_HNSW_DEFAULTS['hnsw:M']),
+        "hnsw:construction_ef": getattr(settings, 'CHROMA_HNSW_CONSTRUCTION_EF', CHROMA_HNSW_DEFAULTS['hnsw:construction_ef']),
+        "hnsw:search_ef": getattr(settings, 'CHROMA_HNSW_SEARCH_EF', CHROMA_HNSW_DEFAULTS['hnsw:search_ef']),
+    }
+
+
+class VectorStore:
+    """Интерфейс векторного хранилища. search возвращает [(pk фрагмента, сходство)] по убыванию сходства"""
+
+    backend = ''
+    path = ''
+    _thread_lock = threading.Lock()
+
+    @classmethod
+    def default_path(cls) -> str:
+        raise NotImplementedError
+
+    @classmethod
+    def open_reader(cls) -> 'VectorStore':
+        """Хранилище для поиска (retrieval): открывается заново, без состояния клиента в процессе"""
+        return cls(fresh=True)
+
+    @property
+    def version_path(self) -> str:
+        return os.path.join(self.path, VERSION_NAME)
+
+    def version(self) -> int:
+        return read_version(self.version_path)
+
+    @contextmanager
+    def _locked(self):
+        """Блокировка записи: между потоками процесса и (через flock) между процессами"""
+        os.makedirs(self.path, exist_ok=True)
+        with self._thread_lock, open(os.path.join(self.path, '.lock'), 'w') as lock_file:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _publish_version(self) -> None:
+        """Новое поколение индекса для читателей (вызывается под _locked)"""
+        tmp_path = self.version_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(str(self.version() + 1))
+        os.replace(tmp_path, self.version_path)
+
+    def add(self, chunks: List[DocumentChunk], vectors: List[List[float]]) -> None:
+        raise NotImplementedError
+
+    def delete(self, chunks: List[DocumentChunk]) -> None:
+        raise NotImplementedError
+
+    def update_metadata(self, chunks: List[DocumentChunk]) -> None:
+        """Обновление метаданных сохраненных фрагментов без пересчета векторов"""
+
+    def has(self, chunks: List[DocumentChunk]) -> List[bool]:
+        """Есть ли в хранилище вектор каждого фрагмента (по порядку chunks)"""
+        raise NotImplementedError
+
+    def search(self, vector: List[float], k: int, document_types: List[str] = None,
+               uploaders: List[int] = None) -> List[Tuple[int, float]]:
+        """uploaders — pk пользователей, загрузивших документы (0 — документы без пользователя)"""
+        raise NotImplementedError
+
+    def search_batch(self, vectors: List[List[float]], k: int, document_types: List[str] = None,
+                     uploaders: List[int] = None) -> List[List[Tuple[int, float]]]:
+        """Поиск по нескольким запросам сразу (бэкенды с матричным умножением отвечают одним проходом)"""
+        return [self.search(vector, k, document_types, uploaders) for vector in vectors]
+
+    def count(self) -> int:
+        raise NotImplementedError
+
+    def vectors(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Все векторы хранилища (pk фрагментов, нормированная матрица) — для подбора параметров индекса"""
+        raise NotImplementedError
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Сохранение на диск накопленных изменений; возвращает сводку о хранилище"""
+        raise NotImplementedError
+
+    def clear(self) -> None:
+        """Удаление всех векторов (перед полной перестройкой)"""
+        raise NotImplementedError
+
+
+# Системы ChromaDB по каталогу: читателей — от старых к новым (см. ChromaVectorStore.open_system),
+# записи — одна на процесс (ChromaVectorStore.writer_system)
+_chroma_systems: Dict[str, List[Any]] = {}
+_chroma_writer_systems: Dict[str, Any] = {}
+_chroma_lock = threading.Lock()
+
+
+class ChromaVectorStore(VectorStore):
+    backend = 'chroma'
+    collection_name = "legal_documents_tj"
+
+    @classmethod
+    def default_path(cls):
+        return os.getenv("CHROMA_DB_PATH", getattr(settings, 'CHROMA_DB_PATH', os.path.join(settings.BASE_DIR, "chroma_db")))
+
+    def __init__(self, path: str = None, fresh: bool = False):
+        self.path = path or self.default_path()
+        self.dirty = False
+        system = self.open_system(self.path) if fresh else self.writer_system(self.path)
+        with _chroma_lock:
+            # from_system регистрирует System по каталогу, и клиент берет его оттуда
+            self.client = ChromaClient.from_system(system)
+        expected = chroma_collection_metadata()
+        self.collection = self.client.get_or_create_collection(
+            name=self.collection_name,
+            metadata=expected
+        )
+        # Существующая коллекция сохраняет параметры HNSW, с которыми была создана
+        metadata = self.collection.metadata or {}
+        if any(metadata.get(key, default) != expected[key] for key, default in CHROMA_HNSW_DEFAULTS.items()):
+            print("Warning: параметры HNSW коллекции ChromaDB отличаются от настроек CHROMA_HNSW_*; "
+                  "они применятся после python manage.py vector_store --rebuild")
+
+    @staticmethod
+    def _start_system(path: str):
+        system = System(Settings(is_persistent=True, persist_directory=path, anonymized_telemetry=False))
+        system.instance(ServerAPI)
+        system.start()
+        return system
+
+    @classmethod
+    def open_system(cls, path: str):
+        """
+        Новый System ChromaDB для читателя. Его HNSW-сегмент в памяти не видит записей
+        других процессов, поэтому новое поколение индекса читается новым System.
+        Предыдущий System дорабатывает начатые поиски и останавливается при
+        следующей перезагрузке, более старые — сразу
+        """
+        system = cls._start_system(path)
+        with _chroma_lock:
+            systems = _chroma_systems.setdefault(path, [])
+            systems.append(system)
+            while len(systems) > 2:
+                systems.pop(0).stop()
+        return system
+
+    @classmethod
+    def writer_system(cls, path: str):
+        """
+        System ChromaDB для записи: один на каталог в процессе и не останавливается,
+        поэтому все записывающие клиенты процесса работают с одним HNSW-сегментом,
+        а перезагрузка читателей не останавливает System, в который идет запись
+        """
+        with _chroma_lock:
+            if path not in _chroma_writer_systems:
+                _chroma_writer_systems[path] = cls._start_system(path)
+            return _chroma_writer_systems[path]
+
+    def add(self, chunks, vectors):
+        if chunks:
+            self.collection.add(
+                ids=[chunk.chroma_id for chunk in chunks],
+                documents=[chunk.content for chunk in chunks],
+                embeddings=normalize(vectors).tolist(),
+                metadatas=[chunk_metadata(chunk) for chunk in chunks]
+            )
+            self.dirty = True
+
+    def delete(self, chunks):
+        ids = [chunk.chroma_id for chunk in chunks]
+        self.dirty = self.dirty or bool(ids)
+        for start in range(0, len(ids), 500):
+            self.collection.delete(ids=ids[start:start + 500])
+
+    def update_metadata(self, chunks):
+        if chunks:
+            self.collection.update(
+                ids=[chunk.chroma_id for chunk in chunks],
+                metadatas=[chunk_metadata(chunk) for chunk in chunks]
+            )
+            self.dirty = True
+
+    def has(self, chunks):
+        ids = [chunk.chroma_id for chunk in chunks]
+        present = set()
+        for start in range(0, len(ids), 500):
+            present.update(self.collection.get(ids=ids[start:start + 500], include=[])['ids'])
+        return [chroma_id in present for chroma_id in ids]
+
+    def search(self, vector, k, document_types=None, uploaders=None):
+        # Фрагменты, добавленные до появления поля uploaded_by, находятся по нему после --rebuild
+        conditions = []
+        if document_types:
+            conditions.append({"document_type": {"$in": document_types}})
+        if uploaders:
+            conditions.append({"uploaded_by": {"$in": list(uploaders)}})
+        where = conditions[0] if len(conditions) == 1 else ({"$and": conditions} if conditions else None)
+        results = self.collection.query(
+            query_embeddings=normalize(vector).tolist(),
+            n_results=k,
+            where=where,
+            include=['metadatas', 'distances']
+        )
+        hits = []
+        if results['ids'] and results['ids'][0]:
+            for metadata, distance in zip(results['metadatas'][0], results['distances'][0]):
+                # Квадрат L2 для нормированных векторов: косинус = 1 - d / 2
+                hits.append((int(metadata['django_chunk_id']), 1.0 - distance / 2))
+        return hits
+
+    def count(self):
+        return self.collection.count()
+
+    def vectors(self):
+        ids, batches = [], []
+        total = self.count()
+        for offset in range(0, total, 5000):
+            page = self.collection.get(include=['embeddings', 'metadatas'], limit=5000, offset=offset)
+            ids.extend(int(metadata['django_chunk_id']) for metadata in page['metadatas'])
+            batches.append(np.asarray(page['embeddings'], dtype='float32'))
+        if not ids:
+            return np.zeros(0, dtype='int64'), np.zeros((0, 0), dtype='float32')
+        return np.array(ids, dtype='int64'), normalize(np.concatenate(batches))
+
+    def snapshot(self):
+        # ChromaDB сохраняет изменения сразу, остается опубликовать новое поколение
+        if self.dirty:
+            with self._locked():
+                self._publish_version()
+            self.dirty = False
+        return {'backend': self.backend, 'path': self.path, 'count': self.count(), 'size_bytes': directory_size(self.path)}
+
+    def clear(self):
+        self.client.delete_collection(self.collection_name)
+        self.collection = self.client.get_or_create_collection(
+            name=self.collection_name,
+            metadata=chroma_collection_metadata()
+        )
+        with self._locked():
+            self._publish_version()
+        self.dirty = False
+
+
+class SegmentedVectorStore(VectorStore):
+    """
+    Индекс в памяти процесса, который пишется на диск дельта-сегментами
+    (общая часть бэкендов faiss и numpy, id = pk фрагмента).
+
+    На диске — базовый индекс и дельта-сегменты, перечисленные в manifest.json.
+    snapshot() не переписывает индекс целиком: накопленные добавления и удаления
+    записываются новым сегментом (.npz), поэтому запись после обработки документа
+    стоит пропорционально этому документу, а не всему корпусу. При загрузке
+    сегменты применяются к базе по порядку; `manage.py vector_store --compact`
+    сливает их в новую базу в формате для mmap (см. knowledge.index_files),
+    разбитую на партиции по типу документа и загрузившему пользователю.
+    Атомарная замена манифеста — момент фиксации, все изменения идут под
+    файловой блокировкой, поэтому несколько воркеров могут индексировать
+    документы одновременно.
+
+    Индекс загружается в память при первом поиске (open_reader — сразу).
+    Пока он не загружен, хранилище только дописывает сегменты: задача
+    индексации или удаление документа не читают базу, и память процесса
+    пропорциональна документу, а не корпусу.
+
+    Подклассы задают структуру в памяти: _reset, _load_raw, _apply, _rows,
+    _contains, search и count (search и count вызывают _ensure_loaded);
+    _index_base — дополнительные файлы к новой базе.
+    """
+
+    def __init__(self, path: str = None, fresh: bool = False):
+        # Индекс всегда читается с диска, fresh ничего не меняет
+        self.path = path or self.default_path()
+        self.base = None
+        self.segments = []
+        self.pending_adds = []
+        self.pending_deletes = set()
+        self.loaded = False
+        self._reset()
+
+    @classmethod
+    def open_reader(cls) -> VectorStore:
+        store = cls()
+        store._ensure_loaded()
+        return store
+
+    def _ensure_loaded(self) -> None:
+        """Загрузка индекса в память; изменения, накопленные до нее, применяются поверх"""
+        if self.loaded:
+            return
+        if os.path.isdir(self.path):
+            # Под блокировкой: база и сегменты из одного манифеста
+            with self._locked():
+                self._load(index_files.read_manifest(self.path))
+        self.loaded = True
+        if self.pending_adds or self.pending_deletes:
+            self._apply(*self._pending())
+
+    def _reset(self) -> None:
+        """Пустой индекс в памяти"""
+        raise NotImplementedError
+
+    def _load_raw(self, ids: np.ndarray, vectors: np.ndarray, codes: np.ndarray, type_names: List[str],
+                  uploaders: np.ndarray) -> None:
+        """Загрузка базы (массивы могут быть отображениями файлов — данные нужно скопировать)"""
+        raise NotImplementedError
+
+    def _load_legacy(self, manifest: Dict[str, Any]) -> None:
+        raise ValueError(f"Бэкенд {self.backend} не читает базу {manifest['base']}")
+
+    def _apply(self, ids: np.ndarray, vectors: np.ndarray, types: List[str], uploaders: np.ndarray,
+               deletes: np.ndarray) -> None:
+        """Добавления (повторный pk заменяет вектор), затем удаления"""
+        raise NotImplementedError
+
+    def _contains(self, pk: int) -> bool:
+        """Есть ли pk в загруженном индексе"""
+        raise NotImplementedError
+
+    def _rows(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray, List[str], np.ndarray]:
+        """Содержимое индекса для уплотнения: (ids, векторы, коды типов, имена типов, пользователи)"""
+        raise NotImplementedError
+
+    def _index_base(self, manifest: Dict[str, Any]) -> Dict[str, Any]:
+        """Файлы поиска, которые строятся по записанной базе; возвращает поля для манифеста"""
+        return {}
+
+    def _base_indexed(self, manifest: Dict[str, Any]) -> bool:
+        """Построены ли для базы файлы поиска с текущими настройками"""
+        return True
+
+    def _load(self, manifest: Dict[str, Any]) -> None:
+        self._reset()
+        if index_files.is_raw_base(manifest):
+            self._load_raw(*index_files.open_raw_base(self.path, manifest), list(manifest['type_names']),
+                           index_files.partition_uploaders(manifest))
+        elif manifest['base']:
+            self._load_legacy(manifest)
+        self.base = manifest['base']
+        self.segments = []
+        for name in manifest['segments']:
+            self._apply_segment(name)
+        self.loaded = True
+
+    def _apply_segment(self, name: str) -> None:
+        self._apply(*index_files.read_segment(self.path, name))
+        self.segments.append(name)
+
+    def _pending(self):
+        """Накопленные изменения одним набором массивов (формат сегмента)"""
+        if self.pending_adds:
+            ids = np.concatenate([ids for ids, _, _, _ in self.pending_adds])
+            vectors = np.concatenate([matrix for _, matrix, _, _ in self.pending_adds])
+            types = [value for _, _, chunk_types, _ in self.pending_adds for value in chunk_types]
+            uploaders = np.concatenate([chunk_uploaders for _, _, _, chunk_uploaders in self.pending_adds])
+        else:
+            ids, vectors, types = np.zeros(0, dtype='int64'), np.zeros((0, 0), dtype='float32'), []
+            uploaders = np.zeros(0, dtype='int64')
+        deletes = np.array(sorted(self.pending_deletes), dtype='int64')
+        return ids, vectors, types, uploaders, deletes
+
+    def add(self, chunks, vectors):
+        if not chunks:
+            return
+        ids = np.array([chunk.pk for chunk in chunks], dtype='int64')
+        matrix = normalize(vectors)
+        types = [chunk.document.document_type for chunk in chunks]
+        uploaders = np.array([chunk_uploader(chunk) for chunk in chunks], dtype='int64')
+        if self.loaded:
+            self._apply(ids, matrix, types, uploaders, np.zeros(0, dtype='int64'))
+        self.pending_adds.append((ids, matrix, types, uploaders))
+        self.pending_deletes.difference_update(ids.tolist())
+
+    def delete(self, chunks):
+        pks = {chunk.pk for chunk in chunks}
+        if not pks:
+            return
+        if self.loaded:
+            empty = np.zeros(0, dtype='int64')
+            self._apply(empty, None, [], empty, np.array(sorted(pks), dtype='int64'))
+        self.pending_deletes.update(pks)
+
+    def has(self, chunks):
+        if not chunks:
+            return []
+        pks = np.array([chunk.pk for chunk in chunks], dtype='int64')
+        present = None if self.loaded else self._stored(pks)
+        if present is None:
+            self._ensure_loaded()
+            return [self._contains(pk) for pk in pks.tolist()]
+        for ids, _, _, _ in self.pending_adds:
+            present[np.isin(pks, ids)] = True
+        present[np.isin(pks, list(self.pending_deletes))] = False
+        return present.tolist()
+
+    def _stored(self, pks: np.ndarray) -> Optional[np.ndarray]:
+        """
+        Маска pk, чьи векторы записаны на диск, по ids базы (mmap) и сегментов
+        без загрузки индекса; None — база прежнего формата, ее нужно загрузить
+        """
+        present = np.zeros(len(pks), dtype=bool)
+        if not os.path.isdir(self.path):
+            return present
+        with self._locked():
+            manifest = index_files.read_manifest(self.path)
+            if index_files.is_raw_base(manifest):
+                base_ids = index_files.open_raw_base(self.path, manifest)[0]
+                rows = index_files.find_rows(base_ids, pks, index_files.open_row_order(self.path, manifest))
+                present[np.isin(pks, base_ids[rows])] = True
+            elif manifest['base']:
+                return None
+            for name in manifest['segments']:
+                ids, deletes = index_files.read_segment_ids(self.path, name)
+                present[np.isin(pks, ids)] = True
+                present[np.isin(pks, deletes)] = False
+        return present
+
+    def snapshot(self):
+        if self.pending_adds or self.pending_deletes:
+            ids, vectors, types, uploaders, deletes = self._pending()
+            with self._locked():
+                manifest = index_files.read_manifest(self.path)
+                # Незагруженный индекс догонять не нужно — сегмент только дописывается
+                if self.loaded:
+                    self._catch_up(manifest, ids, vectors, types, uploaders, deletes)
+
+                name = f"segment-{manifest['next_segment']:06d}.npz"
+                index_files.write_segment(self.path, name, ids, vectors, types, uploaders, deletes)
+                manifest['segments'].append(name)
+                manifest['next_segment'] += 1
+                index_files.write_manifest(self.path, manifest)
+                self.segments.append(name)
+                self._publish_version()
+            self.pending_adds = []
+            self.pending_deletes = set()
+        return self._summary()
+
+    def _catch_up(self, manifest: Dict[str, Any], *pending) -> None:
+        """Загруженный индекс — до состояния манифеста, затем свои изменения (под _locked)"""
+        known = manifest['base'] == self.base and manifest['segments'][:len(self.segments)] == self.segments
+        if not known:
+            # Индекс уплотнен или очищен после нашей загрузки
+            self._load(manifest)
+            self._apply(*pending)
+        elif len(manifest['segments']) > len(self.segments):
+            # Сегменты других воркеров применяем до своих изменений
+            for name in manifest['segments'][len(self.segments):]:
+                self._apply_segment(name)
+            self._apply(*pending)
+
+    def vectors(self):
+        self._ensure_loaded()
+        if not self.count():
+            return np.zeros(0, dtype='int64'), np.zeros((0, 0), dtype='float32')
+        ids, vectors = self._rows()[:2]
+        return ids, vectors
+
+    def _summary(self) -> Dict[str, Any]:
+        return {
+            'backend': self.backend,
+            'path': self.path,
+            # Без загрузки индекса число векторов неизвестно
+            'count': self.count() if self.loaded else None,
+            'size_bytes': directory_size(self.path),
+            'segments': len(index_files.read_manifest(self.path)['segments']),
+        }
+
+    def compact(self) -> Dict[str, Any]:
+        """Слияние базы и всех сегментов в новую базу (формат для mmap); возвращает сводку о хранилище"""
+        self.snapshot()
+        with self._locked():
+            manifest = index_files.read_manifest(self.path)
+            self._load(manifest)
+            if manifest['segments'] or not index_files.is_raw_base(manifest) or not self._base_indexed(manifest):
+                number = manifest['next_segment']
+                compacted = index_files.empty_manifest(number + 1)
+                if self.count():
+                    compacted.update(self._write_raw_base(f'base-{number:06d}'))
+                    try:
+                        compacted.update(self._index_base(compacted))
+                    except Exception:
+                        # Новая база не попала в манифест — ее файлы не нужны
+                        index_files.remove_files(self.path, compacted)
+                        raise
+                index_files.write_manifest(self.path, compacted)
+                index_files.remove_files(self.path, manifest)
+                self.base, self.segments = compacted['base'], []
+                if compacted.get('ann') != manifest.get('ann'):
+                    # Содержимое то же, но читатели должны открыть новый приближенный индекс
+                    self._publish_version()
+            # Иначе содержимое индекса не изменилось — новое поколение не публикуется
+        return self._summary()
+
+    def _write_raw_base(self, name: str) -> Dict[str, Any]:
+        ids, vectors, codes, type_names, uploaders = self._rows()
+        # Строки по партициям (тип, пользователь), внутри партиции — по возрастанию pk
+        order = np.lexsort((ids, uploaders, codes))
+        blocks = (
+            (ids[rows], vectors[rows], codes[rows])
+            for rows in (order[start:start + 65536] for start in range(0, len(order), 65536))
+        )
+        count, dimensions = index_files.write_raw_base(self.path, name, blocks)
+        index_files.write_row_order(self.path, name, ids[order])
+        return {
+            'base': name, 'base_format': 'raw', 'count': count,
+            'dimensions': dimensions, 'type_names': type_names,
+            'partitions': index_files.partition_table(codes[order], uploaders[order]),
+        }
+
+    def clear(self):
+        with self._locked():
+            manifest = index_files.read_manifest(self.path)
+            index_files.write_manifest(self.path, index_files.empty_manifest(manifest['next_segment']))
+            index_files.remove_files(self.path, manifest)
+            self._reset()
+            self.loaded = True
+            self.base = None
+            self.segments = []
+            self.pending_adds = []
+            self.pending_deletes = set()
+            self._publish_version()
+
+
+class FaissVectorStore(SegmentedVectorStore):
+    """
+    Точный поиск по косинусу: IndexFlatIP над нормированными векторами в IndexIDMap2.
+
+    Этот класс — для записи: индекс целиком в памяти процесса. Поиск в веб-процессах
+    идет через MmapVectorStore (настройка FAISS_MMAP). При FAISS_INDEX_TYPE 'hnsw'
+    или 'ivf' либо сжатии векторов (FAISS_VECTOR_COMPRESSION) уплотнение строит
+    по базе индекс поиска (knowledge.ann), которым пользуется MmapVectorStore;
+    запись, база и дельта-сегменты остаются точными, в float32.
+    """
+
+    backend = 'faiss'
+
+    @classmethod
+    def default_path(cls):
+        return getattr(settings, 'FAISS_INDEX_PATH', os.path.join(settings.BASE_DIR, 'vector_store', 'faiss'))
+
+    @classmethod
+    def open_reader(cls) -> VectorStore:
+        if getattr(settings, 'FAISS_MMAP', True):
+            return MmapVectorStore(cls.default_path())
+        return super().open_reader()
+
+    def _reset(self):
+        self.index = None
+        self.document_types = {}
+        self.uploaders = {}
+
+    def _load_raw(self, ids, vectors, codes, type_names, uploaders):
+        self.index = self._new_index(vectors.shape[1])
+        for start in range(0, len(ids), 65536):
+            self.index.add_with_ids(
+                np.ascontiguousarray(vectors[start:start + 65536]), np.asarray(ids[start:start + 65536])
+            )
+        self.document_types = {pk: type_names[code] for pk, code in zip(ids.tolist(), codes.tolist())}
+        self.uploaders = dict(zip(ids.tolist(), uploaders.tolist()))
+
+    def _load_legacy(self, manifest):
+        self.index = faiss.read_index(os.path.join(self.path, manifest['base']))
+        self.document_types = index_files.legacy_types(self.path, manifest)
+
+    def _apply(self, ids, vectors, types, uploaders, deletes):
+        if len(ids):
+            if self.index is None:
+                self.index = self._new_index(vectors.shape[1])
+            # remove_ids проходит весь индекс — вызываем, только если pk уже есть
+            existing = [pk for pk in ids.tolist() if pk in self.document_types]
+            if existing:
+                self.index.remove_ids(np.array(existing, dtype='int64'))
+            self.index.add_with_ids(vectors, ids)
+            self.document_types.update(zip(ids.tolist(), types))
+            self.uploaders.update(zip(ids.tolist(), uploaders.tolist()))
+        if len(deletes) and self.index is not None:
+            self.index.remove_ids(deletes)
+            for pk in deletes.tolist():
+                self.document_types.pop(pk, None)
+                self.uploaders.pop(pk, None)
+
+    def _contains(self, pk):
+        return pk in self.document_types
+
+    def _rows(self):
+        ids = faiss.vector_to_array(self.index.id_map)
+        vectors = self.index.index.reconstruct_n(0, self.index.ntotal)
+        type_names = []
+        codes = index_files.type_codes(type_names, (self.document_types[pk] for pk in ids.tolist()))
+        uploaders = np.array([self.uploaders.get(pk, 0) for pk in ids.tolist()], dtype='int64')
+        return ids, vectors, codes, type_names, uploaders
+
+    @staticmethod
+    def _new_index(dimensions: int):
+        return faiss.IndexIDMap2(faiss.IndexFlatIP(dimensions))
+
+    def _base_indexed(self, manifest):
+        config = ann_config()
+        return not config['params'] or ann_matches(manifest.get('ann'), config)
+
+    def _index_base(self, manifest):
+        config = ann_config()
+        if not config['params']:
+            return {}
+        ids, vectors, _ = index_files.open_raw_base(self.path, manifest)
+        index = ann.build_index(vectors, ids, config['type'], config['params'])
+        name = manifest['base'] + ann.ANN_SUFFIX
+        ann.write_index(self.path, name, index)
+        return {'ann': {'file': name, 'type': config['type'], 'params': config['params']}}
+
+    def search(self, vector, k, document_types=None, uploaders=None):
+        self._ensure_loaded()
+        if self.index is None or self.index.ntotal == 0:
+            return []
+        query = normalize(vector)
+        # При фильтре по типу документа или пользователю берем кандидатов с запасом
+        filtered = bool(document_types or uploaders)
+        fetch = min(self.index.ntotal, k * 10) if filtered else k
+        while True:
+            scores, ids = self.index.search(query, fetch)
+            hits = []
+            for pk, score in zip(ids[0], scores[0]):
+                if pk < 0:
+                    continue
+                if document_types and self.document_types.get(int(pk)) not in document_types:
+                    continue
+                if uploaders and self.uploaders.get(int(pk), 0) not in uploaders:
+                    continue
+                hits.append((int(pk), float(score)))
+            if len(hits) >= k or fetch >= self.index.ntotal:
+                return hits[:k]
+            fetch = min(self.index.ntotal, fetch * 4)
+
+    def count(self):
+        self._ensure_loaded()
+        return self.index.ntotal if self.index is not None else 0
+
+
+class NumpyVectorStore(SegmentedVectorStore):
+    """
+    Точный поиск перебором на NumPy без внешних библиотек.
+
+    Нормированные векторы лежат в одной непрерывной матрице float32 (с запасом
+    по строкам, как у list), рядом — массивы pk и кодов типов документов.
+    Запрос — одно умножение матрицы на вектор и argpartition, пачка запросов —
+    одно умножение матриц. Фильтр по document_type и пользователю — маска по
+    массивам кодов (байт и 8 байт на строку против 4×D у вектора): если она
+    отбирает меньше половины строк, умножаются только отобранные строки.
+    Удаление переносит последнюю строку на место удаленной, поэтому матрица
+    остается без дыр. Для корпусов в десятки тысяч фрагментов это быстрее
+    и проще HNSW и не дает приближенных результатов.
+    """
+
+    backend = 'numpy'
+
+    @classmethod
+    def default_path(cls):
+        return getattr(settings, 'NUMPY_INDEX_PATH', os.path.join(settings.BASE_DIR, 'vector_store', 'numpy'))
+
+    def _reset(self):
+        self.matrix = np.zeros((0, 0), dtype='float32')
+        self.ids = np.zeros(0, dtype='int64')
+        self.codes = np.zeros(0, dtype='uint8')
+        self.uploaders = np.zeros(0, dtype='int64')
+        self.type_names = []
+        self.rows = {}
+        self.size = 0
+
+    def _reserve(self, rows: int, dimensions: int) -> None:
+        """Место еще под rows строк (емкость растет вдвое, копирование амортизировано)"""
+        if self.size == 0 and self.matrix.shape[1] != dimensions:
+            self.matrix = np.zeros((0, dimensions), dtype='float32')
+        needed = self.size + rows
+        if needed <= len(self.matrix):
+            return
+        capacity = max(needed, len(self.matrix) * 2, 1024)
+        matrix = np.empty((capacity, dimensions), dtype='float32')
+        matrix[:self.size] = self.matrix[:self.size]
+        ids = np.empty(capacity, dtype='int64')
+        ids[:self.size] = self.ids[:self.size]
+        codes = np.empty(capacity, dtype='uint8')
+        codes[:self.size] = self.codes[:self.size]
+        uploaders = np.empty(capacity, dtype='int64')
+        uploaders[:self.size] = self.uploaders[:self.size]
+        self.matrix, self.ids, self.codes, self.uploaders = matrix, ids, codes, uploaders
+
+    def _load_raw(self, ids, vectors, codes, type_names, uploaders):
+        self.matrix = np.array(vectors, dtype='float32')
+        self.ids = np.array(ids, dtype='int64')
+        self.codes = np.array(codes, dtype='uint8')
+        self.uploaders = np.array(uploaders, dtype='int64')
+        self.type_names = type_names
+        self.size = len(self.ids)
+        self.rows = dict(zip(self.ids.tolist(), range(self.size)))
+
+    def _apply(self, ids, vectors, types, uploaders, deletes):
+        if len(ids):
+            codes = index_files.type_codes(self.type_names, types)
+            new = []
+            for i, pk in enumerate(ids.tolist()):
+                row = self.rows.get(pk)
+                if row is None:
+                    new.append(i)
+                else:
+                    self.matrix[row] = vectors[i]
+                    self.codes[row] = codes[i]
+                    self.uploaders[row] = uploaders[i]
+            if new:
+                self._reserve(len(new), vectors.shape[1])
+                end = self.size + len(new)
+                self.matrix[self.size:end] = vectors[new]
+                self.ids[self.size:end] = ids[new]
+                self.codes[self.size:end] = codes[new]
+                self.uploaders[self.size:end] = uploaders[new]
+                self.rows.update(zip(ids[new].tolist(), range(self.size, end)))
+                self.size = end
+        for pk in deletes.tolist():
+            row = self.rows.pop(pk, None)
+            if row is None:
+                continue
+            last = self.size - 1
+            if row != last:
+                self.matrix[row] = self.matrix[last]
+                self.ids[row] = self.ids[last]
+                self.codes[row] = self.codes[last]
+                self.uploaders[row] = self.uploaders[last]
+                self.rows[int(self.ids[row])] = row
+            self.size = last
+
+    def _contains(self, pk):
+        return pk in self.rows
+
+    def _rows(self):
+        return (self.ids[:self.size], self.matrix[:self.size], self.codes[:self.size], list(self.type_names),
+                self.uploaders[:self.size])
+
+    def _filter_mask(self, document_types: Optional[List[str]], uploaders: Optional[List[int]]) -> Optional[np.ndarray]:
+        mask = None
+        if document_types:
+            codes = [code for code, name in enumerate(self.type_names) if name in document_types]
+            mask = np.isin(self.codes[:self.size], codes)
+        if uploaders:
+            uploader_mask = np.isin(self.uploaders[:self.size], uploaders)
+            mask = uploader_mask if mask is None else mask & uploader_mask
+        return mask
+
+    def _candidates(self, document_types, uploaders) -> Tuple[np.ndarray, Optional[np.ndarray], Optional[np.ndarray]]:
+        """
+        (матрица для умножения, ее номера строк или None — вся матрица, маска по ее строкам).
+        Узкий фильтр: копируются только отобранные строки, и умножение идет по ним
+        """
+        matrix = self.matrix[:self.size]
+        mask = self._filter_mask(document_types, uploaders)
+        if mask is None:
+            return matrix, None, None
+        rows = np.flatnonzero(mask)
+        if len(rows) * 2 < self.size:
+            return matrix[rows], rows, None
+        return matrix, None, mask
+
+    def search(self, vector, k, document_types=None, uploaders=None):
+        self._ensure_loaded()
+        if self.size == 0:
+            return []
+        query = normalize(vector)[0]
+        matrix, rows, mask = self._candidates(document_types, uploaders)
+        scores = matrix @ query
+        return self._hits(scores, top_k_rows(scores, k, mask), rows, mask)
+
+    def search_batch(self, vectors, k, document_types=None, uploaders=None):
+        self._ensure_loaded()
+        queries = normalize(vectors)
+        if self.size == 0:
+            return [[] for _ in queries]
+        matrix, rows, mask = self._candidates(document_types, uploaders)
+        results = []
+        # Пачками по 256 запросов: матрица оценок Q×N остается умеренной
+        for start in range(0, len(queries), 256):
+            scores = queries[start:start + 256] @ matrix.T
+            for row_scores, top in zip(scores, top_k_rows(scores, k, mask)):
+                results.append(self._hits(row_scores, top, rows, mask))
+        return results
+
+    def _hits(self, scores: np.ndarray, top: np.ndarray, rows: Optional[np.ndarray],
+              mask: Optional[np.ndarray]) -> List[Tuple[int, float]]:
+        return [(int(self.ids[row if rows is None else rows[row]]), float(scores[row]))
+                for row in top if mask is None or mask[row]]
+
+    def count(self):
+        self._ensure_loaded()
+        return self.size
+
+
+class MmapVectorStore(VectorStore):
+    """
+    Индекс FAISS-бэкенда только для чтения, общий для процессов узла.
+
+    База отображается в память (mmap), поэтому воркеры gunicorn делят одни
+    страницы кэша ОС, а собственная память процесса — маска строк базы,
+    замененных или удаленных после уплотнения, и векторы дельта-сегментов.
+    Поиск точный, как у IndexFlatIP: скалярные произведения по отображенной
+    матрице (ядро FAISS) и argpartition.
+
+    При FAISS_INDEX_TYPE 'hnsw' или 'ivf' база ищется приближенным индексом,
+    построенным при уплотнении (тоже через mmap): кандидаты берутся с запасом
+    и отсеиваются по маске строк и фильтру типов. Дельта-сегменты всегда
+    ищутся точно. Если индекс построен с другими параметрами, поиск точный,
+    пока не выполнено `manage.py vector_store --compact`.
+
+    При сжатии векторов (FAISS_VECTOR_COMPRESSION) по памяти проходит только
+    сжатый индекс, а k × FAISS_RESCORE_FACTOR лучших кандидатов пересчитываются
+    по полным векторам базы — из mmap читаются лишь их строки.
+
+    Поиск с фильтром по типу документа или пользователю читает только строки
+    нужных партиций базы (непрерывные диапазоны, см. knowledge.index_files)
+    и сливает их лучшие результаты по оценке. Если фильтр отбирает больше
+    PARTITION_SCAN_FRACTION базы и есть приближенный индекс, ищет по нему.
+    """
+
+    backend = 'faiss'
+
+    def __init__(self, path: str = None):
+        self.path = path or FaissVectorStore.default_path()
+        self.type_names = []
+        self.base_ids = self.base_vectors = self.base_codes = None
+        self.base_order = self.partitions = None
+        self.alive = None
+        self.ann = None
+        self.rescore = 0
+        with self._locked():
+            manifest = index_files.read_manifest(self.path)
+            self._open_base(manifest)
+            self._open_segments(manifest['segments'])
+
+    def _open_base(self, manifest: Dict[str, Any]) -> None:
+        if index_files.is_raw_base(manifest):
+            self.type_names = list(manifest['type_names'])
+            self.base_ids, self.base_vectors, self.base_codes = index_files.open_raw_base(self.path, manifest)
+            self.base_order = index_files.open_row_order(self.path, manifest)
+            if manifest.get('partitions') is not None:
+                self.partitions = np.array(manifest['partitions'], dtype='int64').reshape(-1, 4)
+            self.ann = self._open_ann(manifest)
+        elif manifest['base']:
+            # Прежний формат (index.faiss) не отображается — читается в память
+            index = faiss.read_index(os.path.join(self.path, manifest['base']))
+            ids = faiss.vector_to_array(index.id_map)
+            order = np.argsort(ids, kind='stable')
+            types = index_files.legacy_types(self.path, manifest)
+            self.base_ids = ids[order]
+            self.base_vectors = index.index.reconstruct_n(0, index.ntotal)[order]
+            self.base_codes = index_files.type_codes(self.type_names, (types.get(pk, '') for pk in self.base_ids.tolist()))
+
+    def _open_ann(self, manifest: Dict[str, Any]):
+        config = ann_config()
+        if not config['params']:
+            return None
+        if not ann_matches(manifest.get('ann'), config):
+            print(f"Warning: индекс {ann.describe(config['type'], config['params'])} не построен, поиск точный. "
+                  f"Выполните: python manage.py vector_store --compact")
+            return None
+        index = ann.read_index(self.path, manifest['ann']['file'])
+        ann.set_search_params(index, **config['search'])
+        self.rescore = config['rescore']
+        return index
+
+    def _open_segments(self, names: List[str]) -> None:
+        delta = {}
+        touched = []
+        for name in names:
+            ids, vectors, types, uploaders, deletes = index_files.read_segment(self.path, name)
+            for pk, vector, document_type, uploader in zip(ids.tolist(), vectors, types, uploaders.tolist()):
+                delta[pk] = (vector, document_type, uploader)
+            for pk in deletes.tolist():
+                delta.pop(pk, None)
+            touched.extend((ids, deletes))
+
+        if self.base_ids is not None and touched:
+            rows = index_files.find_rows(self.base_ids, np.concatenate(touched), self.base_order)
+            if len(rows):
+                self.alive = np.ones(len(self.base_ids), dtype=bool)
+                self.alive[rows] = False
+
+        self.delta_ids = np.array(list(delta), dtype='int64')
+        self.delta_vectors = (
+            np.stack([vector for vector, _, _ in delta.values()]) if delta else np.zeros((0, 0), dtype='float32')
+        )
+        self.delta_codes = index_files.type_codes(self.type_names, (document_type for _, document_type, _ in delta.values()))
+        self.delta_uploaders = np.array([uploader for _, _, uploader in delta.values()], dtype='int64')
+
+    def search(self, vector, k, document_types=None, uploaders=None):
+        query = normalize(vector)[0]
+        codes = None
+        if document_types:
+            codes = [code for code, name in enumerate(self.type_names) if name in document_types]
+            if not codes:
+                return []
+        uploaders = list(uploaders) if uploaders else None
+        hits = []
+        if self.base_ids is not None:
+            hits.extend(self._search_base(query, k, codes, uploaders))
+        if len(self.delta_ids):
+            mask = np.isin(self.delta_uploaders, uploaders) if uploaders is not None else None
+            hits.extend(exact_top_k(self.delta_vectors, self.delta_ids, self.delta_codes, query, k, codes, mask))
+        hits.sort(key=lambda hit: hit[1], reverse=True)
+        return hits[:k]
+
+    def _search_base(self, query: np.ndarray, k: int, codes: Optional[List[int]],
+                     uploaders: Optional[List[int]]) -> List[Tuple[int, float]]:
+        if self.partitions is not None and (codes is not None or uploaders is not None):
+            ranges = index_files.select_partitions(self.partitions, codes, uploaders)
+            selected = int((ranges[:, 1] - ranges[:, 0]).sum())
+            if self.ann is None or selected <= PARTITION_SCAN_FRACTION * len(self.base_ids):
+                return self._search_partitions(query, k, ranges)
+        elif self.partitions is None and uploaders is not None and 0 not in uploaders:
+            # В базе до разбиения на партиции пользователи не записаны (0)
+            return []
+        if self.ann is not None:
+            return self._search_ann(query, k, codes, uploaders)
+        return exact_top_k(self.base_vectors, self.base_ids, self.base_codes, query, k, codes, self.alive)
+
+    def _search_partitions(self, query: np.ndarray, k: int, ranges: np.ndarray) -> List[Tuple[int, float]]:
+        """Точный поиск по диапазонам строк партиций; k лучших каждого сливаются по оценке"""
+        hits = []
+        for start, end in ranges.tolist():
+            alive = self.alive[start:end] if self.alive is not None else None
+            hits.extend(exact_top_k(self.base_vectors[start:end], self.base_ids[start:end], None, query, k,
+                                    alive=alive))
+        hits.sort(key=lambda hit: hit[1], reverse=True)
+        return hits[:k]
+
+    def _base_rows(self, pks: np.ndarray) -> np.ndarray:
+        """Номера строк базы по pk (все pk есть в базе)"""
+        if self.base_order is None:
+            return np.searchsorted(self.base_ids, pks)
+        return np.asarray(self.base_order[np.searchsorted(self.base_ids, pks, sorter=self.base_order)])
+
+    def _row_uploaders(self, rows: np.ndarray) -> np.ndarray:
+        if self.partitions is None:
+            return np.zeros(len(rows), dtype='int64')
+        return self.partitions[np.searchsorted(self.partitions[:, 2], rows, side='right') - 1, 1]
+
+    def _search_ann(self, query: np.ndarray, k: int, codes: Optional[List[int]],
+                    uploaders: Optional[List[int]]) -> List[Tuple[int, float]]:
+        total = len(self.base_ids)
+        filtered = codes is not None or uploaders is not None or self.alive is not None
+        wanted = k * self.rescore if self.rescore else k
+        # Строки, замененные сегментами, чужие типы и пользователи отсеиваются после поиска — берем с запасом
+        fetch = min(total, wanted * 10 if filtered else wanted)
+        while True:
+            scores, pks = self.ann.search(query[None], fetch)
+            found = pks[0] >= 0
+            scores, rows = scores[0][found], self._base_rows(pks[0][found])
+            if filtered:
+                keep = self.alive[rows] if self.alive is not None else np.ones(len(rows), dtype=bool)
+                if codes is not None:
+                    keep &= np.isin(self.base_codes[rows], codes)
+                if uploaders is not None:
+                    keep &= np.isin(self._row_uploaders(rows), uploaders)
+                scores, rows = scores[keep], rows[keep]
+            if len(rows) >= wanted or fetch >= total:
+                break
+            fetch = min(total, fetch * 4)
+        rows, scores = rows[:wanted], scores[:wanted]
+        if self.rescore:
+            rows, scores = ann.rescore(self.base_vectors, rows, query, k)
+        return [(int(self.base_ids[row]), float(score)) for row, score in zip(rows[:k], scores[:k])]
+
+    def count(self):
+        base = 0
+        if self.base_ids is not None:
+            base = len(self.base_ids) if self.alive is None else int(self.alive.sum())
+        return base + len(self.delta_ids)
+
+    def snapshot(self):
+        return {'backend': self.backend, 'path': self.path, 'count': self.count(), 'size_bytes': directory_size(self.path)}
+
+    def has(self, chunks):
+        pks = np.array([chunk.pk for chunk in chunks], dtype='int64')
+        present = set(self.delta_ids.tolist())
+        if self.base_ids is not None:
+            rows = index_files.find_rows(self.base_ids, pks, self.base_order)
+            if self.alive is not None:
+                rows = rows[self.alive[rows]]
+            present.update(self.base_ids[rows].tolist())
+        return [pk in present for pk in pks.tolist()]
+
+    def add(self, chunks, vectors):
+        raise TypeError("Индекс открыт только для чтения")
+
+    def delete(self, chunks):
+        raise TypeError("Индекс открыт только для чтения")
+
+    def clear(self):
+        raise TypeError("Индекс открыт только для чтения")
+
+
+def inner_products(vectors: np.ndarray, query: np.ndarray) -> np.ndarray:
+    """
+    Скалярные произведения запроса со строками матрицы. Ядро FAISS читает
+    отображенную матрицу без копии и вдвое быстрее gemv из BLAS numpy
+    """
+    if not FAISS_AVAILABLE:
+        return np.asarray(vectors @ query)
+    vectors = np.ascontiguousarray(vectors, dtype='float32')
+    query = np.ascontiguousarray(query, dtype='float32')
+    scores = np.empty(len(vectors), dtype='float32')
+    faiss.fvec_inner_products_ny(
+        faiss.swig_ptr(scores), faiss.swig_ptr(query), faiss.swig_ptr(vectors), vectors.shape[1], len(vectors)
+    )
+    return scores
+
+
+def top_k_rows(scores: np.ndarray, k: int, mask: np.ndarray = None) -> np.ndarray:
+    """
+    Номера k строк с наибольшей оценкой по убыванию (для матрицы оценок Q×N — по каждой
+    строке). Строки вне маски получают -inf и попадают в ответ, только если разрешенных меньше k
+    """
+    if mask is not None:
+        scores = np.where(mask, scores, -np.inf)
+    k = min(k, scores.shape[-1])
+    if k <= 0:
+        return np.zeros(scores.shape[:-1] + (0,), dtype='int64')
+    top = np.argpartition(-scores, k - 1, axis=-1)[..., :k]
+    order = np.argsort(-np.take_along_axis(scores, top, axis=-1), axis=-1, kind='stable')
+    return np.take_along_axis(top, order, axis=-1)
+
+
+def exact_top_k(vectors: np.ndarray, ids: np.ndarray, codes: np.ndarray, query: np.ndarray, k: int,
+                type_codes: List[int] = None, alive: np.ndarray = None) -> List[Tuple[int, float]]:
+    """Точные k ближайших по скалярному произведению с маской строк и фильтром по кодам типов"""
+    scores = inner_products(vectors, query)
+    mask = alive
+    if type_codes is not None:
+        type_mask = np.isin(codes, type_codes)
+        mask = type_mask if mask is None else mask & type_mask
+    return [(int(ids[row]), float(scores[row])) for row in top_k_rows(scores, k, mask) if mask is None or mask[row]]
+
+
+BACKENDS = {
+    'chroma': (ChromaVectorStore, lambda: CHROMADB_AVAILABLE, 'pip install chromadb'),
+    'faiss': (FaissVectorStore, lambda: FAISS_AVAILABLE, 'pip install faiss-cpu'),
+    'numpy': (NumpyVectorStore, lambda: True, ''),
+}
+
+
+def _backend(backend: str = None):
+    backend = backend or getattr(settings, 'VECTOR_STORE_BACKEND', 'chroma')
+    if backend not in BACKENDS:
+        raise ValueError(f"Неизвестный бэкенд векторного хранилища: {backend}")
+    return backend, BACKENDS[backend]
+
+
+def get_vector_store(backend: str = None, fresh: bool = False, readonly: bool = False) -> Optional[VectorStore]:
+    """
+    Хранилище по настройке VECTOR_STORE_BACKEND; None, если библиотека бэкенда не установлена.
+    fresh=True — открыть индекс заново, не переиспользуя состояние клиента в процессе;
+    readonly=True — хранилище только для поиска (для FAISS — общий для процессов mmap)
+    """
+    backend, (store_class, available, install_hint) = _backend(backend)
+    if not available():
+        print(f"Warning: векторное хранилище '{backend}' недоступно. Установите: {install_hint}")
+        return None
+    if readonly:
+        return store_class.open_reader()
+    return store_class(fresh=fresh)
+
+
+def index_version(backend: str = None) -> int:
+    """Текущее поколение индекса без открытия хранилища (одно чтение маленького файла)"""
+    _, (store_class, _, _) = _backend(backend)
+    return read_version(os.path.join(store_class.default_path(), VERSION_NAME))
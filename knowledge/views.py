@@ -1,16 +1,19 @@
 import os
 import json
+import time
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
 from django.views.decorators.http import require_http_methods
 from django.core.paginator import Paginator
 from django.db import transaction
 from django.utils import timezone
 from .models import KnowledgeDocument
 from .document_processor import DocumentProcessor
-from .chroma_service import ChromaService
+from .index_service import IndexService
+from .retrieval import get_retrieval_service
+from .ingestion_queue import enqueue_document
 
 
 @login_required
@@ -25,10 +28,9 @@ def document_list(request):
     page_number = request.GET.get('page')
     page_obj = paginator.get_page(page_number)
     
-    # Статистика ChromaDB
+    # Статистика векторного хранилища
     try:
-        chroma_service = ChromaService()
-        stats = chroma_service.get_collection_stats()
+        stats = get_retrieval_service().get_collection_stats()
     except Exception:
         stats = {'total_documents': 0, 'total_chunks': 0}
     
@@ -93,14 +95,8 @@ def upload_document(request):
                 document.description = description
                 document.save()
             
-            # Запускаем обработку в фоне
-            processor = DocumentProcessor()
-            success = processor.process_document(document)
-            
-            if success:
-                messages.success(request, f'Документ "{title}" успешно загружен и обработан')
-            else:
-                messages.warning(request, f'Документ "{title}" загружен, но произошла ошибка при обработке')
+            # Обработку выполнит воркер очереди (задание создается сигналом post_save)
+            messages.success(request, f'Документ "{title}" загружен и поставлен в очередь на обработку')
     
     except Exception as e:
         messages.error(request, f'Ошибка при загрузке документа: {str(e)}')
@@ -113,26 +109,18 @@ def process_all_documents(request):
     """Обработка всех необработанных документов"""
     if request.method == 'POST':
         try:
-            processor = DocumentProcessor()
             documents = KnowledgeDocument.objects.filter(
                 uploaded_by=request.user,
                 status__in=['uploaded', 'error']
             )
             
-            success_count = 0
-            error_count = 0
-            
+            queued_count = 0
             for document in documents:
-                success = processor.process_document(document)
-                if success:
-                    success_count += 1
-                else:
-                    error_count += 1
+                enqueue_document(document)
+                queued_count += 1
             
-            if success_count > 0:
-                messages.success(request, f'Успешно обработано {success_count} документов')
-            if error_count > 0:
-                messages.warning(request, f'Ошибка при обработке {error_count} документов')
+            if queued_count > 0:
+                messages.success(request, f'В очередь на обработку поставлено {queued_count} документов')
                 
         except Exception as e:
             messages.error(request, f'Ошибка при обработке документов: {str(e)}')
@@ -166,6 +154,58 @@ def document_detail(request, pk):
     return render(request, 'knowledge/document_detail.html', context)
 
 
+@login_required
+def api_document_progress(request, pk):
+    """Текущий прогресс индексации документа (JSON)"""
+    document = get_object_or_404(KnowledgeDocument, pk=pk, uploaded_by=request.user)
+    return JsonResponse(document.progress_payload())
+
+
+@login_required
+def api_documents_progress(request):
+    """
+    Прогресс нескольких документов одним запросом (?ids=1,2,3) — список документов
+    опрашивает его по таймеру, а не держит по потоку SSE на каждый документ
+    """
+    ids = [int(pk) for pk in request.GET.get('ids', '').split(',') if pk.strip().isdigit()][:100]
+    documents = KnowledgeDocument.objects.filter(pk__in=ids, uploaded_by=request.user)
+    return JsonResponse({str(document.pk): document.progress_payload() for document in documents})
+
+
+PROGRESS_POLL_SECONDS = 1.0
+PROGRESS_STREAM_SECONDS = 60
+
+
+@login_required
+def document_progress_stream(request, pk):
+    """
+    Прогресс индексации через Server-Sent Events (страница документа, один поток на страницу).
+
+    Событие отправляется при каждом изменении счетчиков; поток закрывается,
+    когда документ готов или упал с ошибкой, либо через PROGRESS_STREAM_SECONDS
+    (EventSource переподключится сам и не будет держать воркер WSGI вечно).
+    """
+    document = get_object_or_404(KnowledgeDocument, pk=pk, uploaded_by=request.user)
+
+    def event_stream():
+        last_payload = None
+        deadline = time.monotonic() + PROGRESS_STREAM_SECONDS
+        while True:
+            payload = document.progress_payload()
+            if payload != last_payload:
+                yield f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+                last_payload = payload
+            if document.status in ('ready', 'error') or time.monotonic() >= deadline:
+                return
+            time.sleep(PROGRESS_POLL_SECONDS)
+            document.refresh_from_db(fields=KnowledgeDocument.PROGRESS_FIELDS)
+
+    response = StreamingHttpResponse(event_stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
 @login_required
 @require_http_methods(["POST"])
 def delete_document(request, pk):
@@ -178,9 +218,9 @@ def delete_document(request, pk):
     
     try:
         with transaction.atomic():
-            # Удаляем из ChromaDB
-            chroma_service = ChromaService()
-            chroma_service.delete_document(document)
+            # Удаляем из векторного хранилища
+            index_service = IndexService()
+            index_service.delete_document(document)
             
             # Удаляем файл
             if document.file and os.path.exists(document.file.path):
@@ -208,13 +248,12 @@ def reprocess_document(request, pk):
     )
     
     try:
-        processor = DocumentProcessor()
-        success = processor.reprocess_document(document)
-        
-        if success:
-            messages.success(request, f'Документ "{document.title}" успешно переобработан')
-        else:
-            messages.error(request, f'Ошибка при переобработке документа "{document.title}"')
+        # Переобработку выполнит воркер очереди: run_job переиспользует неизменившиеся фрагменты
+        enqueue_document(document)
+        if document.status != 'processing':
+            document.status = 'pending'
+            document.save(update_fields=['status'])
+        messages.success(request, f'Документ "{document.title}" поставлен в очередь на переобработку')
     
     except Exception as e:
         messages.error(request, f'Ошибка при переобработке: {str(e)}')
@@ -227,16 +266,17 @@ def search_documents(request):
     """Поиск по документам"""
     query = request.GET.get('q', '').strip()
     document_types = request.GET.getlist('types')
+    only_mine = bool(request.GET.get('mine'))
     
     results = []
     
     if query:
         try:
-            chroma_service = ChromaService()
-            results = chroma_service.search_documents(
+            results = get_retrieval_service().search_documents(
                 query=query,
                 limit=20,
-                document_types=document_types if document_types else None
+                document_types=document_types if document_types else None,
+                uploaders=[request.user.pk] if only_mine else None
             )
         except Exception as e:
             messages.error(request, f'Ошибка при поиске: {str(e)}')
@@ -245,6 +285,7 @@ def search_documents(request):
         'query': query,
         'results': results,
         'selected_types': document_types,
+        'only_mine': only_mine,
         'document_types': KnowledgeDocument.DOCUMENT_TYPES,
     }
     
@@ -261,8 +302,7 @@ def api_search(request):
         return JsonResponse({'results': []})
     
     try:
-        chroma_service = ChromaService()
-        results = chroma_service.search_documents(
+        results = get_retrieval_service().search_documents(
             query=query,
             limit=limit
         )
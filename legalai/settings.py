@@ -277,3 +277,114 @@ LOGOUT_REDIRECT_URL = '/'
 
 # ChromaDB persistent path (default to BASE_DIR/chroma_db for local; override in Cloud Run)
 CHROMA_DB_PATH = os.getenv('CHROMA_DB_PATH', str(BASE_DIR / 'chroma_db'))
+
+# Векторное хранилище фрагментов: 'chroma', 'faiss' или 'numpy' (после смены бэкенда: python manage.py vector_store --rebuild)
+VECTOR_STORE_BACKEND = os.getenv('VECTOR_STORE_BACKEND', 'chroma')
+# Индекс FAISS дописывается дельта-сегментами; слияние: python manage.py vector_store --compact
+FAISS_INDEX_PATH = os.getenv('FAISS_INDEX_PATH', str(BASE_DIR / 'vector_store' / 'faiss'))
+# Поиск по базе индекса через mmap: воркеры узла делят одни страницы в памяти
+FAISS_MMAP = os.getenv('FAISS_MMAP', 'true').lower() == 'true'
+# Индекс поиска по базе FAISS: 'flat' (точный), 'hnsw' или 'ivf' — строится при vector_store --compact.
+# Параметры под свой корпус подбирает python manage.py tune_index
+FAISS_INDEX_TYPE = os.getenv('FAISS_INDEX_TYPE', 'flat')
+FAISS_HNSW_M = int(os.getenv('FAISS_HNSW_M', '32'))
+FAISS_HNSW_EF_CONSTRUCTION = int(os.getenv('FAISS_HNSW_EF_CONSTRUCTION', '200'))
+FAISS_HNSW_EF_SEARCH = int(os.getenv('FAISS_HNSW_EF_SEARCH', '64'))
+FAISS_IVF_NLIST = int(os.getenv('FAISS_IVF_NLIST', '0'))  # 0 — 4·√N по размеру базы
+FAISS_IVF_NPROBE = int(os.getenv('FAISS_IVF_NPROBE', '16'))
+# Сжатие векторов в индексе поиска FAISS: 'none', 'float16', 'int8' или 'pca' (до FAISS_PCA_DIMENSIONS измерений).
+# k × FAISS_RESCORE_FACTOR лучших кандидатов пересчитываются по полным векторам (0 — без пересчета).
+# Экономию памяти и потерю recall на своем корпусе показывает tune_index --compression none,float16,int8,pca
+FAISS_VECTOR_COMPRESSION = os.getenv('FAISS_VECTOR_COMPRESSION', 'none')
+FAISS_PCA_DIMENSIONS = int(os.getenv('FAISS_PCA_DIMENSIONS', '256'))
+FAISS_RESCORE_FACTOR = int(os.getenv('FAISS_RESCORE_FACTOR', '4'))
+# HNSW коллекции ChromaDB: задается при создании коллекции, после изменения — vector_store --rebuild
+CHROMA_HNSW_M = int(os.getenv('CHROMA_HNSW_M', '16'))
+CHROMA_HNSW_CONSTRUCTION_EF = int(os.getenv('CHROMA_HNSW_CONSTRUCTION_EF', '100'))
+CHROMA_HNSW_SEARCH_EF = int(os.getenv('CHROMA_HNSW_SEARCH_EF', '10'))
+# Точный перебор на NumPy (VECTOR_STORE_BACKEND=numpy): десятки тысяч фрагментов без FAISS и HNSW
+NUMPY_INDEX_PATH = os.getenv('NUMPY_INDEX_PATH', str(BASE_DIR / 'vector_store' / 'numpy'))
+
+# Режим поиска: 'vector' (эмбеддинг запроса), 'lexical' (BM25 по словам, без API) или 'hybrid' —
+# оба поиска параллельно со слиянием (reciprocal rank fusion, константа RRF_K); в гибридном режиме
+# при ошибке или ожидании эмбеддинга дольше HYBRID_EMBEDDING_TIMEOUT секунд отвечает лексический поиск.
+# Лексический индекс строится в памяти каждого процесса при первом поиске (порядка 100 с на миллион
+# фрагментов), поэтому 'lexical' и 'hybrid' включаются явно, с учетом таймаута воркеров
+SEARCH_MODE = os.getenv('SEARCH_MODE', 'vector')
+HYBRID_EMBEDDING_TIMEOUT = float(os.getenv('HYBRID_EMBEDDING_TIMEOUT', '2.0'))
+HYBRID_SEARCH_DEPTH = int(os.getenv('HYBRID_SEARCH_DEPTH', '20'))  # кандидатов из каждого поиска
+RRF_K = int(os.getenv('RRF_K', '60'))
+
+# Кэш результатов поиска в памяти процесса: ключ — нормализованный запрос, k и фильтры,
+# вытеснение по LRU, время жизни записи в секундах; сбрасывается при новом поколении индекса
+QUERY_CACHE_ENABLED = os.getenv('QUERY_CACHE_ENABLED', 'true').lower() == 'true'
+QUERY_CACHE_MAX_ENTRIES = int(os.getenv('QUERY_CACHE_MAX_ENTRIES', '1000'))
+QUERY_CACHE_TTL = int(os.getenv('QUERY_CACHE_TTL', '300'))
+
+# Переранжирование кросс-энкодером на CPU (sentence-transformers, включается явно): поиск берет
+# RERANK_CANDIDATES кандидатов, кросс-энкодер оценивает их одним пакетным проходом и оставляет лучшие.
+# Если проход не укладывается в RERANK_BUDGET_MS, кандидатов становится меньше, а если не помещаются
+# и они — остается порядок поиска. Оценки пар (запрос, фрагмент) кэшируются в памяти процесса
+RERANK_ENABLED = os.getenv('RERANK_ENABLED', 'false').lower() == 'true'
+RERANK_MODEL = os.getenv('RERANK_MODEL', 'cross-encoder/mmarco-mMiniLMv2-L12-H384-v1')
+RERANK_CANDIDATES = int(os.getenv('RERANK_CANDIDATES', '20'))
+RERANK_BUDGET_MS = float(os.getenv('RERANK_BUDGET_MS', '300'))
+RERANK_MAX_LENGTH = int(os.getenv('RERANK_MAX_LENGTH', '512'))  # токенов в паре запрос + фрагмент
+RERANK_CACHE_MAX_ENTRIES = int(os.getenv('RERANK_CACHE_MAX_ENTRIES', '20000'))
+
+# Семантический кэш ответов на первые вопросы диалога (включается явно): ответ на вопрос со сходством
+# эмбеддингов не ниже ANSWER_CACHE_SIMILARITY при той же политике, поколении индекса и модели
+# отдается без вызова модели. Время жизни записи — в секундах; очистка в админке или answer_cache --purge
+ANSWER_CACHE_ENABLED = os.getenv('ANSWER_CACHE_ENABLED', 'false').lower() == 'true'
+ANSWER_CACHE_SIMILARITY = float(os.getenv('ANSWER_CACHE_SIMILARITY', '0.95'))
+ANSWER_CACHE_TTL = int(os.getenv('ANSWER_CACHE_TTL', str(7 * 24 * 3600)))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv('ANSWER_CACHE_MAX_ENTRIES', '5000'))
+ANSWER_CACHE_STREAM_DELAY = float(os.getenv('ANSWER_CACHE_STREAM_DELAY', '0.02'))  # пауза между частями ответа
+
+# Вопрос с номером статьи («статья 81 Трудового кодекса») отвечается текстом статьи из указателя
+# статей без векторного поиска; не больше стольких фрагментов статьи
+ARTICLE_LOOKUP_MAX_CHUNKS = int(os.getenv('ARTICLE_LOOKUP_MAX_CHUNKS', '8'))
+
+# Очередь индексации документов (python manage.py ingest_worker)
+INGEST_LEASE_SECONDS = int(os.getenv('INGEST_LEASE_SECONDS', '900'))
+INGEST_MAX_ATTEMPTS = int(os.getenv('INGEST_MAX_ATTEMPTS', '3'))
+INGEST_RETRY_BACKOFF_SECONDS = int(os.getenv('INGEST_RETRY_BACKOFF_SECONDS', '30'))
+
+# Параллельное извлечение текста из PDF: 0 — по числу ядер, 1 — без пула процессов
+PDF_EXTRACT_WORKERS = int(os.getenv('PDF_EXTRACT_WORKERS', '0'))
+PDF_EXTRACT_PAGES_PER_TASK = int(os.getenv('PDF_EXTRACT_PAGES_PER_TASK', '50'))
+
+# Размер партии фрагментов, которая эмбеддится и записывается за один раз
+INGEST_BATCH_SIZE = int(os.getenv('INGEST_BATCH_SIZE', '64'))
+# Через сколько партий изменения хранилища фиксируются и публикуются для поиска во время
+# обработки документа (0 — только в конце); каждая фиксация — дельта-сегмент и новое поколение индекса
+INGEST_SNAPSHOT_EVERY = int(os.getenv('INGEST_SNAPSHOT_EVERY', '16'))
+
+# Максимум строк в одном INSERT при пакетной записи фрагментов
+CHUNK_WRITE_BATCH_SIZE = int(os.getenv('CHUNK_WRITE_BATCH_SIZE', '500'))
+
+# Кэш эмбеддингов (таблица EmbeddingCacheEntry), вытеснение давно не использованных записей по размеру
+EMBEDDING_CACHE_ENABLED = os.getenv('EMBEDDING_CACHE_ENABLED', 'true').lower() == 'true'
+EMBEDDING_CACHE_MAX_BYTES = int(os.getenv('EMBEDDING_CACHE_MAX_MB', '512')) * 1024 * 1024
+
+# Поставщик эмбеддингов: 'gemini' (API, сеть и квота), 'local' (sentence-transformers на CPU процесса)
+# или 'hashing' (хэшированные символьные n-граммы без сети — только бенчмарки и тесты, включается явно).
+# Векторы поставщиков несовместимы: после смены — python manage.py vector_store --rebuild
+EMBEDDING_PROVIDER = os.getenv('EMBEDDING_PROVIDER', 'gemini')
+# Локальная модель: 'torch' или 'onnx' (ONNX Runtime, sentence-transformers >= 3.2; квантованная int8-модель —
+# EMBEDDING_LOCAL_ONNX_FILE, например onnx/model_qint8_avx2.onnx), динамическое int8-квантование для torch,
+# потоков вывода (0 — по числу ядер) и текстов за проход
+EMBEDDING_LOCAL_MODEL = os.getenv('EMBEDDING_LOCAL_MODEL', 'sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2')
+EMBEDDING_LOCAL_BACKEND = os.getenv('EMBEDDING_LOCAL_BACKEND', 'torch')
+EMBEDDING_LOCAL_ONNX_FILE = os.getenv('EMBEDDING_LOCAL_ONNX_FILE', '')
+EMBEDDING_LOCAL_QUANTIZE = os.getenv('EMBEDDING_LOCAL_QUANTIZE', 'false').lower() == 'true'
+EMBEDDING_LOCAL_THREADS = int(os.getenv('EMBEDDING_LOCAL_THREADS', '0'))
+EMBEDDING_LOCAL_BATCH_SIZE = int(os.getenv('EMBEDDING_LOCAL_BATCH_SIZE', '32'))
+# Размерность векторов 'hashing' (768 — как у text-embedding-004)
+EMBEDDING_HASH_DIMENSIONS = int(os.getenv('EMBEDDING_HASH_DIMENSIONS', '768'))
+
+# Пакетные эмбеддинги (сетевой поставщик): текстов в запросе, параллельных запросов, квота и повторы при 429/5xx
+EMBEDDING_BATCH_SIZE = int(os.getenv('EMBEDDING_BATCH_SIZE', '100'))
+EMBEDDING_MAX_IN_FLIGHT = int(os.getenv('EMBEDDING_MAX_IN_FLIGHT', '4'))
+EMBEDDING_REQUESTS_PER_MINUTE = int(os.getenv('EMBEDDING_REQUESTS_PER_MINUTE', '1500'))
+EMBEDDING_MAX_RETRIES = int(os.getenv('EMBEDDING_MAX_RETRIES', '5'))
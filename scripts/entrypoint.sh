@@ -1,17 +1,61 @@
 #!/usr/bin/env bash
 set -euo pipefail
 
+# Roles:
+#   web (default) - migrations, collectstatic, Gunicorn and, unless INGEST_WORKER=off,
+#                   a supervised ingest_worker next to it (uploads are only queued by the web app)
+#   worker        - ingest_worker only (separate service/job; set INGEST_WORKER=off on the web service)
+ROLE="${1:-web}"
+INGEST_CONCURRENCY="${INGEST_CONCURRENCY:-2}"
+
 # Wait a bit for Cloud SQL socket/GCS mount if needed
 sleep 1
 
+if [ "$ROLE" = "worker" ]; then
+  exec python manage.py ingest_worker --concurrency "$INGEST_CONCURRENCY"
+fi
+
 # Apply database migrations
 python manage.py migrate --noinput
 
 # Collect static files (no-op if using GCS storages)
 python manage.py collectstatic --noinput || true
 
+# Restart the ingestion worker if it exits; stop it on SIGTERM
+supervise_worker() {
+  local worker_pid="" stopping=""
+  trap 'stopping=1; [ -n "$worker_pid" ] && kill -TERM "$worker_pid" 2>/dev/null || true' TERM INT
+  while [ -z "$stopping" ]; do
+    python manage.py ingest_worker --concurrency "$INGEST_CONCURRENCY" &
+    worker_pid=$!
+    wait "$worker_pid" || true
+    # wait returns early when the trap fires; let the worker finish its current job
+    wait "$worker_pid" 2>/dev/null || true
+    if [ -z "$stopping" ]; then
+      echo "ingest_worker exited, restarting in 5s" >&2
+      sleep 5
+    fi
+  done
+}
+
+SUPERVISOR_PID=""
+if [ "${INGEST_WORKER:-embedded}" != "off" ]; then
+  supervise_worker &
+  SUPERVISOR_PID=$!
+fi
+
 # Start Gunicorn
-exec gunicorn legalai.wsgi:application \
+gunicorn legalai.wsgi:application \
   --bind 0.0.0.0:${PORT:-8080} \
   --workers ${WEB_CONCURRENCY:-3} \
-  --timeout 120
+  --timeout 120 &
+WEB_PID=$!
+
+trap 'kill -TERM "$WEB_PID" $SUPERVISOR_PID 2>/dev/null || true' TERM INT
+wait "$WEB_PID" || true
+# Gunicorn exited (or SIGTERM arrived): stop the worker and wait for both
+kill -TERM "$WEB_PID" $SUPERVISOR_PID 2>/dev/null || true
+status=0
+wait "$WEB_PID" 2>/dev/null || status=$?
+[ -n "$SUPERVISOR_PID" ] && wait "$SUPERVISOR_PID" 2>/dev/null || true
+exit "$status"